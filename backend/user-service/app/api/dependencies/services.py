@@ -1,21 +1,41 @@
 from fastapi import Depends
 from sqlalchemy.orm import Session
-from db import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db, get_async_db
 from services.employer_service import EmployerService
 from services.user_service import UserService
 from services.employee_service import EmployeeService
 from services.schedule_service import ScheduleService
+from services.schedule_jobs import ScheduleJobManager, schedule_jobs
+from services.schedule_plan import SchedulePlanService
+from services.schedule_store import ScheduleStore
+from services.schedule_format import ScheduleFormatter
+from services.schedule_export import ScheduleExporter
 
-def get_employer_service(db: Session = Depends(get_db)) -> EmployerService:
+def get_employer_service(db: AsyncSession = Depends(get_async_db)) -> EmployerService:
     return EmployerService(db)
 
 
-def get_user_service(db: Session = Depends(get_db)) -> UserService:
+def get_user_service(db: AsyncSession = Depends(get_async_db)) -> UserService:
     return UserService(db)
 
-def get_employee_service(db: Session = Depends(get_db)) -> EmployeeService:
+def get_employee_service(db: AsyncSession = Depends(get_async_db)) -> EmployeeService:
     return EmployeeService(db)
 
 def get_schedule_service(db: Session = Depends(get_db)) -> ScheduleService:
     return ScheduleService(db)
 
+def get_schedule_job_manager() -> ScheduleJobManager:
+    return schedule_jobs
+
+def get_schedule_plan_service(service: ScheduleService = Depends(get_schedule_service)) -> SchedulePlanService:
+    return SchedulePlanService(service)
+
+def get_schedule_store(db: Session = Depends(get_db)) -> ScheduleStore:
+    return ScheduleStore(db)
+
+def get_schedule_formatter(db: Session = Depends(get_db)) -> ScheduleFormatter:
+    return ScheduleFormatter(db)
+
+def get_schedule_exporter(db: Session = Depends(get_db)) -> ScheduleExporter:
+    return ScheduleExporter(db)
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import get_db
+from db import get_async_db
 from schemas.auth import RegisterRequest, LoginRequest, TokenResponse, PasswordResetRequest, PasswordResetConfirm
 from services.auth import register_user, login_user, generate_password_reset_token, reset_password
-from core.security import get_current_user
+from core.security import get_current_user, invalidate_user, CurrentUser
 from models import User, Employer, Employee
 from services.email_service import send_registration_email, send_password_reset_email
 
@@ -15,10 +16,10 @@ router = APIRouter()
 async def register(
     req: RegisterRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    token = register_user(db, req)
-    new_user = db.query(User).filter(User.email == req.email).first()
+    token = await register_user(db, req)
+    new_user = (await db.execute(select(User).where(User.email == req.email))).scalars().first()
     recipient_email = req.email
     full_name = req.email
     if new_user:
@@ -32,8 +33,8 @@ async def register(
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(req: LoginRequest, db: Session = Depends(get_db)):
-    token = login_user(db, req.email, req.password)
+async def login(req: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    token = await login_user(db, req.email, req.password)
     return {"access_token": token}
 
 
@@ -41,28 +42,30 @@ def login(req: LoginRequest, db: Session = Depends(get_db)):
 async def request_password_reset(
     req: PasswordResetRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    token = generate_password_reset_token(db, req.email)
+    token = await generate_password_reset_token(db, req.email)
     if token:
         background_tasks.add_task(send_password_reset_email, req.email, token)
     return {"message": "If the email exists, password reset instructions were sent."}
 
 
 @router.post("/password/reset/confirm")
-def confirm_password_reset(req: PasswordResetConfirm, db: Session = Depends(get_db)):
-    reset_password(db, req.token, req.new_password, req.new_password_confirm)
+async def confirm_password_reset(req: PasswordResetConfirm, db: AsyncSession = Depends(get_async_db)):
+    await reset_password(db, req.token, req.new_password, req.new_password_confirm)
     return {"message": "Password has been reset."}
 
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
-def delete_me(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_me(current_user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     # re-fetch user in this DB session to avoid cross-session issues
-    user = db.query(User).filter(User.id == current_user.id).first()
+    user = (await db.execute(select(User).where(User.id == current_user.id))).scalars().first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     # delete user and let DB-level ON DELETE cascades / SET NULL do the rest
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    # no row, no token version: every token of the user is rejected from now on
+    invalidate_user(current_user.id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
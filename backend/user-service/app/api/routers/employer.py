@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Depends, status
 from schemas.employer import EmployerCreate, EmployerBase, EmployerUpdate
 from services.employer_service import EmployerService
-from core.security import get_current_user, RoleChecker
-from models import User
+from core.security import get_current_user, RoleChecker, CurrentUser
 from api.dependencies.services import get_employer_service
 
 router = APIRouter(
@@ -10,24 +9,24 @@ router = APIRouter(
 ) 
 
 @router.post("", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(RoleChecker(["owner"]))])
-def create_employer(
+async def create_employer(
     payload: EmployerCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     service: EmployerService = Depends(get_employer_service)
 ):
-    service.create_employer(user=current_user, data=payload)
+    await service.create_employer(user=current_user, data=payload)
 
 @router.get("", status_code=status.HTTP_200_OK, response_model=EmployerBase, dependencies=[Depends(RoleChecker(["owner", "manager"]))])
-def get_employer(
-    current_user: User = Depends(get_current_user),
+async def get_employer(
+    current_user: CurrentUser = Depends(get_current_user),
     service: EmployerService = Depends(get_employer_service)):
-    employer = service.get_employer(current_user)
+    employer = await service.get_employer(current_user)
     return employer
 
 @router.put("", status_code=status.HTTP_200_OK, response_model=EmployerBase, dependencies=[Depends(RoleChecker(["owner"]))])
-def update_employer(
+async def update_employer(
     payload: EmployerUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     service: EmployerService = Depends(get_employer_service)
 ):
-    return service.update_employer(user=current_user, data=payload)
+    return await service.update_employer(user=current_user, data=payload)
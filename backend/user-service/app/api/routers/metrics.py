@@ -0,0 +1,67 @@
+import hmac
+from typing import Dict, Optional
+
+from anyio import to_thread
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from core import metrics
+from core.settings import settings
+from db import engine, async_engine
+from services.schedule_jobs import schedule_jobs
+from services.schedule_service import solve_slots
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_TEXT = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _pool_stats() -> Dict[tuple, float]:
+    values = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        # SQLite may run on pools without size accounting
+        if not hasattr(pool, "checkedout"):
+            continue
+        values[(name, "size")] = pool.size()
+        values[(name, "checked_out")] = pool.checkedout()
+        values[(name, "overflow")] = max(0, pool.overflow())
+    return values
+
+
+def _threadpool_stats() -> Dict[tuple, float]:
+    # the pool running sync endpoints and dependencies
+    limiter = to_thread.current_default_thread_limiter()
+    return {("busy",): limiter.borrowed_tokens, ("limit",): limiter.total_tokens}
+
+
+metrics.registry.register(metrics.CallbackGauge(
+    "db_pool_connections", "Connections of the SQLAlchemy pools.", ("engine", "state"), _pool_stats,
+))
+metrics.registry.register(metrics.CallbackGauge(
+    "threadpool_threads", "Worker threads of the request threadpool.", ("state",), _threadpool_stats,
+))
+metrics.registry.register(metrics.CallbackGauge(
+    "schedule_solves_running", "CP-SAT solves running in this process.", (),
+    lambda: {(): solve_slots.active},
+))
+metrics.registry.register(metrics.CallbackGauge(
+    "schedule_jobs", "Background schedule jobs by status.", ("status",),
+    lambda: {(job_status,): count for job_status, count in schedule_jobs.counts().items()},
+))
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Metrics of this worker process in the Prometheus text format.
+
+    Exposes request paths, per-tenant solve statistics and pool state, so
+    it requires the METRICS_TOKEN bearer token; the router is only mounted
+    when a token is set or METRICS_PUBLIC explicitly opts out of it.
+    """
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        # bytes: compare_digest rejects non-ASCII str, which a client controls
+        if authorization is None or not hmac.compare_digest(authorization.encode(), expected.encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.registry.render(), media_type=PROMETHEUS_TEXT)
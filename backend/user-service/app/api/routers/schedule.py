@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, status
-from schemas.schedule import ScheduleRequest
+import json
+from datetime import date
+from fastapi import APIRouter, Depends, Header, status
+from fastapi.responses import StreamingResponse
+from schemas.schedule import ScheduleRequest, ScheduleJobResponse, SchedulePlanRequest
 from services.schedule_service import ScheduleService
-from core.security import get_current_user, RoleChecker
-from models import User
-from api.dependencies.services import get_schedule_service
+from services.schedule_jobs import ScheduleJobManager
+from services.schedule_plan import SchedulePlanService
+from services.schedule_store import ScheduleStore
+from services.schedule_format import ScheduleFormatter
+from services.schedule_export import ScheduleExporter
+from core.security import get_current_user, RoleChecker, CurrentUser
+from api.dependencies.services import get_schedule_service, get_schedule_job_manager, get_schedule_plan_service, get_schedule_store, get_schedule_formatter, get_schedule_exporter
+from typing import AsyncIterator, List, Optional, Tuple
 
 router = APIRouter(
     prefix="/schedule",
@@ -12,7 +20,162 @@ router = APIRouter(
 @router.post("/generate", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner"]))])
 def create_employer(
     payload: ScheduleRequest,
-    current_user: User = Depends(get_current_user),
+    accept: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    service: ScheduleService = Depends(get_schedule_service),
+    formatter: ScheduleFormatter = Depends(get_schedule_formatter)
+):
+    """
+    Generates the schedule of one month.
+
+    Send `Accept: application/vnd.schedule.compact+json` (or
+    `application/vnd.schedule.compact+msgpack`) for the compact, id-based
+    format; see `services.schedule_format`.
+    """
+    result, state = service.generate_schedule(user=current_user, request=payload)
+    return formatter.respond(result, state, accept)
+
+@router.post("/plan", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner"]))])
+def generate_plan(
+    payload: SchedulePlanRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    service: SchedulePlanService = Depends(get_schedule_plan_service)
+):
+    """
+    Generates several consecutive months (or a 4/6/13-week horizon) at once.
+    Months are solved in parallel in the schedule job pool, then reconciled in
+    order: hour balances are carried into the next month, boundaries repaired.
+    """
+    return service.generate_plan(payload, current_user)
+
+@router.get("/saved", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner", "manager"]))])
+def list_saved_schedules(
+    current_user: CurrentUser = Depends(get_current_user),
+    store: ScheduleStore = Depends(get_schedule_store)
+):
+    return store.list_schedules(current_user.employer_id)
+
+@router.get("/saved/{year}/{month}", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner", "manager"]))])
+def get_saved_schedule(
+    year: int,
+    month: int,
+    accept: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    store: ScheduleStore = Depends(get_schedule_store),
+    formatter: ScheduleFormatter = Depends(get_schedule_formatter)
+):
+    """The last schedule generated for the month, read from the database instead of solved again."""
+    result, state = store.load_schedule(current_user.employer_id, year, month)
+    return formatter.respond(result, state, accept)
+
+@router.get("/employee/{employee_id}/shifts", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner", "manager"]))])
+def get_employee_shifts(
+    employee_id: int,
+    date_from: date,
+    date_to: date,
+    current_user: CurrentUser = Depends(get_current_user),
+    store: ScheduleStore = Depends(get_schedule_store)
+):
+    """Shifts of one employee between two dates (inclusive), across all stored months."""
+    return store.employee_shifts(current_user.employer_id, employee_id, date_from, date_to)
+
+@router.get("/export.csv", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner", "manager"]))])
+def export_schedule_csv(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    exporter: ScheduleExporter = Depends(get_schedule_exporter)
+):
+    """Stored schedules as CSV, one row per worked shift (e.g. for payroll)."""
+    return StreamingResponse(
+        exporter.csv(current_user.employer_id, date_from, date_to),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="schedule.csv"'},
+    )
+
+@router.get("/employee/{employee_id}/shifts.ics", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner", "manager"]))])
+def export_employee_calendar(
+    employee_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    exporter: ScheduleExporter = Depends(get_schedule_exporter)
+):
+    """iCalendar feed of one employee's stored shifts."""
+    return StreamingResponse(
+        exporter.ics(current_user.employer_id, employee_id, date_from, date_to),
+        media_type="text/calendar; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="shifts-{employee_id}.ics"'},
+    )
+
+async def _server_sent_events(events: AsyncIterator[Tuple[str, dict]]):
+    async for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/generate/stream", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner"]))])
+def stream_schedule(
+    payload: ScheduleRequest,
+    include_schedule: bool = False,
+    stop_at_gap: Optional[float] = None,
+    current_user: CurrentUser = Depends(get_current_user),
     service: ScheduleService = Depends(get_schedule_service)
 ):
-    return service.generate_schedule(user=current_user, request=payload)
\ No newline at end of file
+    """
+    Same as /generate, but streams every improving solution as Server-Sent Events.
+
+    Closing the connection stops the solver; `stop_at_gap` stops it on the server
+    side once the relative gap to the best bound is small enough.
+    """
+    employees = service.load_roster(current_user)
+    previous = service.load_previous_state(current_user.employer_id, payload)
+    events = service.stream_schedule(
+        payload,
+        employees,
+        previous,
+        employer_id=current_user.employer_id,
+        include_schedule=include_schedule,
+        stop_at_gap=stop_at_gap,
+    )
+    return StreamingResponse(
+        _server_sent_events(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED, response_model=ScheduleJobResponse, dependencies=[Depends(RoleChecker(["owner"]))])
+def submit_schedule_job(
+    payload: ScheduleRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    service: ScheduleService = Depends(get_schedule_service),
+    jobs: ScheduleJobManager = Depends(get_schedule_job_manager)
+):
+    employees = service.load_roster(current_user)
+    previous = service.load_previous_state(current_user.employer_id, payload)
+    job = jobs.submit(employer_id=current_user.employer_id, request=payload, employees=employees, previous=previous)
+    return job.to_dict()
+
+@router.get("/jobs", status_code=status.HTTP_200_OK, response_model=List[ScheduleJobResponse], dependencies=[Depends(RoleChecker(["owner"]))])
+def list_schedule_jobs(
+    current_user: CurrentUser = Depends(get_current_user),
+    jobs: ScheduleJobManager = Depends(get_schedule_job_manager)
+):
+    return [job.to_dict() for job in jobs.list(current_user.employer_id)]
+
+@router.get("/jobs/{job_id}", status_code=status.HTTP_200_OK, response_model=ScheduleJobResponse, dependencies=[Depends(RoleChecker(["owner"]))])
+def get_schedule_job(
+    job_id: str,
+    current_user: CurrentUser = Depends(get_current_user),
+    jobs: ScheduleJobManager = Depends(get_schedule_job_manager)
+):
+    return jobs.get(job_id, current_user.employer_id).to_dict()
+
+@router.get("/jobs/{job_id}/result", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker(["owner"]))])
+def get_schedule_job_result(
+    job_id: str,
+    accept: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    jobs: ScheduleJobManager = Depends(get_schedule_job_manager),
+    formatter: ScheduleFormatter = Depends(get_schedule_formatter)
+):
+    result, state = jobs.result(job_id, current_user.employer_id)
+    return formatter.respond(result, state, accept)
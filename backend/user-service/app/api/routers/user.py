@@ -2,8 +2,7 @@ from fastapi import APIRouter, Depends, Path, HTTPException
 from sqlalchemy.orm import Session
 from schemas.auth import UserUpdate
 from services.user_service import UserService
-from core.security import get_current_user, RoleChecker
-from models import User
+from core.security import get_current_user, RoleChecker, CurrentUser
 from api.dependencies.services import get_user_service
 
 router = APIRouter(
@@ -12,11 +11,11 @@ router = APIRouter(
 )
 
 @router.get("/users/me", status_code=200)
-def get_current_user_info(
-    current_user: User = Depends(get_current_user),
+async def get_current_user_info(
+    current_user: CurrentUser = Depends(get_current_user),
     service: UserService = Depends(get_user_service)
 ):
-    user = service.get_user(current_user.id)
+    user = await service.get_user(current_user.id)
     return {
         "id": user.id,
         "first_name": user.first_name,
@@ -26,15 +25,17 @@ def get_current_user_info(
     }
 
 @router.put("/users", status_code=200)  # changed from "/me"
-def update_my_user(
+async def update_my_user(
     payload: UserUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     service: UserService = Depends(get_user_service)
 ):
-    user = service.update_user(current_user.id, payload)
+    user, token = await service.update_user(current_user.id, payload)
     return {
         "id": user.id,
         "first_name": user.first_name,
         "last_name": user.last_name,
-        "email": user.email
+        "email": user.email,
+        # a changed email revokes the previous token
+        "access_token": token
     }
@@ -1,13 +1,31 @@
+import atexit
 import logging
+import os
+import queue
 import sys
 import gzip
 import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 import json
-from datetime import datetime
-from typing import Any, Dict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
 
+from core.middleware import RequestIdFilter
+
+try:
+    import orjson
+except ImportError:  # optional, several times faster than json for log records
+    orjson = None
+
+
+def _dumps_json(data: Dict[str, Any]) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode()
+    return json.dumps(data, ensure_ascii=False, default=str)
 
 LOGS_DIR = Path(__file__).parent.parent.parent / "logs"
 LOGS_DIR.mkdir(exist_ok=True)
@@ -18,20 +36,154 @@ def namer(default_name: str) -> str:
     return default_name.replace(".log", "") + ".log"
 
 
+# records waiting for the listener thread; beyond that they are dropped (see QueueingHandler)
+LOG_QUEUE_SIZE = 10000
+# how long an ERROR or worse record may wait for room in a full queue
+ERROR_ENQUEUE_TIMEOUT_SECONDS = 0.05
+
+# gzips rotated files, so a rollover doesn't stall the listener thread
+_compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+_listener: Optional["LogListener"] = None
+
+
+def compress(path: str) -> None:
+    """
+    Gzips a rotated log file next to itself and removes the original.
+
+    Every uvicorn worker and job-pool process compresses leftovers at start,
+    so several may work on the same file: each writes its own temp file and
+    the complete archives replace each other atomically.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{Path(path).name}.", suffix=".gz.tmp", dir=Path(path).parent)
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with open(path, 'rb') as f_in, gzip.open(raw, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        # mkstemp creates the file private to the owner
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, f"{path}.gz")
+        Path(path).unlink(missing_ok=True)
+    except OSError:
+        # compressed (or being removed) by another process; its archive is complete
+        Path(tmp_path).unlink(missing_ok=True)
+
+
 def rotator(source: str, dest: str) -> None:
     """Funkcja kompresująca rotowane pliki logów"""
-    with open(source, 'rb') as f_in:
-        with gzip.open(f"{dest}.gz", 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-    Path(source).unlink()
+    # the rename is all the rollover waits for, gzip runs in the background
+    os.replace(source, dest)
+    _compressor.submit(compress, dest)
+
+
+def compress_leftovers() -> None:
+    """Compresses rotated files left uncompressed by a process that exited mid-way."""
+    for path in LOGS_DIR.glob("*.????-??-??.log"):
+        _compressor.submit(compress, str(path))
+
+
+class QueueingHandler(QueueHandler):
+    """
+    Puts records on a bounded queue for `LogListener`, so the logging
+    thread never waits for file or console I/O.
+
+    When the queue is full, records below ERROR are dropped at once and
+    ERROR or worse wait up to ERROR_ENQUEUE_TIMEOUT_SECONDS. The number of
+    dropped records is logged as a warning once there is room again.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # handled in this process, so the record needs no pickling-safe copy;
+        # only arguments are rendered now, they may change before the listener runs
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if record.levelno >= logging.ERROR:
+                self.queue.put(record, timeout=ERROR_ENQUEUE_TIMEOUT_SECONDS)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            self._report_dropped()
+
+    def _report_dropped(self) -> None:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+        record = logging.LogRecord(
+            "user_service.logging", logging.WARNING, __file__, 0,
+            f"Dropped {dropped} log records, the log queue was full", None, None,
+        )
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped
+
+
+class LogListener(QueueListener):
+    """QueueListener whose stop() waits for room instead of failing on a full queue."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def shutdown_logging() -> None:
+    """Writes out the queued records and finishes pending compression."""
+    _stop_listener()
+    _compressor.shutdown(wait=True)
 
 
 class JSONFormatter(logging.Formatter):
     """Formatter do strukturalnych logów w formacie JSON"""
-    
+
+    # (record attribute, JSON key) of the optional fields, in output order
+    EXTRA_FIELDS = (
+        ("request_id", "request_id"),
+        ("user_id", "user_id"),
+        ("endpoint", "endpoint"),
+        ("method", "method"),
+        ("status_code", "status_code"),
+        ("duration", "duration_ms"),
+    )
+
+    def __init__(self):
+        super().__init__()
+        # records of the same second share the date/time part of the timestamp
+        self._second = None
+        self._second_text = ""
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._second:
+            self._second_text = datetime.fromtimestamp(second, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            self._second = second
+        return f"{self._second_text}.{int((created - second) * 1e6):06d}"
+
     def format(self, record: logging.LogRecord) -> str:
         log_data: Dict[str, Any] = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -39,24 +191,18 @@ class JSONFormatter(logging.Formatter):
             "function": record.funcName,
             "line": record.lineno,
         }
-        
-        if hasattr(record, "request_id"):
-            log_data["request_id"] = record.request_id
-        if hasattr(record, "user_id"):
-            log_data["user_id"] = record.user_id
-        if hasattr(record, "endpoint"):
-            log_data["endpoint"] = record.endpoint
-        if hasattr(record, "method"):
-            log_data["method"] = record.method
-        if hasattr(record, "status_code"):
-            log_data["status_code"] = record.status_code
-        if hasattr(record, "duration"):
-            log_data["duration_ms"] = record.duration
-            
+
+        fields = record.__dict__
+        for attribute, key in self.EXTRA_FIELDS:
+            if attribute in fields:
+                log_data[key] = fields[attribute]
+
         if record.exc_info:
-            log_data["exception"] = self.formatException(record.exc_info)
-            
-        return json.dumps(log_data, ensure_ascii=False)
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            log_data["exception"] = record.exc_text
+
+        return _dumps_json(log_data)
 
 
 class StandardFormatter(logging.Formatter):
@@ -95,9 +241,14 @@ def setup_logging(
     """
     
     
+    global _listener
+    # configured again (e.g. by a CLI entry point): flush the old handlers first
+    _stop_listener()
+
     logger = logging.getLogger("user_service")
     logger.setLevel(getattr(logging, log_level.upper()))
     logger.handlers.clear()
+    handlers = []
     
     
     if log_to_file:
@@ -132,7 +283,7 @@ def setup_logging(
                 )
             )
         file_handler.setLevel(logging.DEBUG)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
     
     
     if log_to_console:
@@ -144,7 +295,7 @@ def setup_logging(
             )
         )
         console_handler.setLevel(logging.INFO)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
     
     
     if log_to_file:
@@ -168,9 +319,21 @@ def setup_logging(
                 '%(message)s\n'
             )
         )
-        logger.addHandler(error_handler)
+        handlers.append(error_handler)
     
     
+    # file and console I/O happen on the listener thread, callers only enqueue
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = QueueingHandler(log_queue)
+    # runs on the calling thread, where the request id is known
+    queue_handler.addFilter(RequestIdFilter())
+    logger.addHandler(queue_handler)
+    _listener = LogListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    if log_to_file:
+        compress_leftovers()
+
     uvicorn_logger = logging.getLogger("uvicorn")
     uvicorn_logger.handlers = logger.handlers
     
@@ -178,6 +341,9 @@ def setup_logging(
     uvicorn_access.handlers = logger.handlers
 
 
+atexit.register(shutdown_logging)
+
+
 def get_logger(name: str) -> logging.Logger:
     """
     Pobiera logger dla określonego modułu
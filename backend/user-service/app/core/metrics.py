@@ -0,0 +1,224 @@
+"""
+In-process metrics, served by /metrics in the Prometheus text format.
+
+Counters and histograms are plain Python objects updated by the request
+middleware and `ScheduleService`; values owned by other components (DB
+pools, the threadpool, running solves) are read through callbacks when
+/metrics is scraped. Every worker process has its own registry, so each
+one is scraped (or summed) separately.
+"""
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# seconds; API requests are mostly milliseconds, schedule generation minutes
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SOLVE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+GAP_BUCKETS = (0.0, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return self.header() + self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+
+
+class CallbackGauge(Metric):
+    """Gauge read when scraped: `callback` returns {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in self.callback().items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: [count per bucket (+Inf last)], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until the response body was sent.", ("method", "route"),
+))
+http_responses = registry.register(Counter(
+    "http_responses_total", "Responses by status code.", ("method", "route", "status"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests being handled right now.",
+))
+
+solve_duration = registry.register(Histogram(
+    "schedule_solve_duration_seconds", "CP-SAT wall time per solve (one per decomposition window).", ("status",),
+    buckets=SOLVE_BUCKETS,
+))
+solve_gap = registry.register(Histogram(
+    "schedule_solve_relative_gap", "Relative gap between objective and best bound of feasible solves.",
+    buckets=GAP_BUCKETS,
+))
+solve_conflicts = registry.register(Counter("schedule_solver_conflicts_total", "CP-SAT conflicts over all solves."))
+solve_branches = registry.register(Counter("schedule_solver_branches_total", "CP-SAT branches over all solves."))
+last_solve = registry.register(Gauge(
+    "schedule_last_solve", "Statistics of the most recent solve.", ("stat",),
+))
+
+LAST_SOLVE_STATS = ("objective", "best_bound", "gap", "variables", "constraints", "conflicts", "branches",
+                    "wall_seconds")
+
+
+def route_label(scope: dict) -> str:
+    """Route template of a handled request (e.g. /schedule/saved/{year}/{month}), bounded cardinality."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path is not None else "unmatched"
+
+
+def observe_request(method: str, route: str, status_code: int, seconds: float) -> None:
+    http_request_duration.observe(seconds, method, route)
+    http_responses.inc(method, route, str(status_code))
+
+
+def observe_solve(stats: dict) -> None:
+    """Records one CP-SAT solve (see `ScheduleService.solve_statistics`)."""
+    solve_duration.observe(stats["wall_seconds"], stats["status"])
+    if stats.get("gap") is not None:
+        solve_gap.observe(stats["gap"])
+    solve_conflicts.inc(amount=stats["conflicts"])
+    solve_branches.inc(amount=stats["branches"])
+    for stat in LAST_SOLVE_STATS:
+        value = stats.get(stat)
+        if value is not None:
+            last_solve.set(value, stat)
+
+
+def observe_worker_solves(result: dict) -> None:
+    """Records the solves behind a result computed in a worker process, whose own registry is never scraped."""
+    for stats in result["meta"].get("solver_stats", []):
+        observe_solve(stats)
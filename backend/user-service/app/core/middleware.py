@@ -1,92 +1,130 @@
+import logging
+import random
 import time
 import uuid
-from typing import Callable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
-import logging
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import metrics
 
 logger = logging.getLogger("user_service.middleware")
 
+# id of the request being handled; copied into threadpool calls and background tasks
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware do logowania wszystkich requestów i responses"""
-    
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-
-        request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
-        
-
-        method = request.method
-        url = str(request.url)
-        client_host = request.client.host if request.client else "unknown"
-        
-
-        start_time = time.time()
-        
-
-        logger.info(
-            f"Request started: {method} {url}",
-            extra={
-                "request_id": request_id,
-                "method": method,
-                "endpoint": url,
-                "client_ip": client_host,
-            }
-        )
-        
+# longest X-Request-ID accepted from a client (or a proxy in front of us)
+MAX_REQUEST_ID_LENGTH = 128
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the id of the current request to every log record (see `setup_logging`)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            request_id = request_id_var.get()
+            if request_id is not None:
+                record.request_id = request_id
+        return True
+
+
+def _incoming_request_id(scope: Scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            if 0 < len(value) <= MAX_REQUEST_ID_LENGTH and value.isascii() and value.decode().isprintable():
+                return value.decode()
+            return None
+    return None
 
-        try:
-            response = await call_next(request)
-            
 
-            duration = (time.time() - start_time) * 1000 
-            
+class LoggingMiddleware:
+    """
+    Middleware do logowania wszystkich requestów i responses.
 
+    Plain ASGI (no `BaseHTTPMiddleware`, so no extra task and response
+    stream per request): assigns the request id (the client's X-Request-ID
+    when it sends a sane one), keeps it in `request_id_var` for the
+    duration of the request and returns it as X-Request-ID.
+
+    Only `sample_rate` of the requests get "started"/"completed" records;
+    5xx responses, failures and requests slower than `slow_request_ms`
+    are always logged. Every request is counted in `core.metrics`.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float = 1.0, slow_request_ms: float = 1000.0):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _incoming_request_id(scope) or str(uuid.uuid4())
+        scope.setdefault("state", {})["request_id"] = request_id  # request.state.request_id
+        token = request_id_var.set(request_id)
+
+        method = scope["method"]
+        path = scope["path"]
+        client = scope.get("client")
+        status_code = 500
+        sampled = logger.isEnabledFor(logging.INFO) and (self.sample_rate >= 1.0 or random.random() < self.sample_rate)
+        start_time = time.perf_counter()
+        metrics.http_requests_in_flight.inc()
+
+        if sampled:
             logger.info(
-                f"Request completed: {method} {url} - Status: {response.status_code}",
+                f"Request started: {method} {path}",
                 extra={
-                    "request_id": request_id,
                     "method": method,
-                    "endpoint": url,
-                    "status_code": response.status_code,
-                    "duration": round(duration, 2),
+                    "endpoint": path,
+                    "client_ip": client[0] if client else "unknown",
                 }
             )
-            
 
-            response.headers["X-Request-ID"] = request_id
-            
-            return response
-            
+        async def send_with_request_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
         except Exception as e:
-            duration = (time.time() - start_time) * 1000
+            duration = (time.perf_counter() - start_time) * 1000
+            metrics.observe_request(method, metrics.route_label(scope), 500, duration / 1000)
             logger.error(
-                f"Request failed: {method} {url} - Error: {str(e)}",
+                f"Request failed: {method} {path} - Error: {str(e)}",
                 extra={
-                    "request_id": request_id,
                     "method": method,
-                    "endpoint": url,
+                    "endpoint": path,
                     "duration": round(duration, 2),
                 },
                 exc_info=True
             )
             raise
-
-
-class RequestContextMiddleware(BaseHTTPMiddleware):
-    """Middleware do dodawania kontekstu requesta do logów"""
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        
-        request_id = getattr(request.state, "request_id", None)
-        
-        if request_id:
-            pass
-        
-        response = await call_next(request)
-        return response
+        else:
+            # measured until the body is sent, streamed responses included
+            duration = (time.perf_counter() - start_time) * 1000
+            metrics.observe_request(method, metrics.route_label(scope), status_code, duration / 1000)
+            if sampled or status_code >= 500 or duration >= self.slow_request_ms:
+                logger.info(
+                    f"Request completed: {method} {path} - Status: {status_code}",
+                    extra={
+                        "method": method,
+                        "endpoint": path,
+                        "status_code": status_code,
+                        "duration": round(duration, 2),
+                    }
+                )
+        finally:
+            metrics.http_requests_in_flight.dec()
+            request_id_var.reset(token)
@@ -1,7 +1,8 @@
 from fastapi import Depends, HTTPException, status
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
-from db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 from models.User import User
 import os
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -9,37 +10,180 @@ import hmac
 import hashlib
 import base64
 import json
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+from core.settings import settings
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "super-secret-change-me")
 ALGORITHM = "HS256"
 bearer_scheme = HTTPBearer()
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme), db: Session = Depends(get_db)):
+class CurrentUser:
+    """
+    The authenticated user as seen by route handlers: only what authorization
+    needs, no ORM instance. Load the `User` row explicitly to change it.
+    """
+
+    __slots__ = ("id", "email", "role", "employer_id", "token_version")
+
+    def __init__(self, id: int, email: Optional[str], role: str, employer_id: Optional[int], token_version: int):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.employer_id = employer_id
+        self.token_version = token_version
+
+
+class TTLCache:
+    """Small thread-safe LRU whose entries expire after `ttl_seconds` (or an explicit deadline)."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, expires_in: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if expires_in is None else min(self.ttl_seconds, expires_in)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# token -> verified claims: repeated requests skip the HMAC and JSON decoding
+verified_tokens = TTLCache(settings.auth_cache_max_entries, settings.auth_cache_ttl_seconds)
+# user id -> (token_version, role, employer_id), the only part of auth that needs the database
+user_states = TTLCache(settings.auth_cache_max_entries, settings.auth_cache_ttl_seconds)
+
+
+def verify_access_token(token: str) -> Optional[dict]:
+    """Verifies the HS256 signature and expiry in-process; returns the claims or None."""
+    claims = verified_tokens.get(token)
+    if claims is not None:
+        return claims
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        pad = lambda segment: segment + "=" * (-len(segment) % 4)
+        expected = hmac.new(SECRET_KEY.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(pad(signature_b64))):
+            return None
+        claims = json.loads(base64.urlsafe_b64decode(pad(payload_b64)))
+        exp = int(claims["exp"])
+    except Exception:
+        return None
+    # reset tokens are signed with the same key but must not authenticate
+    if claims.get("type") is not None:
+        return None
+    expires_in = exp - time.time()
+    if expires_in <= 0:
+        return None
+    verified_tokens.set(token, claims, expires_in)
+    return claims
+
+
+async def load_user_state(db: AsyncSession, user_id: int) -> Optional[tuple]:
+    state = user_states.get(user_id)
+    if state is None:
+        result = await db.execute(select(User.token_version, User.role, User.employer_id).where(User.id == user_id))
+        row = result.first()
+        if row is None:
+            return None
+        state = tuple(row)
+        user_states.set(user_id, state)
+    return state
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Drops the cached auth state of a user, so this process sees a bumped
+    token version, new role or employer at once (other processes within
+    `auth_cache_ttl_seconds`).
+    """
+    user_states.delete(user_id)
+
+
+def revoke_tokens(user: User) -> None:
+    """Invalidates every token issued to `user` so far (the caller commits)."""
+    user.token_version = (user.token_version or 0) + 1
+
+
+def create_access_token(user: User, expires_days: int = 7) -> str:
+    # role is informational for clients (it always was part of the token); authorization reads
+    # role and employer from `user_states`, see get_current_user
+    exp = int((datetime.utcnow() + timedelta(days=expires_days)).timestamp())
+    payload = {
+        "id": str(user.id),
+        "email": user.email,
+        "role": user.role,
+        "ver": user.token_version or 0,
+        "exp": exp,
+    }
+    return create_jwt(payload)
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+                           db: AsyncSession = Depends(get_async_db)) -> CurrentUser:
+    """
+    Authenticates the request without a database query in the common case:
+    the token is verified in-process (and cached), and only the user's
+    token version / role / employer is looked up, through `user_states`.
+
+    Role and employer come from that state, not from the token: the owner
+    keeps the token issued at registration after creating the employer, and
+    a role change must apply to tokens already issued.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    claims = verify_access_token(credentials.credentials)
+    if claims is None or claims.get("id") is None:
+        raise credentials_exception
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("id") # type: ignore
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+        user_id = int(claims["id"])
+    except (TypeError, ValueError):
+        raise credentials_exception
+
+    state = await load_user_state(db, user_id)
+    if state is None:
         raise credentials_exception
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+    token_version, role, employer_id = state
+    # tokens issued before versioning count as version 0
+    if claims.get("ver", 0) != token_version:
         raise credentials_exception
-    return user
+    return CurrentUser(user_id, claims.get("email"), role, employer_id, token_version)
 
 class RoleChecker:
     def __init__(self, allowed_roles: list[str]):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, user: User = Depends(get_current_user)):
+    def __call__(self, user: CurrentUser = Depends(get_current_user)):
         if user.role not in self.allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -1,3 +1,6 @@
+import tempfile
+from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -6,4 +9,55 @@ class Settings(BaseSettings):
     database_url: str
     cors_origin: str
 
+    # async engine of the CRUD routers; derived from database_url when not set
+    async_database_url: Optional[str] = None
+    # connection pools (per engine and process)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+
+    # share of requests with "started"/"completed" log records; slow (>= the
+    # threshold), failed and 5xx requests are always logged
+    request_log_sample_rate: float = 1.0
+    slow_request_log_ms: float = 1000.0
+
+    # /metrics (Prometheus): scrapes must send metrics_token as a bearer token, and the endpoint is
+    # only served once a token is set. metrics_public=True serves it without one, for deployments
+    # where the port is reachable only from the internal network
+    metrics_enabled: bool = True
+    metrics_token: Optional[str] = None
+    metrics_public: bool = False
+
+    # verified tokens and per-user auth state kept in memory; a revoked token
+    # may still work on other workers for up to the TTL
+    auth_cache_ttl_seconds: float = 30.0
+    auth_cache_max_entries: int = 10000
+
+    # schedule generation jobs (process pool)
+    schedule_job_workers: int = 2
+    schedule_job_max_pending: int = 50
+    schedule_job_ttl_seconds: int = 3600
+
+    # multi-month plans: time limit of the rebalance/repair solves that follow the parallel solve
+    schedule_plan_fix_time_limit_seconds: float = 10.0
+
+    # cache of generated schedules shared by all workers (SQLite file, outside the source tree)
+    schedule_cache_enabled: bool = True
+    schedule_cache_path: str = str(Path(tempfile.gettempdir()) / "user-service" / "schedules.sqlite3")
+    schedule_cache_ttl_seconds: int = 7 * 24 * 3600
+    schedule_cache_max_entries: int = 2000
+
+    # CP-SAT budget; requests may ask for less, never for more
+    schedule_solver_time_limit_seconds: float = 300.0
+    schedule_solver_max_workers: int = 8
+    schedule_solver_min_workers: int = 2
+    schedule_solver_relative_gap: float = 0.0
+
+    # captures of the built models (see services.schedule_capture), off when no directory is set;
+    # only solves taking at least the given time are written
+    schedule_model_dump_dir: Optional[str] = None
+    schedule_model_dump_min_seconds: float = 0.0
+
 settings = Settings()
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from core.settings import settings
@@ -6,15 +8,83 @@ from core.settings import settings
 
 URL_DATABASE = f'{settings.database_url}'
 
-engine = create_engine(URL_DATABASE)
+# async drivers of the sync URLs (postgresql -> asyncpg, sqlite -> aiosqlite)
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    if settings.async_database_url:
+        return settings.async_database_url
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for '{backend}', set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def pool_options(url: str) -> dict:
+    options = {
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+    }
+    # SQLite uses its own pools, sized by SQLAlchemy
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+        )
+    return options
+
+
+engine = create_engine(URL_DATABASE, **pool_options(URL_DATABASE))
 
 SessionLocal = sessionmaker(autocommit = False, autoflush = False, bind = engine)
 
+ASYNC_URL_DATABASE = async_database_url(URL_DATABASE)
+
+# CRUD routers (auth, users, employers, employees) run on the event loop;
+# schedule generation keeps the sync engine, it runs in threads and processes
+async_engine = create_async_engine(ASYNC_URL_DATABASE, **pool_options(ASYNC_URL_DATABASE))
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+# The schema is managed by Base.metadata.create_all, which only creates missing tables (there are
+# no migrations); columns added to existing tables after their first release are listed here and
+# added by add_missing_columns at startup.
+ADDED_COLUMNS = [
+    ("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("schedules", "request", "TEXT"),
+    ("schedules", "source", "VARCHAR NOT NULL DEFAULT 'owner'"),
+]
+
+
+def add_missing_columns(bind) -> list:
+    """
+    Adds the `ADDED_COLUMNS` an existing database lacks; safe to run on every
+    start. Returns the DDL statements it executed, for the startup log.
+    """
+    added = []
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if not inspector.has_table(table):
+                continue
+            if column not in {c["name"] for c in inspector.get_columns(table)}:
+                statement = f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"
+                conn.execute(text(statement))
+                added.append(statement)
+    return added
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
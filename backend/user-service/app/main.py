@@ -1,12 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from db import engine, Base
+from db import engine, async_engine, Base, add_missing_columns
 import logging
+from datetime import date
 
-from api.routers import employer, auth, employee, user, schedule
+from api.routers import employer, auth, employee, user, schedule, metrics
 from core.logging_config import setup_logging, get_logger
-from core.middleware import LoggingMiddleware, RequestContextMiddleware
+from core.middleware import LoggingMiddleware
 from core.settings import settings
+from services.schedule_jobs import schedule_jobs
+from services.working_calendar import working_calendar
 
 #
 setup_logging(
@@ -22,8 +25,11 @@ app = FastAPI(title="User Service API")
 
 logger.info("Starting User Service API...")
 
-app.add_middleware(LoggingMiddleware)
-app.add_middleware(RequestContextMiddleware)
+app.add_middleware(
+    LoggingMiddleware,
+    sample_rate=settings.request_log_sample_rate,
+    slow_request_ms=settings.slow_request_log_ms,
+)
 
 # Konfiguracja CORS
 app.add_middleware(
@@ -37,6 +43,8 @@ app.add_middleware(
 logger.info("Middleware configured")
 
 Base.metadata.create_all(bind=engine)
+for statement in add_missing_columns(engine):
+    logger.warning(f"Database schema upgraded: {statement}")
 logger.info("Database tables created/verified")
 
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -44,8 +52,30 @@ app.include_router(employer.router)
 app.include_router(user.router)
 app.include_router(employee.router)
 app.include_router(schedule.router)
+if settings.metrics_enabled and (settings.metrics_token or settings.metrics_public):
+    app.include_router(metrics.router)
+elif settings.metrics_enabled:
+    logger.warning("/metrics not served: set METRICS_TOKEN (or METRICS_PUBLIC=true on an internal network)")
 
 logger.info("All routers registered")
 logger.info("User Service API ready to accept requests")
-app.include_router(schedule.router)
+
+
+@app.on_event("startup")
+def warm_working_calendar():
+    # schedules are planned around the current year
+    year = date.today().year
+    working_calendar.precompute(year - 1, year + 2)
+
+
+@app.on_event("shutdown")
+def shutdown_schedule_jobs():
+    schedule_jobs.shutdown()
+    logger.info("Schedule job pool stopped")
+
+
+@app.on_event("shutdown")
+async def close_database_connections():
+    # pooled async connections (and aiosqlite's worker threads) outlive the app otherwise
+    await async_engine.dispose()
 
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Text, DateTime, Index
+from sqlalchemy.sql import func
+from db import Base
+
+
+class Schedule(Base):
+    """
+    A generated month. Shifts, days and employee ids are kept as JSON (they
+    are small); the assignment itself lives in `schedule_assignments`.
+    """
+    __tablename__ = "schedules"
+    id = Column(Integer, primary_key=True, index=True)
+    employer_id = Column(Integer, ForeignKey("employers.id", ondelete="CASCADE"), nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    request_hash = Column(String(64), nullable=False)  # schedule cache key of the solved request
+    status = Column(String, nullable=False)  # solver status, e.g. OPTIMAL / FEASIBLE
+    objective = Column(Float, nullable=True)
+    shifts = Column(Text, nullable=False)
+    days = Column(Text, nullable=False)
+    employee_ids = Column(Text, nullable=False)
+    summary = Column(Text, nullable=False)
+    meta = Column(Text, nullable=False)
+    source = Column(String, nullable=False, default="owner", server_default="owner")  # owner / batch (a draft)
+    request = Column(Text, nullable=True)  # request template (JSON) of the schedule, see schedule_cache.request_template
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    # one (latest) schedule per employer and month
+    __table_args__ = (
+        Index("ix_schedules_employer_month", "employer_id", "year", "month", unique=True),
+    )
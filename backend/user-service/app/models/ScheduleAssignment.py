@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, SmallInteger, ForeignKey, Date, Index
+from db import Base
+
+
+class ScheduleAssignment(Base):
+    """One worked shift: employee `employee_id` works shift `shift` (index into `Schedule.shifts`) on `day`."""
+    __tablename__ = "schedule_assignments"
+    schedule_id = Column(Integer, ForeignKey("schedules.id", ondelete="CASCADE"), primary_key=True)
+    employee_id = Column(Integer, ForeignKey("employees.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    shift = Column(SmallInteger, nullable=False)
+
+    # "shifts of one employee between two dates"
+    __table_args__ = (
+        Index("ix_schedule_assignments_employee_day", "employee_id", "day"),
+    )
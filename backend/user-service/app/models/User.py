@@ -13,5 +13,6 @@ class User(Base):
     password = Column(String, nullable=False)
     role = Column(String, nullable=False)  # owner / manager / platform_admin
     employer_id = Column(Integer, ForeignKey("employers.id", ondelete="SET NULL"), nullable=True)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # bumped to revoke all tokens
 
     employer = relationship("Employer", back_populates="users", foreign_keys=[employer_id], passive_deletes=True)
\ No newline at end of file
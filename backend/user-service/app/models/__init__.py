@@ -1,3 +1,5 @@
 from .Employee import Employee
 from .Employer import Employer
-from .User import User
\ No newline at end of file
+from .User import User
+from .Schedule import Schedule
+from .ScheduleAssignment import ScheduleAssignment
\ No newline at end of file
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from datetime import date, datetime
+from pydantic import BaseModel, validator
 from typing import List, Optional, Literal
 
 
@@ -26,6 +27,48 @@ class Rules(BaseModel):
     max_consecutive_days: Optional[int] = None
 
 
+class Decomposition(BaseModel):
+    window_days: int = 7   # scheduled days fixed by every window
+    overlap_days: int = 2  # look-ahead days solved with the window, re-solved by the next one
+
+    @validator("window_days")
+    def validate_window_days(cls, v):
+        if v < 1:
+            raise ValueError("Window must cover at least one day")
+        return v
+
+    @validator("overlap_days")
+    def validate_overlap_days(cls, v):
+        if v < 0:
+            raise ValueError("Overlap can't be negative")
+        return v
+
+
+class SolverBudget(BaseModel):
+    time_limit_seconds: Optional[float] = None  # capped by the server limit
+    workers: Optional[int] = None               # None = scale to free cores
+    relative_gap: Optional[float] = None        # stop once (objective - bound) / objective <= gap
+    first_solution: bool = False                # stop at the first feasible schedule
+
+    @validator("time_limit_seconds")
+    def validate_time_limit(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Time limit must be positive")
+        return v
+
+    @validator("workers")
+    def validate_workers(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("At least one worker is required")
+        return v
+
+    @validator("relative_gap")
+    def validate_relative_gap(cls, v):
+        if v is not None and not (0 <= v <= 1):
+            raise ValueError("Relative gap must be between 0 and 1")
+        return v
+
+
 class ScheduleRequest(BaseModel):
     year: int
     month: int
@@ -34,6 +77,53 @@ class ScheduleRequest(BaseModel):
     holidays_mode: bool
     company_work_mode: Literal["every_day", "mon_fri", "mon_sat"] 
     preferences: Optional[List[PreferenceDefinition]] = None
+    warm_start: bool = True  # reuse previous month's schedule (hints + boundary rules)
+    decomposition: Optional[Decomposition] = None  # solve in rolling windows instead of one model
+    solver: Optional[SolverBudget] = None
+
+class PlanPreference(BaseModel):
+    employee_id: int
+    day: date
+    priority: int
+
+
+class SchedulePlanRequest(BaseModel):
+    """
+    Several months at once: either `months` calendar months from the start
+    month, or a custom horizon of `weeks` weeks from `start_day`.
+    """
+    start_year: int
+    start_month: int
+    start_day: int = 1
+    months: Optional[int] = None
+    weeks: Optional[Literal[4, 6, 13]] = None
+    shifts: List[ShiftDefinition]
+    rules: Rules
+    holidays_mode: bool
+    company_work_mode: Literal["every_day", "mon_fri", "mon_sat"]
+    preferences: Optional[List[PlanPreference]] = None
+    warm_start: bool = True  # start from the stored month preceding the plan
+    decomposition: Optional[Decomposition] = None
+    solver: Optional[SolverBudget] = None  # per month
+
+    @validator("start_month")
+    def validate_start_month(cls, v):
+        if not (1 <= v <= 12):
+            raise ValueError("Month must be between 1 and 12")
+        return v
+
+    @validator("months")
+    def validate_months(cls, v):
+        if v is not None and not (1 <= v <= 24):
+            raise ValueError("A plan covers 1 to 24 months")
+        return v
+
+    @validator("weeks", always=True)
+    def validate_horizon(cls, v, values):
+        if (v is None) == (values.get("months") is None):
+            raise ValueError("Give either months or weeks")
+        return v
+
 
 class OneShift(BaseModel):
     shift: str
@@ -53,3 +143,13 @@ class ScheduleResponse(BaseModel):
     schedule: List[AssignedShift]
     summary: dict
     meta: ScheduleMeta
+
+
+class ScheduleJobResponse(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "storing", "done", "failed"]
+    year: int
+    month: int
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
@@ -1,22 +1,27 @@
-from datetime import datetime, timedelta
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.User import User
 from schemas.auth import RegisterRequest
-from core.security import hash_password, create_jwt, verify_password, create_reset_token, verify_reset_token
+from core.security import (hash_password, verify_password, create_reset_token, verify_reset_token,
+                           create_access_token, revoke_tokens, invalidate_user)
 from core.logging_config import get_logger
 
 logger = get_logger(__name__)
 
-def register_user(db: Session, req: RegisterRequest) -> str:
+async def _find_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+async def register_user(db: AsyncSession, req: RegisterRequest) -> str:
     logger.info(f"Registration attempt for email: {req.email}")
     
     if req.password != req.password_confirm:
         logger.warning(f"Password mismatch during registration for email: {req.email}")
         raise HTTPException(status_code=400, detail="Passwords do not match")
 
-    existing = db.query(User).filter(User.email == req.email).first()
+    existing = await _find_by_email(db, req.email)
     if existing:
         logger.warning(f"Registration failed - email already exists: {req.email}")
         raise HTTPException(status_code=400, detail="User with this email already exists")
@@ -31,20 +36,17 @@ def register_user(db: Session, req: RegisterRequest) -> str:
         employer_id=None
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     logger.info(f"User registered successfully - ID: {user.id}, Email: {user.email}, Role: {user.role}")
 
-    exp = int((datetime.utcnow() + timedelta(days=7)).timestamp())
-    payload = {"id": str(user.id), "email": user.email, "role": user.role, "exp": exp}
-    token = create_jwt(payload)
-    return token
+    return create_access_token(user)
 
-def login_user(db: Session, email: str, password: str) -> str:
+async def login_user(db: AsyncSession, email: str, password: str) -> str:
     logger.info(f"Login attempt for email: {email}")
     
-    user = db.query(User).filter(User.email == email).first()
+    user = await _find_by_email(db, email)
     if not user:
         logger.warning(f"Login failed - user not found: {email}")
         raise HTTPException(status_code=400, detail="Invalid email or password")
@@ -55,23 +57,24 @@ def login_user(db: Session, email: str, password: str) -> str:
 
     logger.info(f"User logged in successfully - ID: {user.id}, Email: {user.email}")
 
-    exp = int((datetime.utcnow() + timedelta(days=7)).timestamp())
-    payload = {"id": str(user.id), "email": user.email, "role": user.role, "exp": exp}
-    token = create_jwt(payload)
-    return token
+    return create_access_token(user)
 
-def generate_password_reset_token(db: Session, email: str) -> str | None:
-    user = db.query(User).filter(User.email == email).first()
+async def generate_password_reset_token(db: AsyncSession, email: str) -> str | None:
+    user = await _find_by_email(db, email)
     if not user:
         return None
     return create_reset_token(user.id) # type: ignore
 
-def reset_password(db: Session, token: str, new_password: str, new_password_confirm: str) -> None:
+async def reset_password(db: AsyncSession, token: str, new_password: str, new_password_confirm: str) -> None:
     if new_password != new_password_confirm:
         raise HTTPException(status_code=400, detail="Passwords do not match")
     user_id = verify_reset_token(token)
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user.password = hash_password(new_password) # type: ignore
-    db.commit()
+    # sessions opened with the old password end here
+    revoke_tokens(user)
+    await db.commit()
+    invalidate_user(user.id)
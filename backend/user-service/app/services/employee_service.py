@@ -1,13 +1,24 @@
-from sqlalchemy.orm import Session
+import anyio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 import models
 from schemas.employee import EmployeeCreate, EmployeeBase, EmployeeUpdate, EmployeeDelete
+from services.schedule_cache import schedule_cache
 
 class EmployeeService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def create_employee(self, user: models.User, data: EmployeeCreate):       
+    async def _invalidate_schedules(self, employer_id: int) -> None:
+        # the schedule cache is SQLite, keep its I/O off the event loop
+        await anyio.to_thread.run_sync(schedule_cache.invalidate_employer, employer_id)
+
+    async def _get(self, employee_id: int):
+        result = await self.db.execute(select(models.Employee).where(models.Employee.id == employee_id))
+        return result.scalars().first()
+
+    async def create_employee(self, user: models.User, data: EmployeeCreate):       
         employee = models.Employee(
             first_name=data.first_name,
             last_name=data.last_name,
@@ -16,11 +27,13 @@ class EmployeeService:
             employer_id=user.employer_id
         )
         self.db.add(employee)
-        self.db.commit()
+        await self.db.commit()
+        await self._invalidate_schedules(user.employer_id)
 
     # show all employees from current user
-    def get_employee(self, user: models.User):
-        employees = self.db.query(models.Employee).filter(models.Employee.employer_id == user.employer_id).all()
+    async def get_employee(self, user: models.User):
+        result = await self.db.execute(select(models.Employee).where(models.Employee.employer_id == user.employer_id))
+        employees = result.scalars().all()
         if not employees:
             raise HTTPException(status_code=404, detail='Employees is not found for the given user')
         
@@ -36,8 +49,8 @@ class EmployeeService:
             for e in employees
         ]
 
-    def update_employee(self, user: models.User, data: EmployeeUpdate):
-        employee = self.db.query(models.Employee).filter(models.Employee.id == data.id).first()
+    async def update_employee(self, user: models.User, data: EmployeeUpdate):
+        employee = await self._get(data.id)
         if not employee:
             raise HTTPException(status_code=404, detail='Employee is not found by the given id')
         if employee.employer_id != user.employer_id:
@@ -57,8 +70,9 @@ class EmployeeService:
             updated = True
         if not updated:
             raise HTTPException(status_code=400, detail='No fields to update')
-        self.db.commit()
-        self.db.refresh(employee)
+        await self.db.commit()
+        await self.db.refresh(employee)
+        await self._invalidate_schedules(employee.employer_id)
         return EmployeeBase(id=employee.id,
             first_name=employee.first_name, 
             last_name=employee.last_name, 
@@ -66,12 +80,13 @@ class EmployeeService:
             employment_fraction=employee.employment_fraction, 
             employer_id=user.employer_id)
 
-    def delete_employee(self, user: models.User, data: EmployeeDelete):
-        employee = self.db.query(models.Employee).filter(models.Employee.id == data.id).first()
+    async def delete_employee(self, user: models.User, data: EmployeeDelete):
+        employee = await self._get(data.id)
         if not employee:
             raise HTTPException(status_code=404, detail='Employee is not found by the given id')
         if employee.employer_id != user.employer_id:
             raise HTTPException(status_code=403, detail='Only owner can update employee')
-        self.db.delete(employee)
-        self.db.commit()
+        await self.db.delete(employee)
+        await self.db.commit()
+        await self._invalidate_schedules(user.employer_id)
         return {"message": "delete successfully"}
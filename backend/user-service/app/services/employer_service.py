@@ -1,13 +1,19 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 import models
 from schemas.employer import EmployerCreate, EmployerBase, EmployerUpdate
+from core.security import invalidate_user
 
 class EmployerService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def create_employer(self, user: models.User, data: EmployerCreate):       
+    async def _get_employer(self, employer_id: int):
+        result = await self.db.execute(select(models.Employer).where(models.Employer.id == employer_id))
+        return result.scalars().first()
+
+    async def create_employer(self, user: models.User, data: EmployerCreate):       
         if user.employer_id is not None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already belongs to an employer")
         if user.role != "owner":
@@ -15,31 +21,36 @@ class EmployerService:
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Only owners can create employers",
             )
+        # `user` is the authenticated snapshot, the row is changed through this session
+        owner = (await self.db.execute(select(models.User).where(models.User.id == user.id))).scalars().first()
+        if owner is None:
+            raise HTTPException(status_code=404, detail="User not found")
         employer = models.Employer(
             name=data.name,
             address=data.address,
-            owner_id=user.id
+            owner_id=owner.id
         )
         self.db.add(employer)
-        self.db.flush()  # get id employer (without commit)
+        await self.db.flush()  # get id employer (without commit)
         #owner.employer_id -> employer.id
-        user.employer_id = employer.id
-        self.db.commit()
+        owner.employer_id = employer.id
+        await self.db.commit()
+        invalidate_user(owner.id)
 
-    def get_employer(self, user: models.User):
-        employer = self.db.query(models.Employer).filter(models.Employer.id == user.employer_id).first()
+    async def get_employer(self, user: models.User):
+        employer = await self._get_employer(user.employer_id)
         if not employer:
             raise HTTPException(status_code=404, detail='Employer is not found for the given user')
         
         return EmployerBase(name=employer.name, address=employer.address)
 
-    def update_employer(self, user: models.User, data: EmployerUpdate):
+    async def update_employer(self, user: models.User, data: EmployerUpdate):
         if user.role != "owner":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Only owners can create employers",
             )
-        employer = self.db.query(models.Employer).filter(models.Employer.id == user.employer_id).first()
+        employer = await self._get_employer(user.employer_id)
         if not employer:
             raise HTTPException(status_code=404, detail='Employer not found')
         if employer.owner_id != user.id:
@@ -53,6 +64,6 @@ class EmployerService:
             updated = True
         if not updated:
             raise HTTPException(status_code=400, detail='No fields to update')
-        self.db.commit()
-        self.db.refresh(employer)
+        await self.db.commit()
+        await self.db.refresh(employer)
         return EmployerBase(name=employer.name, address=employer.address)
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""
+Nightly generation of the next month's draft schedule for every employer.
+
+Every employer is solved from its request template (the last request that
+produced a schedule, see `ScheduleCache.save_request_template`, or else the
+one stored with its latest schedule, `Schedule.request`) or from
+--template. Results go to the schedule cache, the month state store and
+the schedules table, exactly as if the owner had generated them. Progress
+is checkpointed after every tenant, so an interrupted run continues with
+--resume. Tenants whose request, roster and previous month are unchanged
+since their last solve are found in the cache and skipped.
+
+Batch output is a draft (`Schedule.source == "batch"`): an employer that
+already has a schedule of its own for the month is left alone ("exists"),
+and a draft never replaces one the owner generates in the meantime.
+
+Usage (from backend/user-service/app):
+    python -m services.schedule_batch
+    python -m services.schedule_batch --year 2025 --month 7 --processes 4 --template default.json
+    python -m services.schedule_batch --resume
+    python -m services.schedule_batch --daily-at 02:00
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.logging_config import get_logger, setup_logging
+from db import SessionLocal
+import models
+from schemas.schedule import ScheduleRequest, SolverBudget
+from services.schedule_cache import schedule_cache, schedule_cache_key
+from services.schedule_jobs import ScheduleJobError, init_schedule_worker, run_schedule_job
+from services.schedule_service import ScheduleService
+from services.schedule_store import ScheduleStore, store_schedule
+
+logger = get_logger(__name__)
+
+BATCH_DIR = Path(__file__).parent.parent.parent / "batch"
+# outcomes that are not retried when a run is resumed
+FINAL_OUTCOMES = {"solved", "cached", "exists"}
+
+
+def run_batch_tenant(request_data: dict, roster_data: List[dict], previous: Optional[dict]) -> Tuple[dict, dict, float]:
+    """Worker entry point: `run_schedule_job` plus the time spent solving."""
+    started = time.perf_counter()
+    result, state = run_schedule_job(request_data, roster_data, previous)
+    return result, state, time.perf_counter() - started
+
+
+def next_month(today: Optional[date] = None) -> Tuple[int, int]:
+    today = today or date.today()
+    return (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+
+
+class BatchCheckpoint:
+    """
+    Outcome of every processed tenant of one run, rewritten atomically
+    after each tenant.
+    """
+
+    def __init__(self, path: Path, year: int, month: int):
+        self.path = path
+        self.year = year
+        self.month = month
+        self.started_at = datetime.utcnow().isoformat()
+        self.tenants: Dict[int, dict] = {}
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        data = json.loads(self.path.read_text())
+        if (data["year"], data["month"]) != (self.year, self.month):
+            return
+        self.started_at = data["started_at"]
+        self.tenants = {int(employer_id): outcome for employer_id, outcome in data["tenants"].items()}
+
+    def done(self, employer_id: int) -> bool:
+        outcome = self.tenants.get(employer_id)
+        return outcome is not None and outcome["status"] in FINAL_OUTCOMES
+
+    def record(self, employer_id: int, status: str, seconds: Optional[float] = None,
+               error: Optional[str] = None) -> None:
+        self.tenants[employer_id] = {"status": status, "seconds": seconds, "error": error}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({
+            "year": self.year,
+            "month": self.month,
+            "started_at": self.started_at,
+            "tenants": self.tenants,
+        }))
+        os.replace(tmp_path, self.path)
+
+
+class ScheduleBatchRunner:
+    """
+    Solves one month for all employers in a process pool.
+
+    The time limit of a tenant grows with its roster:
+    min(max_time_limit, min_time_limit + time_per_employee * employees).
+    """
+
+    def __init__(self, processes: int, min_time_limit: float, max_time_limit: float, time_per_employee: float,
+                 template: Optional[dict] = None, output_dir: Path = BATCH_DIR):
+        self.processes = processes
+        self.min_time_limit = min_time_limit
+        self.max_time_limit = max_time_limit
+        self.time_per_employee = time_per_employee
+        self.template = template
+        self.output_dir = output_dir
+
+    def time_limit(self, employees: int) -> float:
+        return min(self.max_time_limit, self.min_time_limit + self.time_per_employee * employees)
+
+    def run(self, year: int, month: int, resume: bool = False) -> dict:
+        checkpoint = BatchCheckpoint(self.output_dir / f"{year}-{month:02d}.checkpoint.json", year, month)
+        if resume:
+            checkpoint.load()
+
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            employer_ids = [row.id for row in db.query(models.Employer.id).order_by(models.Employer.id)]
+            # the cache may have evicted templates, the schedules table keeps them
+            templates = ScheduleStore(db).load_request_templates() | schedule_cache.load_request_templates()
+        finally:
+            db.close()
+        todo = [employer_id for employer_id in employer_ids if not checkpoint.done(employer_id)]
+        logger.info(f"Batch {year}-{month:02d}: {len(todo)} of {len(employer_ids)} employers to process")
+
+        # spawn: forking a process with open DB connections / solver threads is unsafe
+        with ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_schedule_worker,
+            initargs=(self.processes,),
+        ) as pool:
+            in_flight = {}
+            pending = iter(todo)
+            exhausted = False
+            while in_flight or not exhausted:
+                # a few tenants ahead of the pool, not the whole employer table in memory
+                while not exhausted and len(in_flight) < 2 * self.processes:
+                    employer_id = next(pending, None)
+                    if employer_id is None:
+                        exhausted = True
+                        break
+                    job = self.prepare(employer_id, year, month, templates.get(employer_id), checkpoint)
+                    if job is not None:
+                        request, roster, previous, cache_key = job
+                        future = pool.submit(run_batch_tenant, request.model_dump(), roster, previous)
+                        in_flight[future] = (employer_id, request, cache_key)
+                if not in_flight:
+                    continue
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    employer_id, request, cache_key = in_flight.pop(future)
+                    self.store(future, employer_id, request, cache_key, checkpoint)
+
+        return self.report(checkpoint, employer_ids, time.perf_counter() - started)
+
+    def prepare(self, employer_id: int, year: int, month: int, template: Optional[dict],
+                checkpoint: BatchCheckpoint):
+        """Returns (request, roster, previous state, cache key), or None when there's nothing to solve."""
+        template = template or self.template
+        if template is None:
+            checkpoint.record(employer_id, "skipped", error="no request template")
+            return None
+
+        db = SessionLocal()
+        try:
+            if ScheduleStore(db).stored_source(employer_id, year, month) == "owner":
+                checkpoint.record(employer_id, "exists")
+                return None
+            service = ScheduleService(db)
+            employees = service.load_employer_roster(employer_id)
+        finally:
+            db.close()
+        if not employees:
+            checkpoint.record(employer_id, "skipped", error="no employees")
+            return None
+
+        request = ScheduleRequest.model_validate(template | {"year": year, "month": month, "preferences": None})
+        budget = request.solver or SolverBudget()
+        time_limit = self.time_limit(len(employees))
+        if budget.time_limit_seconds is not None:
+            time_limit = min(time_limit, budget.time_limit_seconds)
+        request.solver = budget.model_copy(update={"time_limit_seconds": time_limit})
+
+        previous = service.load_previous_state(employer_id, request)
+        cache_key = schedule_cache_key(request, employees, previous)
+        if schedule_cache.get(cache_key) is not None:
+            checkpoint.record(employer_id, "cached", seconds=0.0)
+            return None
+        return request, [e.model_dump() for e in employees], previous, cache_key
+
+    def store(self, future, employer_id: int, request: ScheduleRequest, cache_key: str,
+              checkpoint: BatchCheckpoint) -> None:
+        try:
+            result, state, seconds = future.result()
+        except ScheduleJobError as exc:
+            logger.warning(f"Batch: employer {employer_id} failed: {exc}")
+            checkpoint.record(employer_id, "failed", error=str(exc))
+            return
+        except Exception as exc:
+            logger.exception(f"Batch: employer {employer_id} crashed")
+            checkpoint.record(employer_id, "failed", error=repr(exc))
+            return
+
+        try:
+            stored = store_schedule(employer_id, cache_key, result, state, source="batch")
+        except Exception as exc:
+            # not cached either, so the next run solves the tenant again
+            logger.exception(f"Batch: storing the schedule of employer {employer_id} failed")
+            checkpoint.record(employer_id, "failed", error=f"store: {exc!r}")
+            return
+        if not stored:
+            # the owner generated the month while the batch was solving it
+            checkpoint.record(employer_id, "exists", seconds=round(seconds, 3))
+            return
+        schedule_cache.set(cache_key, employer_id, request.year, request.month, result, state)
+        schedule_cache.save_month_state(employer_id, request.year, request.month, state)
+        checkpoint.record(employer_id, "solved", seconds=round(seconds, 3))
+        logger.info(f"Batch: employer {employer_id} solved in {seconds:.1f}s")
+
+    def report(self, checkpoint: BatchCheckpoint, employer_ids: List[int], elapsed: float) -> dict:
+        outcomes = [checkpoint.tenants[e] for e in employer_ids if e in checkpoint.tenants]
+        by_status: Dict[str, int] = {}
+        for outcome in outcomes:
+            by_status[outcome["status"]] = by_status.get(outcome["status"], 0) + 1
+        solve_times = sorted(o["seconds"] for o in outcomes if o["status"] == "solved")
+        processed = sum(by_status.get(s, 0) for s in ("solved", "cached", "exists", "failed"))
+
+        report = {
+            "year": checkpoint.year,
+            "month": checkpoint.month,
+            "started_at": checkpoint.started_at,
+            "finished_at": datetime.utcnow().isoformat(),
+            "elapsed_seconds": round(elapsed, 3),
+            "processes": self.processes,
+            "tenants": len(employer_ids),
+            "outcomes": by_status,
+            "tenants_per_hour": round(processed / elapsed * 3600, 1) if elapsed > 0 else None,
+            "seconds_per_tenant": {
+                "mean": round(statistics.fmean(solve_times), 3) if solve_times else None,
+                "p50": round(solve_times[len(solve_times) // 2], 3) if solve_times else None,
+                "p95": round(solve_times[int(len(solve_times) * 0.95)], 3) if solve_times else None,
+                "max": solve_times[-1] if solve_times else None,
+            },
+            "failures": [
+                {"employer_id": e, "error": checkpoint.tenants[e]["error"]}
+                for e in employer_ids
+                if e in checkpoint.tenants and checkpoint.tenants[e]["status"] == "failed"
+            ],
+        }
+        path = self.output_dir / f"{checkpoint.year}-{checkpoint.month:02d}.report.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2))
+        logger.info(f"Batch {checkpoint.year}-{checkpoint.month:02d} finished: {by_status}, "
+                    f"{report['tenants_per_hour']} tenants/h, report in {path}")
+        return report
+
+
+def seconds_until(hh_mm: str) -> float:
+    hour, minute = (int(part) for part in hh_mm.split(":"))
+    now = datetime.now()
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--year", type=int, help="defaults to next month's year")
+    parser.add_argument("--month", type=int, help="defaults to next month")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--min-time-limit", type=float, default=10.0, help="seconds per tenant")
+    parser.add_argument("--max-time-limit", type=float, default=300.0, help="seconds per tenant")
+    parser.add_argument("--time-per-employee", type=float, default=0.5, help="extra seconds per employee")
+    parser.add_argument("--template", type=Path, help="request (JSON) for employers without a template")
+    parser.add_argument("--output-dir", type=Path, default=BATCH_DIR, help="checkpoints and reports")
+    parser.add_argument("--resume", action="store_true", help="skip tenants finished by an interrupted run")
+    parser.add_argument("--daily-at", metavar="HH:MM", help="keep running and start a run every day at HH:MM")
+    args = parser.parse_args()
+
+    setup_logging(log_level="INFO", log_to_file=True, log_to_console=True, json_logs=False)
+    template = None
+    if args.template:
+        template = json.loads(args.template.read_text())
+    runner = ScheduleBatchRunner(
+        processes=args.processes,
+        min_time_limit=args.min_time_limit,
+        max_time_limit=args.max_time_limit,
+        time_per_employee=args.time_per_employee,
+        template=template,
+        output_dir=args.output_dir,
+    )
+
+    if not args.daily_at:
+        year, month = next_month()
+        report = runner.run(args.year or year, args.month or month, resume=args.resume)
+        print(json.dumps(report, indent=2))
+        return
+
+    while True:
+        delay = seconds_until(args.daily_at)
+        logger.info(f"Next batch run in {delay / 3600:.1f}h")
+        time.sleep(delay)
+        # not resumed: a tenant solved the night before has to pick up roster changes; unchanged
+        # tenants (a restart during the night included) are skipped by their cache key
+        runner.run(*next_month())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.logging_config import get_logger
+from core.settings import settings
+from schemas.schedule import Employee, ScheduleRequest
+
+logger = get_logger(__name__)
+
+# Request fields that influence the generated schedule
+KEY_FIELDS = {"year", "month", "shifts", "rules", "holidays_mode", "company_work_mode", "preferences",
+              "decomposition", "solver"}
+
+# Part of every key, bump it when the cached payload changes
+CACHE_VERSION = 2
+
+# Request fields that only make sense for the month they were given for
+TEMPLATE_EXCLUDE = {"year", "month", "preferences"}
+
+
+def request_template(request: ScheduleRequest) -> dict:
+    """The request without its month-specific fields: what generates the employer's next months."""
+    return request.model_dump(mode="json", exclude=TEMPLATE_EXCLUDE)
+
+
+def schedule_cache_key(request: ScheduleRequest, employees: List[Employee], previous: Optional[dict] = None) -> str:
+    """
+    Content hash of a schedule request plus the roster it is solved for.
+
+    Only employee ids and employment fractions go into the key; any other
+    roster change is handled by invalidating the employer's entries.
+    `previous` is the warm-start state of the preceding month, which adds
+    boundary constraints and therefore has to be part of the key as well.
+    """
+    roster = sorted((e.id, round(float(e.employment_fraction), 4)) for e in employees)
+    canonical = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "request": request.model_dump(include=KEY_FIELDS, mode="json"),
+            "roster": roster,
+            "previous": previous,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ScheduleCache:
+    """
+    On-disk cache of generated schedules: the response together with the
+    compact month state it was built from.
+
+    Backed by SQLite so that every uvicorn worker (and the job pool processes)
+    share the same entries. Entries expire after `ttl_seconds` and the least
+    recently used ones are evicted above `max_entries`.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: int, max_entries: int, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schedule_cache (
+                        key TEXT PRIMARY KEY,
+                        employer_id INTEGER NOT NULL,
+                        year INTEGER NOT NULL,
+                        month INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL,
+                        payload TEXT NOT NULL
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_schedule_cache_employer ON schedule_cache (employer_id)")
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_schedule_cache_accessed ON schedule_cache (accessed_at)")
+                # last solved assignment per employer/month, used to warm-start the next month
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schedule_state (
+                        employer_id INTEGER NOT NULL,
+                        year INTEGER NOT NULL,
+                        month INTEGER NOT NULL,
+                        updated_at REAL NOT NULL,
+                        state TEXT NOT NULL,
+                        PRIMARY KEY (employer_id, year, month)
+                    )
+                    """
+                )
+                # last successful request per employer, the template of batch generation
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schedule_template (
+                        employer_id INTEGER PRIMARY KEY,
+                        updated_at REAL NOT NULL,
+                        request TEXT NOT NULL
+                    )
+                    """
+                )
+                self._initialized = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Tuple[dict, dict]]:
+        """Returns the cached (response, month state) pair, or None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT payload, created_at FROM schedule_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM schedule_cache WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE schedule_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            logger.exception("Schedule cache read failed")
+            return None
+        payload = json.loads(row[0])
+        result = payload["result"]
+        # the timings were those of the original solve, not of this request
+        result["meta"].pop("timings_ms", None)
+        result["meta"]["cached"] = True
+        return result, payload["state"]
+
+    def set(self, key: str, employer_id: int, year: int, month: int, result: dict, state: dict) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        payload = {"result": result, "state": state}
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO schedule_cache "
+                    "(key, employer_id, year, month, created_at, accessed_at, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, employer_id, year, month, now, now, json.dumps(payload, separators=(",", ":"))),
+                )
+                self._evict(conn, now)
+        except sqlite3.Error:
+            logger.exception("Schedule cache write failed")
+
+    def invalidate_employer(self, employer_id: int) -> None:
+        if not self.enabled or employer_id is None:
+            return
+        try:
+            with self._connect() as conn:
+                deleted = conn.execute(
+                    "DELETE FROM schedule_cache WHERE employer_id = ?", (employer_id,)
+                ).rowcount
+        except sqlite3.Error:
+            logger.exception("Schedule cache invalidation failed")
+            return
+        if deleted:
+            logger.info(f"Invalidated {deleted} cached schedules for employer {employer_id}")
+
+    def save_month_state(self, employer_id: int, year: int, month: int, state: dict) -> None:
+        """Stores the compact assignment of a solved month (kept across roster changes)."""
+        if not self.enabled:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO schedule_state (employer_id, year, month, updated_at, state) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (employer_id, year, month, time.time(), json.dumps(state, separators=(",", ":"))),
+                )
+        except sqlite3.Error:
+            logger.exception("Schedule state write failed")
+
+    def load_month_state(self, employer_id: int, year: int, month: int) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT state FROM schedule_state WHERE employer_id = ? AND year = ? AND month = ?",
+                    (employer_id, year, month),
+                ).fetchone()
+        except sqlite3.Error:
+            logger.exception("Schedule state read failed")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def save_request_template(self, employer_id: int, request: ScheduleRequest) -> None:
+        """
+        Remembers the employer's latest request without the month-specific
+        fields, so that the next month can be generated without the owner.
+        The template is stored with the schedule as well (`Schedule.request`),
+        which outlives cache eviction.
+        """
+        if not self.enabled:
+            return
+        template = request_template(request)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO schedule_template (employer_id, updated_at, request) VALUES (?, ?, ?)",
+                    (employer_id, time.time(), json.dumps(template, separators=(",", ":"))),
+                )
+        except sqlite3.Error:
+            logger.exception("Schedule template write failed")
+
+    def load_request_templates(self) -> Dict[int, dict]:
+        if not self.enabled:
+            return {}
+        try:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT employer_id, request FROM schedule_template").fetchall()
+        except sqlite3.Error:
+            logger.exception("Schedule template read failed")
+            return {}
+        return {employer_id: json.loads(request) for employer_id, request in rows}
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM schedule_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM schedule_cache WHERE key IN ("
+            "SELECT key FROM schedule_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+schedule_cache = ScheduleCache(
+    path=Path(settings.schedule_cache_path),
+    ttl_seconds=settings.schedule_cache_ttl_seconds,
+    max_entries=settings.schedule_cache_max_entries,
+    enabled=settings.schedule_cache_enabled,
+)
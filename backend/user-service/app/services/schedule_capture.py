@@ -0,0 +1,101 @@
+"""
+Captured schedule models, for reproducing slow solves offline.
+
+With SCHEDULE_MODEL_DUMP_DIR set, every solve that takes at least
+SCHEDULE_MODEL_DUMP_MIN_SECONDS is written there as two files sharing a
+stem:
+- <stem>.pb: the solved CpModelProto (binary), solvable as it is;
+- <stem>.json: the bundle the model was built from (normalized request,
+  roster, scheduled days, full-time hours, previous/boundary state and
+  targets) plus the solver parameters and statistics of the captured solve.
+
+Needs neither FastAPI nor the database, so captures can be loaded by
+standalone tools.
+"""
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from google.protobuf import text_format
+from ortools.sat import sat_parameters_pb2
+from ortools.sat.python import cp_model
+
+from schemas.schedule import Employee, ScheduleRequest
+from services.schedule_model import ScheduleModel, ScheduleModelBuilder
+
+CAPTURE_VERSION = 1
+
+
+def capture_schedule_model(directory: str, ctx: ScheduleModel, solver: cp_model.CpSolver, stats: dict,
+                           request_id: Optional[str] = None) -> Path:
+    """Writes the model of a finished solve; returns the path of the bundle."""
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    request = ctx.request
+    stem = (f"{datetime.utcnow():%Y%m%dT%H%M%S}-{request.year}-{request.month:02d}"
+            f"-{len(ctx.employees)}e-{request_id or uuid.uuid4().hex[:12]}")
+
+    (path / f"{stem}.pb").write_bytes(ctx.model.Proto().SerializeToString())
+    bundle = {
+        "version": CAPTURE_VERSION,
+        "captured_at": datetime.utcnow().isoformat(),
+        "request_id": request_id,
+        "model": f"{stem}.pb",
+        "request": request.model_dump(mode="json"),
+        "employees": [e.model_dump() for e in ctx.employees],
+        "days_list": list(ctx.days_list),
+        "full_time_hours": ctx.full_time_hours,
+        "previous": ctx.previous,
+        "boundary": ctx.boundary,
+        "targets": ctx.targets,
+        "solver_parameters": text_format.MessageToString(solver.parameters),
+        "stats": stats,
+    }
+    bundle_path = path / f"{stem}.json"
+    bundle_path.write_text(json.dumps(bundle, default=int))
+    return bundle_path
+
+
+def load_bundle(path: Path) -> dict:
+    bundle = json.loads(Path(path).read_text())
+    if bundle.get("version") != CAPTURE_VERSION:
+        raise ValueError(f"{path}: unsupported capture version {bundle.get('version')}")
+    return bundle
+
+
+def build_from_bundle(bundle: dict) -> ScheduleModel:
+    """Rebuilds the model from the bundle with the current `ScheduleModelBuilder`."""
+    request = ScheduleRequest.model_validate(bundle["request"])
+    employees: List[Employee] = [Employee.model_validate(e) for e in bundle["employees"]]
+    return ScheduleModelBuilder(request, employees, bundle["days_list"], bundle["full_time_hours"],
+                                bundle["previous"], targets=bundle["targets"], boundary=bundle["boundary"]).build()
+
+
+def load_model(path: Path, rebuild: bool = False) -> Tuple[cp_model.CpModel, Optional[dict]]:
+    """
+    Loads a capture, given its .pb or its .json bundle. The model is the
+    captured proto, or rebuilt from the bundle (`build_from_bundle`) when
+    `rebuild` is set or the proto is missing. Returns the model and the
+    bundle (None for a lone .pb file).
+    """
+    path = Path(path)
+    bundle_path = path.with_suffix(".json")
+    bundle = load_bundle(bundle_path) if bundle_path.exists() else None
+    if bundle is not None and (rebuild or not (path.parent / bundle["model"]).exists()):
+        return build_from_bundle(bundle).model, bundle
+    if bundle is None and path.suffix != ".pb":
+        raise FileNotFoundError(f"{path}: no capture bundle found")
+
+    model = cp_model.CpModel()
+    model.Proto().ParseFromString((path.parent / bundle["model"] if bundle else path).read_bytes())
+    return model, bundle
+
+
+def solver_parameters(bundle: Optional[dict]) -> sat_parameters_pb2.SatParameters:
+    """Solver parameters of the captured solve (CP-SAT defaults without a bundle)."""
+    parameters = sat_parameters_pb2.SatParameters()
+    if bundle is not None:
+        text_format.Parse(bundle["solver_parameters"], parameters)
+    return parameters
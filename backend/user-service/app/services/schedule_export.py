@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+import models
+
+# rows fetched from the database at a time (server-side cursor on PostgreSQL)
+EXPORT_BATCH_ROWS = 1000
+
+CSV_COLUMNS = ["date", "weekday", "shift", "start", "end", "hours", "employee_id", "first_name", "last_name"]
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def _ics_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_line(line: str) -> str:
+    """Folds a content line to 75 octets, as RFC 5545 requires."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74  # continuation lines start with a space
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+class ScheduleExporter:
+    """
+    Streams stored schedules (see `ScheduleStore`) as CSV or iCalendar.
+
+    Assignments are read in batches of `EXPORT_BATCH_ROWS` and written out
+    as they arrive, so memory use does not depend on the exported range.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _schedule_shifts(self, employer_id: int, date_from: Optional[date], date_to: Optional[date]) -> Dict[int, list]:
+        """Shift definitions of every stored month touching the range (one row per month)."""
+        query = self.db.query(models.Schedule.id, models.Schedule.shifts).filter(
+            models.Schedule.employer_id == employer_id
+        )
+        month_index = models.Schedule.year * 12 + models.Schedule.month
+        if date_from is not None:
+            query = query.filter(month_index >= date_from.year * 12 + date_from.month)
+        if date_to is not None:
+            query = query.filter(month_index <= date_to.year * 12 + date_to.month)
+        return {schedule_id: json.loads(shifts) for schedule_id, shifts in query}
+
+    def _assignments(self, employer_id: int, date_from: Optional[date], date_to: Optional[date],
+                     employee_id: Optional[int] = None) -> Iterator[tuple]:
+        """Yields (day, shift definition, employee id, first name, last name) ordered by day and shift."""
+        shifts = self._schedule_shifts(employer_id, date_from, date_to)
+        if not shifts:
+            return
+        A = models.ScheduleAssignment
+        query = (
+            self.db.query(A.schedule_id, A.day, A.shift, A.employee_id,
+                          models.Employee.first_name, models.Employee.last_name)
+            .join(models.Employee, models.Employee.id == A.employee_id)
+            .filter(A.schedule_id.in_(list(shifts)))
+        )
+        if employee_id is not None:
+            query = query.filter(A.employee_id == employee_id)
+        if date_from is not None:
+            query = query.filter(A.day >= date_from)
+        if date_to is not None:
+            query = query.filter(A.day <= date_to)
+        query = query.order_by(A.day, A.shift, A.employee_id).yield_per(EXPORT_BATCH_ROWS)
+        for schedule_id, day, s, emp_id, first_name, last_name in query:
+            yield day, shifts[schedule_id][s], emp_id, first_name, last_name
+
+    def csv(self, employer_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Iterator[str]:
+        """One row per worked shift: date, shift, start/end time, hours and the employee."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        rows = 0
+        for day, shift, emp_id, first_name, last_name in self._assignments(employer_id, date_from, date_to):
+            start = datetime(day.year, day.month, day.day, shift["start_hour"])
+            end = start + timedelta(hours=shift["length"])
+            writer.writerow([
+                day.isoformat(), WEEKDAYS[day.weekday()], shift["name"],
+                start.isoformat(timespec="minutes"), end.isoformat(timespec="minutes"), shift["length"],
+                emp_id, first_name, last_name,
+            ])
+            rows += 1
+            if rows % EXPORT_BATCH_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def ics(self, employer_id: int, employee_id: int, date_from: Optional[date] = None,
+            date_to: Optional[date] = None) -> Iterator[str]:
+        """iCalendar feed with one event per shift of the employee."""
+        employee = self.db.query(models.Employee).filter(models.Employee.id == employee_id).first()
+        if not employee or employee.employer_id != employer_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee is not found by the given id")
+        # fetched before streaming starts, so a missing employee is still a proper 404
+        first_name, last_name = employee.first_name, employee.last_name
+        return self._ics_events(employer_id, employee_id, f"{first_name} {last_name}", date_from, date_to)
+
+    def _ics_events(self, employer_id: int, employee_id: int, name: str, date_from: Optional[date],
+                    date_to: Optional[date]) -> Iterator[str]:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        yield "".join(_ics_line(line) for line in [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//GeneratorGrafika//Schedule export//EN",
+            "CALSCALE:GREGORIAN",
+            f"X-WR-CALNAME:{_ics_escape(name)}",
+        ])
+        chunk = []
+        events = 0
+        for day, shift, emp_id, _, _ in self._assignments(employer_id, date_from, date_to, employee_id):
+            # floating local times: the shifts are defined in the company's local time
+            start = datetime(day.year, day.month, day.day, shift["start_hour"])
+            end = start + timedelta(hours=shift["length"])
+            chunk.extend([
+                "BEGIN:VEVENT",
+                f"UID:{employer_id}-{emp_id}-{day.isoformat()}@schedule",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+                f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}",
+                f"SUMMARY:{_ics_escape(shift['name'])}",
+                "END:VEVENT",
+            ])
+            events += 1
+            if events % EXPORT_BATCH_ROWS == 0:
+                yield "".join(_ics_line(line) for line in chunk)
+                chunk = []
+        chunk.append("END:VCALENDAR")
+        yield "".join(_ics_line(line) for line in chunk)
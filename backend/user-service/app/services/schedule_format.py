@@ -0,0 +1,146 @@
+"""
+Response formats of a generated schedule, chosen with the Accept header.
+
+- application/json (default): the `ScheduleResponse` shape, names per shift.
+- application/vnd.schedule.compact+json: employee dictionary plus an
+  id-based assignment matrix, see `ScheduleFormatter.compact`.
+- application/vnd.schedule.compact+msgpack (or application/msgpack,
+  application/x-msgpack): the compact format as MessagePack. Needs the
+  optional `msgpack` package.
+"""
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.orm import Session
+
+import models
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for the binary format
+    msgpack = None
+
+DEFAULT_JSON = "application/json"
+COMPACT_JSON = "application/vnd.schedule.compact+json"
+COMPACT_MSGPACK = "application/vnd.schedule.compact+msgpack"
+
+# media type -> format served for it
+MEDIA_TYPES = {
+    DEFAULT_JSON: DEFAULT_JSON,
+    "application/*": DEFAULT_JSON,
+    "*/*": DEFAULT_JSON,
+    COMPACT_JSON: COMPACT_JSON,
+    COMPACT_MSGPACK: COMPACT_MSGPACK,
+    "application/msgpack": COMPACT_MSGPACK,
+    "application/x-msgpack": COMPACT_MSGPACK,
+}
+
+
+def negotiate_schedule_format(accept: Optional[str]) -> str:
+    """
+    Picks the format of the highest-quality media type of the Accept header
+    that is known; the default JSON shape when none is.
+    """
+    candidates: List[Tuple[float, int, str]] = []
+    for position, item in enumerate((accept or "").split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        if media_type.lower() not in MEDIA_TYPES:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            # ties go to the type listed first
+            candidates.append((-quality, position, MEDIA_TYPES[media_type.lower()]))
+    if not candidates:
+        return DEFAULT_JSON
+    return min(candidates)[2]
+
+
+class ScheduleFormatter:
+    """Renders a (response, month state) pair in the format asked for by the client."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def compact(self, result: dict, state: dict) -> dict:
+        """
+        Id-based form of a schedule. Rows of `assignment` and the `summary`
+        columns follow `employees`; `assignment[e][di]` is the index into
+        `shifts` worked by employee `e` on `days[di]`, or -1 for a day off.
+        Employees deleted since the schedule was generated keep their id,
+        with null names. `targets` are the hour targets the schedule was
+        solved with, not ones derived from today's employment fractions.
+        """
+        employee_ids = state["employee_ids"]
+        employees = {
+            e.id: e
+            for e in self.db.query(models.Employee.id, models.Employee.first_name, models.Employee.last_name)
+            .filter(models.Employee.id.in_(employee_ids))
+        }
+        lengths = [int(sh["length"]) for sh in state["shifts"]]
+        targets = self.solved_targets(result, state, employees)
+
+        return {
+            "year": state["year"],
+            "month": state["month"],
+            "employees": [
+                {
+                    "id": employee_id,
+                    "first_name": employees[employee_id].first_name if employee_id in employees else None,
+                    "last_name": employees[employee_id].last_name if employee_id in employees else None,
+                }
+                for employee_id in employee_ids
+            ],
+            "shifts": state["shifts"],
+            "days": state["days"],
+            "assignment": state["assignment"],
+            "summary": {
+                "shifts": [sum(1 for s in row if s >= 0) for row in state["assignment"]],
+                "hours": [sum(lengths[s] for s in row if s >= 0) for row in state["assignment"]],
+                "targets": targets,
+            },
+            "meta": result["meta"],
+        }
+
+    @staticmethod
+    def solved_targets(result: dict, state: dict, employees: dict) -> List[Optional[int]]:
+        """
+        Hour targets per employee of `state`, as recorded by the solve
+        (`meta.targets`). Schedules stored before that was recorded fall
+        back to their summary, which is keyed by the names at solve time.
+        """
+        targets = result["meta"].get("targets")
+        if targets is not None and len(targets) == len(state["employee_ids"]):
+            return targets
+        summary = result.get("summary") or {}
+        fallback = []
+        for employee_id in state["employee_ids"]:
+            employee = employees.get(employee_id)
+            stats = summary.get(f"{employee.first_name} {employee.last_name}") if employee is not None else None
+            fallback.append(stats.get("target") if stats else None)
+        return fallback
+
+    def respond(self, result: dict, state: dict, accept: Optional[str]) -> Response:
+        schedule_format = negotiate_schedule_format(accept)
+        # the same URL answers with different bodies
+        headers = {"Vary": "Accept"}
+        if schedule_format == DEFAULT_JSON:
+            return JSONResponse(jsonable_encoder(result), headers=headers)
+
+        compact = jsonable_encoder(self.compact(result, state))
+        if schedule_format == COMPACT_JSON:
+            return Response(json.dumps(compact, separators=(",", ":")), media_type=COMPACT_JSON, headers=headers)
+
+        if msgpack is None:
+            raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                                detail="MessagePack responses are not available on this server")
+        return Response(msgpack.packb(compact), media_type=COMPACT_MSGPACK, headers=headers)
@@ -0,0 +1,325 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+
+from core import metrics
+from core.logging_config import get_logger
+from core.settings import settings
+from schemas.schedule import Employee, ScheduleRequest
+from services.schedule_cache import schedule_cache, schedule_cache_key
+from services.schedule_store import store_cached_schedule, store_schedule
+from services.schedule_service import ScheduleService, solve_slots
+
+logger = get_logger(__name__)
+
+
+class ScheduleJobError(Exception):
+    """Raised inside a worker process when the schedule can't be generated."""
+
+
+def init_schedule_worker(pool_size: int) -> None:
+    """
+    Runs once in every worker process: the other workers of the pool are
+    assumed busy, so a job only takes its share of the cores.
+    """
+    solve_slots.external = pool_size - 1
+
+
+def run_schedule_job(request_data: dict, roster_data: List[dict], previous: Optional[dict],
+                     day_range: Optional[Tuple[int, int]] = None,
+                     targets: Optional[List[int]] = None) -> Tuple[dict, dict]:
+    """
+    Entry point executed in a worker process.
+
+    Receives plain dicts (cheap to pickle) and rebuilds the pydantic objects
+    on the worker side.
+    """
+    request = ScheduleRequest.model_validate(request_data)
+    employees = [Employee.model_validate(e) for e in roster_data]
+    try:
+        return ScheduleService(None).solve_schedule(request, employees, previous, day_range, targets=targets)
+    except HTTPException as exc:
+        # HTTPException does not survive pickling between processes
+        raise ScheduleJobError(str(exc.detail)) from None
+
+
+class ScheduleJob:
+    def __init__(self, employer_id: int, request: ScheduleRequest, future: Future):
+        self.job_id = uuid.uuid4().hex
+        self.employer_id = employer_id
+        self.request = request
+        self.year = request.year
+        self.month = request.month
+        self.future = future
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.cache_key: Optional[str] = None
+        # served from the schedule cache instead of solved in the pool
+        self.cached = False
+        # set from submission until the result is written to the cache and the database (see
+        # `ScheduleJobManager._store`), so a job is never reported "done" before it can be read back
+        self.storing = True
+        self.store_error: Optional[str] = None
+
+    @property
+    def solved(self) -> bool:
+        return self.future.done() and not self.future.cancelled() and self.future.exception() is None
+
+    @property
+    def status(self) -> str:
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        if not self.solved or self.store_error is not None:
+            return "failed"
+        return "storing" if self.storing else "done"
+
+    @property
+    def error(self) -> Optional[str]:
+        if not self.future.done():
+            return None
+        if self.future.cancelled():
+            return "Job was cancelled"
+        exc = self.future.exception()
+        if exc is not None:
+            return str(exc)
+        if self.store_error is not None:
+            return f"Schedule was generated but could not be saved: {self.store_error}"
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "year": self.year,
+            "month": self.month,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class ScheduleJobManager:
+    """
+    Runs schedule generation in a dedicated process pool.
+
+    CP-SAT solves are CPU-bound and can take minutes, so they must not occupy
+    the API worker's threadpool. Jobs are kept in memory of the API process
+    and dropped `ttl_seconds` after they finish.
+
+    The months of multi-month plans (`submit_segments`) run in the same
+    pool, so all solves of the API process share its `max_workers` cores
+    and its `max_pending` limit.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, ttl_seconds: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ScheduleJob] = {}
+        self._segments: Set[Future] = set()
+        # results are stored one at a time, off the executor's callback thread
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="schedule-store")
+        # reentrant: done callbacks run inline when added to an already finished future
+        self._lock = threading.RLock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs solver/uvicorn threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_schedule_worker,
+                initargs=(self.max_workers,),
+            )
+            logger.info(f"Schedule job pool started with {self.max_workers} workers")
+        return self._executor
+
+    def _drop_executor(self, executor: ProcessPoolExecutor) -> None:
+        # a broken pool (worker killed by the OOM killer, crashed solver) refuses all further work
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.warning("Schedule job pool is broken, a new one is started for the next job")
+
+    def _on_pool_done(self, future: Future, executor: ProcessPoolExecutor) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._drop_executor(executor)
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        """Runs `fn(*args)` in the pool, replacing a broken pool once."""
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._drop_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        future.add_done_callback(lambda done: self._on_pool_done(done, executor))
+        return future
+
+    def _prune(self) -> None:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at.timestamp() > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.future.done()) + len(self._segments)
+
+    def _update_solve_slots(self) -> None:
+        # solves of the pool compete for cores with the ones running in the API threads
+        solve_slots.external = min(self._pending(), self.max_workers)
+
+    def _check_capacity(self, count: int) -> None:
+        if self._pending() + count > self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many schedule jobs in progress, try again later"
+            )
+
+    def _on_done(self, job: ScheduleJob) -> None:
+        # runs on the executor's result thread: only bookkeeping here, the writes go to `_store`
+        with self._lock:
+            self._update_solve_slots()
+        if not job.solved:
+            job.storing = False
+            job.finished_at = datetime.utcnow()
+            logger.warning(f"Schedule job {job.job_id} failed: {job.error}")
+            return
+        logger.info(f"Schedule job {job.job_id} finished for employer {job.employer_id}")
+        if not job.cached:
+            metrics.observe_worker_solves(job.future.result()[0])
+        try:
+            self._store_executor.submit(self._store, job)
+        except RuntimeError:
+            # the app is shutting down
+            job.storing = False
+            job.store_error = "service is shutting down"
+            job.finished_at = datetime.utcnow()
+
+    def _store(self, job: ScheduleJob) -> None:
+        result, state = job.future.result()
+        try:
+            if job.cached:
+                schedule_cache.save_month_state(job.employer_id, job.year, job.month, state)
+                store_cached_schedule(job.employer_id, job.cache_key, result, state, job.request)
+            else:
+                schedule_cache.set(job.cache_key, job.employer_id, job.year, job.month, result, state)
+                schedule_cache.save_month_state(job.employer_id, job.year, job.month, state)
+                schedule_cache.save_request_template(job.employer_id, job.request)
+                store_schedule(job.employer_id, job.cache_key, result, state, job.request)
+        except Exception as exc:
+            job.store_error = str(exc)
+            logger.exception(f"Schedule job {job.job_id}: storing the schedule failed")
+        finally:
+            job.storing = False
+            job.finished_at = datetime.utcnow()
+
+    def submit(
+        self,
+        employer_id: int,
+        request: ScheduleRequest,
+        employees: List[Employee],
+        previous: Optional[dict] = None,
+    ) -> ScheduleJob:
+        with self._lock:
+            self._prune()
+            self._check_capacity(1)
+            cache_key = schedule_cache_key(request, employees, previous)
+            cached = schedule_cache.get(cache_key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+            else:
+                future = self._submit(run_schedule_job, request.model_dump(), [e.model_dump() for e in employees],
+                                      previous)
+            job = ScheduleJob(employer_id, request, future)
+            job.cache_key = cache_key
+            job.cached = cached is not None
+            self._jobs[job.job_id] = job
+            self._update_solve_slots()
+        future.add_done_callback(lambda _: self._on_done(job))
+        logger.info(f"Schedule job {job.job_id} submitted for employer {employer_id}")
+        return job
+
+    def _on_segment_done(self, future: Future) -> None:
+        with self._lock:
+            self._segments.discard(future)
+            self._update_solve_slots()
+
+    def submit_segments(self, segments: List[tuple], fn: Callable = run_schedule_job) -> List[Future]:
+        """
+        Queues `fn` calls (one argument tuple per plan month, `run_schedule_job`
+        by default) in the job pool. All of them are accepted, or none (429
+        when they don't fit into `max_pending`).
+        """
+        with self._lock:
+            self._check_capacity(len(segments))
+            futures = [self._submit(fn, *args) for args in segments]
+            self._segments.update(futures)
+            self._update_solve_slots()
+        for future in futures:
+            future.add_done_callback(self._on_segment_done)
+        return futures
+
+    def get(self, job_id: str, employer_id: int) -> ScheduleJob:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        # jobs of other employers are reported as missing, not forbidden
+        if job is None or job.employer_id != employer_id:
+            raise HTTPException(status_code=404, detail="Schedule job not found")
+        return job
+
+    def list(self, employer_id: int) -> List[ScheduleJob]:
+        with self._lock:
+            self._prune()
+            jobs = [job for job in self._jobs.values() if job.employer_id == employer_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of known jobs per status (queued, running, storing, done, failed)."""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        counts = dict.fromkeys(("queued", "running", "storing", "done", "failed"), 0)
+        for job_status in statuses:
+            counts[job_status] += 1
+        return counts
+
+    def result(self, job_id: str, employer_id: int) -> Tuple[dict, dict]:
+        """
+        Returns the (response, month state) pair of a solved job, also while
+        it is stored or when storing it failed.
+        """
+        job = self.get(job_id, employer_id)
+        if not job.future.done():
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Schedule job is not finished yet")
+        if not job.solved:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=job.error)
+        return job.future.result()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        # solved schedules still being written are not thrown away
+        self._store_executor.shutdown(wait=True)
+
+
+schedule_jobs = ScheduleJobManager(
+    max_workers=settings.schedule_job_workers,
+    max_pending=settings.schedule_job_max_pending,
+    ttl_seconds=settings.schedule_job_ttl_seconds,
+)
@@ -0,0 +1,488 @@
+import calendar
+from itertools import takewhile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from schemas.schedule import Employee
+
+# Objective weight of one hour of deviation from the monthly target
+W_HOURS = 2
+DEFAULT_DAY_OFF_PRIORITY = 50
+
+
+def compute_rest_hours(start1: int, length1: int, start2: int) -> int:
+    """
+    Calculates hours from the end of a shift (day d) to the start of a shift (day d+1).
+
+    Args:
+        start1: Start hour of the first shift (0..23).
+        length1: Length of the first shift in hours.
+        start2: Start hour of the next day's shift (0..23).
+
+    Returns:
+        Rest duration in hours.
+    """
+    end1 = (start1 + length1) % 24
+    # If the shift ends after midnight (end1 < start1), it ends on day d+1?
+    # Note: The logic below assumes shifts typically wrap within 24h cycle logic.
+    end1_abs = end1 if end1 > start1 else end1 + 24
+    start2_abs = start2 + 24
+    return start2_abs - end1_abs
+
+
+class ScheduleModel:
+    """
+    A built CP-SAT model together with everything needed to read its solution back.
+    """
+
+    def __init__(self, request, model: cp_model.CpModel, x: np.ndarray, worked: np.ndarray,
+                 employees: List[Employee], days_list: List[int], full_time_hours: int,
+                 deviations: list, meta: dict, x_index: np.ndarray, previous: Optional[dict] = None,
+                 boundary: Optional[dict] = None, targets: Optional[List[int]] = None):
+        self.request = request
+        self.model = model
+        self.x = x  # x[employee_idx, day_idx, shift_idx] -> BoolVar
+        # x_index[employee_idx, day_idx, shift_idx] -> index of the variable in the model / solution
+        self.x_index = x_index
+        self.worked = worked  # worked[employee_idx, day_idx] -> BoolVar
+        self.employees = employees
+        self.days_list = days_list
+        self.full_time_hours = full_time_hours
+        self.deviations = deviations
+        self.meta = meta
+        # builder inputs, kept for model captures (see services.schedule_capture)
+        self.previous = previous
+        self.boundary = boundary
+        self.targets = targets
+
+
+class ScheduleModelBuilder:
+    """
+    Builds the CP-SAT model of one month.
+
+    Decision variables are kept in a dense array `x[e, di, s]` (employee,
+    scheduled day index, shift) and every linear constraint is created in one
+    call with `LinearExpr.Sum` / `LinearExpr.WeightedSum` over a slice of it.
+    Python's `sum()` over generators creates an intermediate expression per
+    term and the tuple-keyed dict lookups add up for large rosters.
+
+    Does not touch the database or FastAPI, so it can be used from worker
+    processes and offline tools.
+    """
+
+    def __init__(self, request, employees: List[Employee], days_list: List[int],
+                 full_time_hours: int, previous: Optional[dict] = None, symmetry_breaking: bool = True,
+                 targets: Optional[List[int]] = None, boundary: Optional[dict] = None):
+        self.request = request
+        self.employees = employees
+        self.shifts = request.shifts
+        self.rules = request.rules
+        self.days_list = days_list
+        self.full_time_hours = full_time_hours
+        self.previous = previous
+        self.symmetry_breaking = symmetry_breaking
+        # hour target per employee; defaults to employment_fraction * full_time_hours
+        if targets is None:
+            targets = [int(round(emp.employment_fraction * full_time_hours)) for emp in employees]
+        self.targets = targets
+        # assignment in front of days_list (rest / consecutive-days rules); defaults to `previous`
+        self.boundary = boundary if boundary is not None else previous
+
+        self.model = cp_model.CpModel()
+        self.E = len(employees)
+        self.D = len(days_list)
+        self.S = len(self.shifts)
+        self.x = np.empty((self.E, self.D, self.S), dtype=object)
+        self.x_index = np.empty((self.E, self.D, self.S), dtype=np.int64)
+        self.worked = np.empty((self.E, self.D), dtype=object)
+
+    def build(self) -> ScheduleModel:
+        self.add_variables()
+        self.add_coverage()
+        self.add_one_shift_per_day()
+        self.add_min_rest()
+        self.add_max_consecutive_days()
+
+        warm_start_meta = {"used": False}
+        if self.previous:
+            warm_start_meta = self.apply_previous_state(self.previous)
+        if self.boundary:
+            warm_start_meta["boundary_constraints"] = self.add_boundary_state(self.boundary)
+
+        deviations, max_hours_per_employee = self.add_hours_deviation()
+        penalty_vars, penalty_weights, day_off_meta = self.add_day_off_preferences()
+        symmetry_meta = self.add_symmetry_breaking() if self.symmetry_breaking else {"used": False}
+
+        # Minimize the sum of hourly deviations across all employees plus day-off penalties
+        self.model.Minimize(cp_model.LinearExpr.WeightedSum(
+            deviations + penalty_vars,
+            [W_HOURS] * len(deviations) + penalty_weights,
+        ))
+
+        meta = {
+            "days_in_month": calendar.monthrange(self.request.year, self.request.month)[1],
+            "scheduled_days_count": self.D,
+            "full_time_hours_used": self.full_time_hours,
+            "max_hours_per_employee": max_hours_per_employee,
+            "preferences": day_off_meta,
+            "warm_start": warm_start_meta,
+            "symmetry": symmetry_meta,
+        }
+        return ScheduleModel(self.request, self.model, self.x, self.worked, self.employees, self.days_list,
+                             self.full_time_hours, deviations, meta, self.x_index,
+                             previous=self.previous, boundary=self.boundary, targets=self.targets)
+
+    def add_variables(self) -> None:
+        # x[employee, day_index, shift] -> boolean decision variable
+        new_bool_var = self.model.NewBoolVar
+        variables = (
+            new_bool_var(f"x_e{e}_d{di}_s{s}")
+            for e in range(self.E)
+            for di in range(self.D)
+            for s in range(self.S)
+        )
+        self.x = np.fromiter(variables, dtype=object, count=self.E * self.D * self.S).reshape(
+            (self.E, self.D, self.S)
+        )
+        # created one after another, so their indexes are consecutive
+        first = self.x.flat[0].Index() if self.x.size else 0
+        self.x_index = np.arange(first, first + self.x.size, dtype=np.int64).reshape(self.x.shape)
+
+    def add_coverage(self) -> None:
+        """Ensure required number of employees per shift per day."""
+        for di in range(self.D):
+            for s_idx, shift in enumerate(self.shifts):
+                self.model.Add(cp_model.LinearExpr.Sum(self.x[:, di, s_idx].tolist()) == shift.required)
+
+    def add_one_shift_per_day(self) -> None:
+        """
+        Max one shift per day per employee.
+
+        Also defines the shared indicator worked[e, di] == sum_s x[e, di, s] as a
+        single exactly-one over (shifts of the day, day off), so the rest and
+        consecutive-days rules can refer to one literal instead of S terms.
+        """
+        new_bool_var = self.model.NewBoolVar
+        worked = (new_bool_var(f"w_e{e}_d{di}") for e in range(self.E) for di in range(self.D))
+        self.worked = np.fromiter(worked, dtype=object, count=self.E * self.D).reshape((self.E, self.D))
+        for e in range(self.E):
+            for di in range(self.D):
+                self.model.AddExactlyOne(self.x[e, di, :].tolist() + [self.worked[e, di].Not()])
+
+    def forbidden_transitions(self) -> Dict[int, List[int]]:
+        """
+        Shifts that can't follow each shift on the next scheduled day (minimum rest time).
+
+        Computed once per shift pair and shared by all employees and days.
+        """
+        forbidden = {}
+        for s1_idx, sh1 in enumerate(self.shifts):
+            next_shifts = [
+                s2_idx for s2_idx, sh2 in enumerate(self.shifts)
+                if compute_rest_hours(sh1.start_hour, sh1.length, sh2.start_hour) < self.rules.min_rest_hours
+            ]
+            if next_shifts:
+                forbidden[s1_idx] = next_shifts
+        return forbidden
+
+    def add_min_rest(self) -> None:
+        """
+        Minimum rest time between shifts (checking consecutive days in days_list).
+
+        One constraint per (employee, day, shift) instead of one per forbidden
+        pair: x[e, di, s1] + sum(x[e, di + 1, s2] for forbidden s2) <= 1, which is
+        equivalent because at most one of the next day's shifts can be worked.
+        When every shift is forbidden the next day's `worked` literal is used.
+        """
+        forbidden = self.forbidden_transitions()
+        for e in range(self.E):
+            for di in range(self.D - 1):
+                for s1_idx, next_shifts in forbidden.items():
+                    if len(next_shifts) == self.S:
+                        following = [self.worked[e, di + 1]]
+                    else:
+                        following = self.x[e, di + 1, next_shifts].tolist()
+                    self.model.AddAtMostOne([self.x[e, di, s1_idx]] + following)
+
+    def boundary_runs(self) -> List[int]:
+        """Days worked in a row at the end of the boundary, per employee (0 without one)."""
+        if not self.boundary:
+            return [0] * self.E
+        rows = dict(zip(self.boundary["employee_ids"], self.boundary["assignment"]))
+        return [sum(1 for _ in takewhile(lambda s: s >= 0, reversed(rows.get(emp.id) or [])))
+                for emp in self.employees]
+
+    def add_max_consecutive_days(self) -> None:
+        """
+        Maximum consecutive working days (optional).
+
+        A run-length counter run[e, di] in 0..M per employee and day, with
+        run[e, di] >= run[e, di - 1] + 1 whenever worked[e, di]: one two-term
+        constraint per employee and day instead of an (M + 1)-term window per
+        window start. The counter starts from the days worked at the end of
+        the boundary, so the rule continues over it without extra constraints.
+        """
+        M = self.rules.max_consecutive_days
+        if not M:
+            return
+        new_int_var = self.model.NewIntVar
+        for e, boundary_run in enumerate(self.boundary_runs()):
+            # the boundary counts up to M days, like a window reaching into it
+            run = min(boundary_run, M)
+            if run + self.D <= M:
+                continue
+            for di in range(self.D):
+                next_run = new_int_var(0, M, f"run_e{e}_d{di}")
+                self.model.Add(next_run >= run + 1).OnlyEnforceIf(self.worked[e, di])
+                run = next_run
+
+    def apply_previous_state(self, previous: dict) -> dict:
+        """
+        Hints the model with the preceding month's schedule.
+
+        Every day is hinted with the shift the employee worked on the same
+        weekday 4 (or 5) weeks earlier, matched by shift name. The boundary
+        rules are added separately by `add_boundary_state`.
+
+        Returns statistics for the response meta.
+        """
+        model = self.model
+        x = self.x
+        S = self.S
+        D = self.D
+
+        prev_days = previous["days"]
+        prev_rows = dict(zip(previous["employee_ids"], previous["assignment"]))
+        prev_day_pos = {day: pos for pos, day in enumerate(prev_days)}
+        prev_days_in_month = calendar.monthrange(previous["year"], previous["month"])[1]
+        shift_by_name = {sh.name: s_idx for s_idx, sh in enumerate(self.shifts)}
+        prev_to_new_shift = [shift_by_name.get(sh["name"]) for sh in previous["shifts"]]
+
+        # previous-month day (1-based) with the same weekday 4 or 5 weeks earlier
+        hint_source = []
+        for actual_day in self.days_list:
+            day = actual_day + 1
+            lookback = day - 28 if day <= 28 else day - 35
+            hint_source.append(prev_day_pos.get(prev_days_in_month + lookback))
+
+        hinted = 0
+        for e_idx, emp in enumerate(self.employees):
+            row = prev_rows.get(emp.id)
+            if not row:
+                continue
+            hinted += 1
+
+            for di in range(D):
+                pos = hint_source[di]
+                prev_s = row[pos] if pos is not None else -1
+                hint_s = prev_to_new_shift[prev_s] if prev_s >= 0 else None
+                for s in range(S):
+                    model.AddHint(x[e_idx, di, s], 1 if s == hint_s else 0)
+
+        return {
+            "used": True,
+            "previous_year": previous["year"],
+            "previous_month": previous["month"],
+            "hinted_employees": hinted,
+        }
+
+    def add_boundary_state(self, boundary: dict) -> int:
+        """
+        Continues the rest rule over the boundary in front of the first
+        scheduled day; `max_consecutive_days` continues over it through the
+        start of its run counters (see `add_max_consecutive_days`).
+
+        `boundary` has the shape of a month state (see
+        `ScheduleService.build_month_state`): `employee_ids`, `shifts` and
+        `assignment` rows ending right before `days_list[0]`, using the same
+        "consecutive scheduled days" semantics as inside a month.
+
+        Returns the number of added constraints.
+        """
+        model = self.model
+        x = self.x
+        if self.D == 0:
+            return 0
+
+        rows = dict(zip(boundary["employee_ids"], boundary["assignment"]))
+
+        # forbidden (last boundary shift -> first shift) transitions
+        forbidden_first = []
+        for sh1 in boundary["shifts"]:
+            forbidden_first.append([
+                s2_idx for s2_idx, sh2 in enumerate(self.shifts)
+                if compute_rest_hours(sh1["start_hour"], sh1["length"], sh2.start_hour) < self.rules.min_rest_hours
+            ])
+
+        boundary_constraints = 0
+        for e_idx, emp in enumerate(self.employees):
+            row = rows.get(emp.id)
+            if not row:
+                continue
+
+            # rest time between the last boundary day and day 0
+            last_s = row[-1]
+            if last_s >= 0:
+                for s2_idx in forbidden_first[last_s]:
+                    model.Add(x[e_idx, 0, s2_idx] == 0)
+                    boundary_constraints += 1
+
+        return boundary_constraints
+
+    def add_hours_deviation(self) -> Tuple[list, int]:
+        """
+        Adds dev_h >= |total_hours - target_hours| for every employee.
+
+        Returns the deviation variables and their upper bound.
+        """
+        # Determine theoretical upper bound for total hours to define variable domains
+        max_shift_len = max((int(sh.length) for sh in self.shifts), default=0)
+        max_hours_per_employee = self.D * max_shift_len
+
+        # shift length for every (day, shift) cell of one employee's row
+        hour_weights = [int(sh.length) for sh in self.shifts] * self.D
+
+        deviations = []
+        self.total_hours = []
+        for e_idx in range(self.E):
+            total_hours_expr = cp_model.LinearExpr.WeightedSum(self.x[e_idx].ravel().tolist(), hour_weights)
+            self.total_hours.append(total_hours_expr)
+
+            target_hours = self.targets[e_idx]
+
+            dev_h = self.model.NewIntVar(0, max(max_hours_per_employee, target_hours), f"dev_hours_e{e_idx}")
+
+            # Linearize absolute value constraint
+            self.model.Add(total_hours_expr - target_hours <= dev_h)
+            self.model.Add(target_hours - total_hours_expr <= dev_h)
+
+            deviations.append(dev_h)
+        return deviations, max_hours_per_employee
+
+    def add_day_off_preferences(self) -> Tuple[list, List[int], List[dict]]:
+        """
+        Soft penalties for working on requested days off.
+
+        Returns (variables, weights, meta) where the penalty is
+        sum(weight * variable) over worked[e, di] literals.
+        """
+        emp_id_to_idx = {emp.id: idx for idx, emp in enumerate(self.employees)}
+        actual_to_di = {actual_day: di for di, actual_day in enumerate(self.days_list)}
+
+        penalty_vars = []
+        penalty_weights = []
+        day_off_meta = []
+
+        for req in self.request.preferences or []:
+            # Support both Pydantic models and plain dicts
+            employee_id = getattr(req, "employee_id", None)
+            day_1based = getattr(req, "day", None)
+
+            if isinstance(req, dict):
+                employee_id = employee_id or req.get("employee_id")
+                day_1based = day_1based or req.get("day")
+
+            info = {
+                "employee_id": employee_id,
+                "day": day_1based,
+                "applied": False,
+                "reason": None
+            }
+
+            # Validation
+            if not employee_id or not day_1based:
+                info["reason"] = "invalid_payload"
+                day_off_meta.append(info)
+                continue
+
+            e_idx = emp_id_to_idx.get(int(employee_id))
+            di = actual_to_di.get(int(day_1based) - 1)
+
+            if e_idx is None:
+                info["reason"] = "employee_not_found"
+                day_off_meta.append(info)
+                continue
+
+            if di is None:
+                # The day is not scheduled (e.g., it's a non-working day based on the selected work mode)
+                info["reason"] = "day_not_scheduled_by_mode"
+                day_off_meta.append(info)
+                continue
+
+            req_priority = getattr(req, "priority", None)
+            if isinstance(req, dict):
+                req_priority = req_priority if req_priority is not None else req.get("priority")
+
+            try:
+                req_priority = int(req_priority) if req_priority is not None else DEFAULT_DAY_OFF_PRIORITY
+            except Exception:
+                req_priority = DEFAULT_DAY_OFF_PRIORITY
+
+            # penalty * (0/1: whether the employee works on that day)
+            penalty_vars.append(self.worked[e_idx, di])
+            penalty_weights.append(req_priority)
+
+            info["applied"] = True
+            info["reason"] = "soft_priority_added"
+            day_off_meta.append(info)
+
+        return penalty_vars, penalty_weights, day_off_meta
+
+    def symmetry_classes(self) -> List[List[int]]:
+        """
+        Groups employees the model can't tell apart.
+
+        Two employees are interchangeable when they have the same hour target,
+        no day-off preferences and the same boundary state. Returns the classes with at least
+        two members (employee indexes).
+        """
+        preferred = set()
+        for req in self.request.preferences or []:
+            employee_id = req.get("employee_id") if isinstance(req, dict) else getattr(req, "employee_id", None)
+            if employee_id is not None:
+                preferred.add(int(employee_id))
+
+        boundary_rows = {}
+        if self.boundary:
+            boundary_rows = dict(zip(self.boundary["employee_ids"], self.boundary["assignment"]))
+        tail = max(self.rules.max_consecutive_days or 0, 1)
+
+        classes: Dict[tuple, List[int]] = {}
+        for e_idx, emp in enumerate(self.employees):
+            if emp.id in preferred:
+                continue
+            boundary = tuple(boundary_rows.get(emp.id, [])[-tail:])
+            classes.setdefault((self.targets[e_idx], boundary), []).append(e_idx)
+        return [members for members in classes.values() if len(members) > 1]
+
+    def add_symmetry_breaking(self) -> dict:
+        """
+        Orders interchangeable employees by a weighted-sum key of their assignment vectors.
+
+        The key is the employee's worked hours (x weighted by shift length).
+        Within each class consecutive members must satisfy
+        total_hours[a] >= total_hours[b]: one constraint per member, so the
+        ordering grows linearly with the class and applies to rosters of any
+        size. Any schedule can be permuted inside a class to meet this, so no
+        optimum is lost; the solver just stops proving the same bound for
+        permuted copies.
+
+        A full lexicographic order (chained per-day comparisons) is stronger
+        on paper but its large coefficients / reified ties slow the search
+        down on every roster size, so the hours key is kept.
+        """
+        classes = self.symmetry_classes()
+        meta = {
+            "used": False,
+            "classes": len(classes),
+            "interchangeable_employees": sum(len(members) for members in classes),
+            "ordered_pairs": 0,
+        }
+        for members in classes:
+            for a_idx, b_idx in zip(members, members[1:]):
+                self.model.Add(self.total_hours[a_idx] >= self.total_hours[b_idx])
+                meta["ordered_pairs"] += 1
+        meta["used"] = meta["ordered_pairs"] > 0
+        return meta
@@ -0,0 +1,462 @@
+import calendar
+import math
+import time
+from concurrent.futures import Future
+from datetime import date, timedelta
+from itertools import takewhile
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from ortools.sat.python import cp_model
+
+import models
+from core import metrics
+from core.logging_config import get_logger
+from core.settings import settings
+from schemas.schedule import Employee, ScheduleRequest, SchedulePlanRequest, SolverBudget
+from services.schedule_cache import schedule_cache, schedule_cache_key
+from services.schedule_jobs import ScheduleJobError, schedule_jobs
+from services.schedule_model import compute_rest_hours
+from services.schedule_service import ScheduleService, solve_slots
+from services.schedule_store import ScheduleStore
+
+logger = get_logger(__name__)
+
+
+class PlanSegment:
+    """One calendar month of a plan, cut to the plan's first and last day."""
+
+    def __init__(self, year: int, month: int, first_day: int, last_day: int):
+        self.year = year
+        self.month = month
+        self.first_day = first_day
+        self.last_day = last_day
+
+    @property
+    def full_month(self) -> bool:
+        return self.first_day == 1 and self.last_day == calendar.monthrange(self.year, self.month)[1]
+
+    @property
+    def day_range(self) -> Optional[Tuple[int, int]]:
+        return None if self.full_month else (self.first_day, self.last_day)
+
+    @property
+    def label(self) -> str:
+        return f"{self.year}-{self.month:02d}"
+
+
+def plan_segments(plan: SchedulePlanRequest) -> List[PlanSegment]:
+    """Splits the plan's horizon into calendar months."""
+    try:
+        start = date(plan.start_year, plan.start_month, plan.start_day)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from None
+
+    if plan.months is not None:
+        end_index = plan.start_year * 12 + plan.start_month - 1 + plan.months - 1
+        end_year, end_month = divmod(end_index, 12)
+        end = date(end_year, end_month + 1, calendar.monthrange(end_year, end_month + 1)[1])
+    else:
+        end = start + timedelta(weeks=plan.weeks) - timedelta(days=1)
+
+    segments = []
+    year, month, first_day = start.year, start.month, start.day
+    while (year, month) <= (end.year, end.month):
+        days_in_month = calendar.monthrange(year, month)[1]
+        last_day = end.day if (year, month) == (end.year, end.month) else days_in_month
+        segments.append(PlanSegment(year, month, first_day, last_day))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        first_day = 1
+    return segments
+
+
+def segment_request(plan: SchedulePlanRequest, segment: PlanSegment) -> ScheduleRequest:
+    preferences = [
+        {"employee_id": p.employee_id, "day": p.day.day, "priority": p.priority}
+        for p in plan.preferences or []
+        if (p.day.year, p.day.month) == (segment.year, segment.month)
+        and segment.first_day <= p.day.day <= segment.last_day
+    ]
+    return ScheduleRequest(
+        year=segment.year,
+        month=segment.month,
+        shifts=plan.shifts,
+        rules=plan.rules,
+        holidays_mode=plan.holidays_mode,
+        company_work_mode=plan.company_work_mode,
+        preferences=preferences,
+        warm_start=plan.warm_start,
+        decomposition=plan.decomposition,
+        solver=plan.solver,
+    )
+
+
+def boundary_violations(rules, before: dict, after: dict) -> List[int]:
+    """
+    Ids of employees whose schedule breaks the rest or consecutive-days rule
+    across the boundary between two month states.
+    """
+    M = rules.max_consecutive_days
+    before_rows = dict(zip(before["employee_ids"], before["assignment"]))
+    violating = []
+    for employee_id, row in zip(after["employee_ids"], after["assignment"]):
+        prev_row = before_rows.get(employee_id)
+        if not prev_row or not row:
+            continue
+
+        last_s, first_s = prev_row[-1], row[0]
+        if last_s >= 0 and first_s >= 0:
+            sh1, sh2 = before["shifts"][last_s], after["shifts"][first_s]
+            if compute_rest_hours(sh1["start_hour"], sh1["length"], sh2["start_hour"]) < rules.min_rest_hours:
+                violating.append(employee_id)
+                continue
+
+        if M:
+            worked_before = sum(1 for _ in takewhile(lambda s: s >= 0, reversed(prev_row)))
+            worked_after = sum(1 for _ in takewhile(lambda s: s >= 0, row))
+            if worked_before + worked_after > M:
+                violating.append(employee_id)
+    return violating
+
+
+def fix_budget(budget: Optional[SolverBudget]) -> SolverBudget:
+    """The month's solver budget, cut to `schedule_plan_fix_time_limit_seconds`."""
+    budget = budget or SolverBudget()
+    time_limit = settings.schedule_plan_fix_time_limit_seconds
+    if budget.time_limit_seconds is not None:
+        time_limit = min(time_limit, budget.time_limit_seconds)
+    return budget.model_copy(update={"time_limit_seconds": time_limit})
+
+
+def run_plan_fix(request_data: dict, roster_data: List[dict], segment: PlanSegment, before: dict, after: dict,
+                 targets: Optional[List[int]], tail: int, repair: bool) -> Optional[Tuple[dict, dict, dict]]:
+    """Entry point of `SchedulePlanService.fix_month` in a worker process of the job pool."""
+    request = ScheduleRequest.model_validate(request_data)
+    employees = [Employee.model_validate(e) for e in roster_data]
+    try:
+        return SchedulePlanService(ScheduleService(None)).fix_month(segment, request, employees, before, after,
+                                                                     targets, tail, repair)
+    except HTTPException as exc:
+        raise ScheduleJobError(str(exc.detail)) from None
+
+
+class SchedulePlanService:
+    """
+    Generates several consecutive months at once.
+
+    Months are solved as independent subproblems in the processes of the
+    schedule job pool (`schedule_jobs`), so a year takes about as long as
+    its slowest month when the pool has workers to spare:
+        - every month's hour targets are apportioned from the plan's
+          cumulative target (see `apportioned_targets`), so months solved
+          without knowing each other already add up to the plan's hours,
+        - only the first month knows its predecessor (the stored state, with
+          warm start); the others are reconciled with the month before them
+          afterwards, all of them at once in the pool, with a short budget
+          (see `reconcile`).
+    Without parallel workers the months are solved one after another, each
+    starting from the end of the previous one with the balance carried.
+    """
+
+    def __init__(self, service: ScheduleService):
+        self.service = service
+
+    def generate_plan(self, plan: SchedulePlanRequest, user: models.User) -> dict:
+        started = time.perf_counter()
+        segments = plan_segments(plan)
+        requests = [segment_request(plan, segment) for segment in segments]
+        employees = self.service.load_roster(user)
+
+        previous = None
+        if segments[0].first_day == 1:
+            previous = self.service.load_previous_state(user.employer_id, requests[0])
+
+        processes = min(len(segments), schedule_jobs.max_workers)
+        reconcile_seconds = 0.0
+        if processes > 1:
+            targets = self.apportioned_targets(segments, requests, employees)
+            solved = self.solve_parallel(segments, requests, employees, previous, targets)
+            reconcile_started = time.perf_counter()
+            repairs = self.reconcile(segments, requests, employees, solved, targets)
+            reconcile_seconds = round(time.perf_counter() - reconcile_started, 3)
+        else:
+            # nothing runs in parallel, so every month can start from the real end of the previous one
+            solved = self.solve_sequential(segments, requests, employees, previous)
+            repairs = []
+
+        store = ScheduleStore(self.service.db)
+        for i, (segment, request, (result, state)) in enumerate(zip(segments, requests, solved)):
+            if segment.full_month:
+                schedule_cache.save_month_state(user.employer_id, segment.year, segment.month, state)
+                request_hash = schedule_cache_key(request, employees, previous if i == 0 else solved[i - 1][1])
+                store.save(user.employer_id, request_hash, result, state)
+
+        months = []
+        summary = {}
+        for segment, (result, _) in zip(segments, solved):
+            months.append({
+                "year": segment.year,
+                "month": segment.month,
+                "first_day": segment.first_day,
+                "last_day": segment.last_day,
+                **result,
+            })
+            for name, stats in result["summary"].items():
+                total = summary.setdefault(name, {"shifts": 0, "hours": 0, "target": 0})
+                for key in total:
+                    total[key] += stats[key]
+        for total in summary.values():
+            total["balance"] = total["hours"] - total["target"]
+
+        elapsed = round(time.perf_counter() - started, 3)
+        logger.info(f"Plan of {len(segments)} months for employer {user.employer_id} generated in {elapsed}s "
+                    f"({processes} processes, {len(repairs)} repairs in {reconcile_seconds}s)")
+        return {
+            "months": months,
+            "summary": summary,
+            "meta": {
+                "months": len(segments),
+                "processes": processes,
+                "warm_start": previous is not None,
+                "repairs": repairs,
+                "reconcile_seconds": reconcile_seconds,
+                "elapsed_seconds": elapsed,
+            },
+        }
+
+    def collect(self, labels: List[str], futures: List[Future]) -> list:
+        """
+        Waits for the pool's results of the plan's months. The first failure
+        cancels the months still queued: a month without a solution is a bad
+        request (400), a broken, cancelled or otherwise failed worker a
+        temporary failure (503).
+        """
+        results = []
+        for label, future in zip(labels, futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                for pending in futures:
+                    pending.cancel()
+                if isinstance(exc, ScheduleJobError):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{label}: {exc}") from None
+                logger.exception(f"{label}: plan month failed in the schedule job pool")
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail=f"{label}: schedule worker failed, try again later") from None
+        return results
+
+    def solve_parallel(self, segments: List[PlanSegment], requests: List[ScheduleRequest],
+                       employees: List[Employee], previous: Optional[dict],
+                       targets: List[List[int]]) -> List[Tuple[dict, dict]]:
+        roster_data = [e.model_dump() for e in employees]
+        futures = schedule_jobs.submit_segments([
+            (request.model_dump(), roster_data, previous if i == 0 else None, segment.day_range, targets[i])
+            for i, (segment, request) in enumerate(zip(segments, requests))
+        ])
+        solved = self.collect([segment.label for segment in segments], futures)
+        for result, _ in solved:
+            metrics.observe_worker_solves(result)
+        return solved
+
+    def solve_sequential(self, segments: List[PlanSegment], requests: List[ScheduleRequest],
+                         employees: List[Employee], previous: Optional[dict]) -> List[Tuple[dict, dict]]:
+        solved = []
+        balance = [0] * len(employees)
+        for segment, request in zip(segments, requests):
+            targets = self.month_targets(segment, request, employees)
+            try:
+                result, state = self.service.solve_schedule(request, employees, previous, segment.day_range,
+                                                            targets=self.carried_targets(targets, balance))
+            except HTTPException as exc:
+                raise HTTPException(status_code=exc.status_code, detail=f"{segment.label}: {exc.detail}") from None
+            solved.append((result, state))
+            balance = self.add_balance(balance, state, targets)
+            previous = state if request.warm_start else None
+        return solved
+
+    def month_targets(self, segment: PlanSegment, request: ScheduleRequest, employees: List[Employee]) -> List[int]:
+        """The employees' own hour targets for the segment (as reported in its summary)."""
+        _, full_time_hours = self.service.scheduled_days(request, segment.day_range)
+        return [int(round(e.employment_fraction * full_time_hours)) for e in employees]
+
+    def apportioned_targets(self, segments: List[PlanSegment], requests: List[ScheduleRequest],
+                            employees: List[Employee]) -> List[List[int]]:
+        """
+        Hour targets of every segment, apportioned from the employees'
+        cumulative target in multiples of the shifts' common length: with 8h
+        shifts, months of 126h become 128h, 120h, 128h, ... so each one can be
+        met exactly and together they add up to the plan's target.
+        """
+        grain = math.gcd(*(int(sh.length) for sh in requests[0].shifts))
+        own = [self.month_targets(segment, request, employees) for segment, request in zip(segments, requests)]
+        if grain <= 1:
+            return own
+        apportioned = []
+        cumulative = [0] * len(employees)
+        rounded_before = [0] * len(employees)
+        for targets in own:
+            cumulative = [total + target for total, target in zip(cumulative, targets)]
+            rounded = [grain * ((total + grain // 2) // grain) for total in cumulative]
+            apportioned.append([after - before for after, before in zip(rounded, rounded_before)])
+            rounded_before = rounded
+        return apportioned
+
+    def carried_targets(self, targets: List[int], balance: List[int]) -> List[int]:
+        """Hour targets that make up for the balance of the months before."""
+        return [max(0, target - carried) for target, carried in zip(targets, balance)]
+
+    def add_balance(self, balance: List[int], state: dict, targets: List[int]) -> List[int]:
+        """The cumulative balance after the segment solved as `state` against `targets`."""
+        lengths = [int(sh["length"]) for sh in state["shifts"]]
+        return [carried + sum(lengths[s] for s in row if s >= 0) - target
+                for carried, row, target in zip(balance, state["assignment"], targets)]
+
+    def reconcile(self, segments: List[PlanSegment], requests: List[ScheduleRequest], employees: List[Employee],
+                  solved: List[Tuple[dict, dict]], targets: List[List[int]]) -> List[dict]:
+        """
+        Reconciles the months solved in parallel with the months before them.
+
+        The fixes are worked out from the parallel solution alone, so they
+        run at once in the job pool (see `fix_month`):
+            - a month after a cumulative balance of at least one shift is
+              re-solved with targets that make up for it; the balance is then
+              counted as made up for,
+            - otherwise a month whose boundary breaks the rest or
+              consecutive-days rule gets its first days repaired.
+        Every fix keeps the last days of its month as solved, so the boundary
+        with the next month (checked against them) holds whatever the next
+        month's fix does.
+        """
+        fixes = []
+        tail = (requests[0].rules.max_consecutive_days or 0) + 1
+        balance = self.add_balance([0] * len(employees), solved[0][1], targets[0])
+        for k in range(1, len(segments)):
+            request = requests[k]
+            # a balance below the shortest shift can't be made up for
+            shortest = min((int(sh.length) for sh in request.shifts), default=0)
+            carried = sum(1 for hours in balance if shortest and abs(hours) >= shortest)
+            violating = boundary_violations(request.rules, solved[k - 1][1], solved[k][1])
+            if carried or violating:
+                fixes.append((k, carried, len(violating),
+                              self.carried_targets(targets[k], balance) if carried else None))
+            if carried:
+                balance = [0] * len(employees)
+            else:
+                balance = self.add_balance(balance, solved[k][1], targets[k])
+        if not fixes:
+            return []
+
+        roster_data = [e.model_dump() for e in employees]
+        futures = schedule_jobs.submit_segments([
+            (requests[k].model_dump(), roster_data, segments[k], solved[k - 1][1], solved[k][1], carried_targets,
+             tail if k < len(segments) - 1 else 0, bool(violating))
+            for k, _, violating, carried_targets in fixes
+        ], fn=run_plan_fix)
+        fixed = self.collect([segments[k].label for k, *_ in fixes], futures)
+
+        repairs = []
+        for (k, carried, violating, _), outcome in zip(fixes, fixed):
+            if outcome is None:
+                continue
+            result, state, record = outcome
+            metrics.observe_worker_solves(result)
+            solved[k] = (result, state)
+            if record.get("rebalanced"):
+                repairs.append({"month": segments[k].label, "employees": carried, "rebalanced": True})
+            else:
+                repairs.append({"month": segments[k].label, "employees": violating, **record})
+        return repairs
+
+    def fix_month(self, segment: PlanSegment, request: ScheduleRequest, employees: List[Employee],
+                  before: dict, after: dict, targets: Optional[List[int]], tail: int,
+                  repair: bool) -> Optional[Tuple[dict, dict, dict]]:
+        """
+        Re-solves a month of a plan against the month before it, within
+        `schedule_plan_fix_time_limit_seconds`; `after` is its parallel
+        solution and its last `tail` days stay as they were.
+
+        With `targets` the whole month is re-solved with them (`rebalance`);
+        when that finds nothing and the boundary is broken (`repair`), the
+        first days are repaired instead. Returns (result, state, record of
+        the fix), or None when the month is kept as it was.
+        """
+        request = request.model_copy(update={"solver": fix_budget(request.solver)})
+        if tail >= len(after["days"]):
+            tail = 0
+        if targets is not None:
+            rebalanced = self.rebalance(segment, request, employees, before, after, targets, tail)
+            if rebalanced is not None:
+                return (*rebalanced, {"rebalanced": True})
+        if not repair:
+            return None
+        result, state, window = self.repair(segment, request, employees, before, after, tail)
+        return result, state, {"repaired_days": window}
+
+    def start_from(self, ctx, request: ScheduleRequest, after: dict, free_days: int) -> None:
+        """Hints the first `free_days` days of `after` to the model and fixes the other ones."""
+        for e_idx, row in enumerate(after["assignment"]):
+            for di, assigned in enumerate(row):
+                for s in range(len(request.shifts)):
+                    value = 1 if s == assigned else 0
+                    if di < free_days:
+                        ctx.model.AddHint(ctx.x[e_idx, di, s], value)
+                    else:
+                        ctx.model.Add(ctx.x[e_idx, di, s] == value)
+
+    def rebalance(self, segment: PlanSegment, request: ScheduleRequest, employees: List[Employee],
+                  before: dict, after: dict, targets: List[int], tail: int) -> Optional[Tuple[dict, dict]]:
+        """
+        Re-solves a month with carried hour targets, the month before it as
+        boundary state and its parallel solution as hint. None when no
+        solution is found within the time limit.
+        """
+        ctx = self.service.build_model(request, employees, boundary=before, day_range=segment.day_range,
+                                       targets=targets)
+        self.start_from(ctx, request, after, len(after["days"]) - tail)
+
+        with solve_slots.running():
+            solver = self.service.create_solver(request.solver)
+            result = solver.Solve(ctx.model)
+        stats = self.service.solve_statistics(solver, ctx, result)
+        if result not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            logger.warning(f"{segment.label}: carried hour balance not applied ({solver.StatusName(result)})")
+            return None
+        ctx.meta["solver"] = self.service.solver_meta(solver)
+        ctx.meta["status"] = solver.StatusName(result)
+        ctx.meta["objective"] = solver.ObjectiveValue()
+        ctx.meta["solver_stats"] = [stats]
+        ctx.meta["carried_targets"] = targets
+        return self.service.format_solution(ctx, solver.ResponseProto().solution)
+
+    def repair(self, segment: PlanSegment, request: ScheduleRequest, employees: List[Employee],
+               before: dict, after: dict, tail: int = 0) -> Tuple[dict, dict, int]:
+        """
+        Re-solves the first `window` scheduled days of a month against the
+        month before it, keeping the remaining days as they were solved. The
+        window grows up to the last `tail` days.
+        """
+        days = len(after["days"]) - tail
+        window = min(days, max(request.rules.max_consecutive_days or 0, 1) + 1)
+        while True:
+            ctx = self.service.build_model(request, employees, boundary=before, day_range=segment.day_range)
+            self.start_from(ctx, request, after, window)
+
+            with solve_slots.running():
+                solver = self.service.create_solver(request.solver)
+                result = solver.Solve(ctx.model)
+            stats = self.service.solve_statistics(solver, ctx, result)
+            if result in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                ctx.meta["solver"] = self.service.solver_meta(solver)
+                ctx.meta["status"] = solver.StatusName(result)
+                ctx.meta["objective"] = solver.ObjectiveValue()
+                ctx.meta["solver_stats"] = [stats]
+                ctx.meta["repaired_days"] = window
+                result, state = self.service.format_solution(ctx, solver.ResponseProto().solution)
+                return result, state, window
+
+            if window >= days:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{segment.label}: Can't reconcile the schedule with the previous month"
+                )
+            window = min(days, window * 2)
@@ -0,0 +1,169 @@
+"""
+Re-solves a captured schedule model (see `services.schedule_capture`) with
+other solver parameters, and prints how every run compares to the
+captured solve.
+
+Runs are the combinations of --workers, --seeds and --branching (each
+defaults to the captured value); --param sets any other CP-SAT parameter
+(text format, e.g. linearization_level=2) on all runs. Per run: status,
+time to the first solution, wall time, number of improving solutions,
+final objective, best bound and relative gap.
+
+Works on the capture files alone: no FastAPI app, settings or database.
+
+Usage (from backend/user-service/app):
+    python -m services.schedule_replay captures/20250301T020000-2025-03-300e-ab12.json
+    python -m services.schedule_replay capture.json --time-limit 60 --workers 8 16 --seeds 1 2 3
+    python -m services.schedule_replay capture.pb --branching AUTOMATIC_SEARCH PORTFOLIO_WITH_QUICK_RESTART_SEARCH
+    python -m services.schedule_replay capture.json --rebuild --param linearization_level=2 --output runs.json
+"""
+import argparse
+import itertools
+import json
+from pathlib import Path
+from typing import List, Optional
+
+from google.protobuf import text_format
+from ortools.sat import sat_parameters_pb2
+from ortools.sat.python import cp_model
+
+from services.schedule_capture import load_model, solver_parameters
+
+BRANCHINGS = list(sat_parameters_pb2.SatParameters.SearchBranching.keys())
+
+
+class ReplayProgress(cp_model.CpSolverSolutionCallback):
+    """Time of the first solution and number of improving solutions."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_solution_seconds: Optional[float] = None
+        self.solutions = 0
+
+    def on_solution_callback(self):
+        if self.first_solution_seconds is None:
+            self.first_solution_seconds = self.WallTime()
+        self.solutions += 1
+
+
+def relative_gap(objective: float, bound: float) -> float:
+    # CP-SAT's definition, see ScheduleService.solve_statistics
+    return abs(objective - bound) / max(1.0, abs(objective))
+
+
+def replay(model: cp_model.CpModel, parameters: sat_parameters_pb2.SatParameters) -> dict:
+    solver = cp_model.CpSolver()
+    solver.parameters.CopyFrom(parameters)
+    progress = ReplayProgress()
+    status = solver.Solve(model, progress)
+    feasible = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    return {
+        "workers": solver.parameters.num_workers,
+        "seed": solver.parameters.random_seed,
+        "branching": sat_parameters_pb2.SatParameters.SearchBranching.Name(solver.parameters.search_branching),
+        "status": solver.StatusName(status),
+        "first_solution_seconds": progress.first_solution_seconds,
+        "wall_seconds": solver.WallTime(),
+        "solutions": progress.solutions,
+        "objective": solver.ObjectiveValue() if feasible else None,
+        "best_bound": solver.BestObjectiveBound() if feasible else None,
+        "gap": relative_gap(solver.ObjectiveValue(), solver.BestObjectiveBound()) if feasible else None,
+        "conflicts": solver.NumConflicts(),
+        "branches": solver.NumBranches(),
+    }
+
+
+def run_parameters(base: sat_parameters_pb2.SatParameters, args: argparse.Namespace) -> List[sat_parameters_pb2.SatParameters]:
+    """Every combination of the overridden parameters, on top of the captured ones."""
+    base = sat_parameters_pb2.SatParameters.FromString(base.SerializeToString())
+    if args.time_limit is not None:
+        base.max_time_in_seconds = args.time_limit
+    for assignment in args.param:
+        name, _, value = assignment.partition("=")
+        text_format.Merge(f"{name.strip()}: {value.strip()}", base)
+
+    runs = []
+    for workers, seed, branching in itertools.product(args.workers or [None], args.seeds or [None],
+                                                      args.branching or [None]):
+        parameters = sat_parameters_pb2.SatParameters.FromString(base.SerializeToString())
+        if workers is not None:
+            parameters.num_workers = workers
+        if seed is not None:
+            parameters.random_seed = seed
+        if branching is not None:
+            parameters.search_branching = sat_parameters_pb2.SatParameters.SearchBranching.Value(branching)
+        runs.append(parameters)
+    return runs
+
+
+def _cell(value, digits: int = 2) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.{digits}f}"
+    return str(value)
+
+
+def print_table(rows: List[dict]) -> None:
+    columns = [
+        ("run", "run", 0), ("workers", "workers", 0), ("seed", "seed", 0), ("branching", "branching", 0),
+        ("status", "status", 0), ("first s", "first_solution_seconds", 2), ("wall s", "wall_seconds", 2),
+        ("sols", "solutions", 0), ("objective", "objective", 1), ("bound", "best_bound", 1), ("gap", "gap", 4),
+    ]
+    cells = [[_cell(row.get(key), digits) for _, key, digits in columns] for row in rows]
+    widths = [max(len(title), *(len(line[i]) for line in cells)) for i, (title, _, _) in enumerate(columns)]
+    header = "  ".join(title.rjust(width) for (title, _, _), width in zip(columns, widths))
+    print(header)
+    print("-" * len(header))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", type=Path, help="captured model (.pb) or bundle (.json)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the model from the bundle with the current model builder")
+    parser.add_argument("--time-limit", type=float, help="seconds per run (default: the captured limit)")
+    parser.add_argument("--workers", type=int, nargs="+", help="num_workers values to try")
+    parser.add_argument("--seeds", type=int, nargs="+", help="random_seed values to try")
+    parser.add_argument("--branching", choices=BRANCHINGS, nargs="+", help="search_branching values to try")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="any other CP-SAT parameter, for all runs (repeatable)")
+    parser.add_argument("--output", type=Path, help="also write the runs as JSON")
+    args = parser.parse_args()
+
+    model, bundle = load_model(args.capture, rebuild=args.rebuild)
+    proto = model.Proto()
+    print(f"{args.capture}: {len(proto.variables)} variables, {len(proto.constraints)} constraints"
+          f"{' (rebuilt)' if args.rebuild else ''}")
+
+    rows = []
+    if bundle is not None:
+        captured = bundle["stats"]
+        parameters = solver_parameters(bundle)
+        rows.append({
+            "run": "captured",
+            "workers": parameters.num_workers,
+            "seed": parameters.random_seed,
+            "branching": sat_parameters_pb2.SatParameters.SearchBranching.Name(parameters.search_branching),
+            "status": captured["status"],
+            "wall_seconds": captured["wall_seconds"],
+            "objective": captured["objective"],
+            "best_bound": captured["best_bound"],
+            "gap": captured["gap"],
+        })
+
+    for index, parameters in enumerate(run_parameters(solver_parameters(bundle), args), start=1):
+        row = {"run": str(index), **replay(model, parameters)}
+        rows.append(row)
+        print(f"run {index}: {row['status']} in {row['wall_seconds']:.2f}s")
+
+    print()
+    print_table(rows)
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,141 @@
-import calendar
-import holidays
-from datetime import date
-from typing import List
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+import anyio
+import numpy as np
 from ortools.sat.python import cp_model
-from schemas.schedule import OneShift
+from core import metrics
+from core.logging_config import get_logger
+from core.middleware import get_request_id
+from core.settings import settings
+from schemas.schedule import OneShift, Employee, SolverBudget
 import models
+from services.schedule_cache import schedule_cache, schedule_cache_key
+from services.schedule_capture import capture_schedule_model
+from services.schedule_model import ScheduleModel, ScheduleModelBuilder, compute_rest_hours
+from services.schedule_store import ScheduleStore, store_cached_schedule, store_schedule
+from services.working_calendar import working_calendar
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 
+logger = get_logger(__name__)
+
+
+class PhaseTimer:
+    """
+    Wall time of the phases of one schedule generation, returned as
+    `meta["timings_ms"]`. A phase entered again (e.g. "solve" of every
+    decomposition window) adds up.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    def as_meta(self) -> dict:
+        timings = {name: round(ms, 1) for name, ms in self.phases.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return timings
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {ms:.0f}" for name, ms in self.as_meta().items())
+
+
+class SolveSlots:
+    """
+    Counts CP-SAT solves running at the same time, so that concurrent solves
+    share the cores instead of each starting a full set of workers.
+
+    `external` holds solves known to run outside of this process's threads
+    (e.g. jobs of the schedule process pool).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.external = 0
+
+    def acquire(self) -> None:
+        with self._lock:
+            self.active += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+    @contextmanager
+    def running(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def concurrent(self) -> int:
+        return max(1, self.active + self.external)
+
+
+solve_slots = SolveSlots()
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on Windows / macOS
+        return os.cpu_count() or 1
+
+
+class ScheduleSolutionStream(cp_model.CpSolverSolutionCallback):
+    """
+    Solution callback forwarding every improving solution to an asyncio queue.
+
+    Called from the solver thread, so events are handed over with
+    `call_soon_threadsafe`.
+    """
+
+    def __init__(self, service: "ScheduleService", ctx: ScheduleModel, loop: asyncio.AbstractEventLoop,
+                 events: asyncio.Queue, include_schedule: bool, stop_at_gap: Optional[float]):
+        super().__init__()
+        self.service = service
+        self.ctx = ctx
+        self.loop = loop
+        self.events = events
+        self.include_schedule = include_schedule
+        self.stop_at_gap = stop_at_gap
+        self.solutions = 0
+
+    def on_solution_callback(self):
+        self.solutions += 1
+        objective = self.ObjectiveValue()
+        best_bound = self.BestObjectiveBound()
+        gap = abs(objective - best_bound) / max(1.0, abs(objective))
+        event = {
+            "solution": self.solutions,
+            "objective": objective,
+            "best_bound": best_bound,
+            "gap": round(gap, 6),
+            "elapsed_seconds": round(self.WallTime(), 3),
+        }
+        if self.include_schedule:
+            result, _ = self.service.format_solution(self.ctx, self.Response().solution)
+            event["schedule"] = result["schedule"]
+            event["summary"] = result["summary"]
+        self.loop.call_soon_threadsafe(self.events.put_nowait, ("solution", event))
+        if self.stop_at_gap is not None and gap <= self.stop_at_gap:
+            self.StopSearch()
+
+
 class ScheduleService:
     def __init__(self, db: Session):
         self.db = db
@@ -15,21 +143,9 @@ class ScheduleService:
     def compute_rest_hours(self, start1: int, length1: int, start2: int) -> int:
         """
         Calculates hours from the end of a shift (day d) to the start of a shift (day d+1).
-        
-        Args:
-            start1: Start hour of the first shift (0..23).
-            length1: Length of the first shift in hours.
-            start2: Start hour of the next day's shift (0..23).
-            
-        Returns:
-            Rest duration in hours.
+        See `services.schedule_model.compute_rest_hours`.
         """
-        end1 = (start1 + length1) % 24
-        # If the shift ends after midnight (end1 < start1), it ends on day d+1? 
-        # Note: The logic below assumes shifts typically wrap within 24h cycle logic.
-        end1_abs = end1 if end1 > start1 else end1 + 24
-        start2_abs = start2 + 24
-        return start2_abs - end1_abs
+        return compute_rest_hours(start1, length1, start2)
 
     def get_days_list(self, year: int, month: int, company_work_mode: str, work_holidays: bool) -> List[int]:
         """
@@ -41,91 +157,39 @@ class ScheduleService:
         - "mon_sat"(Fallback): Returns weekdays + saturday (Monday-Saturday).
         
         Handles holiday logic based on the `work_holidays` flag.
+        See `services.working_calendar.build_years` for the exact rules.
         """
-        days_in_month = calendar.monthrange(year, month)[1]
-        
-        # Case 1: Working on holidays is allowed
-        if work_holidays:
-            if company_work_mode == "every_day":
-                return list(range(days_in_month))
-            
-            if company_work_mode == "mon_fri":
-                days = []
-                for d in range(1, days_in_month + 1):
-                    weekday = date(year, month, d).weekday()  # 0=Mon ... 6=Sun
-                    if weekday < 5:
-                        days.append(d - 1)
-                return days
-            
-            # Fallback (assumes specific custom mode or similar to everyday but excluding Sundays)
-            days = []
-            for d in range(1, days_in_month + 1):
-                weekday = date(year, month, d).weekday()
-                if weekday < 6:
-                    days.append(d - 1)
-            return days
-
-        # Case 2: Holidays are non-working days
-        else:
-            pl_holidays = holidays.Poland(years=year)
-            
-            if company_work_mode == "every_day":
-                days = []
-                for d in range(1, days_in_month + 1):
-                    dt = date(year, month, d)
-                    weekday = dt.weekday()
-                    # Skip if it is a holiday, but ensure Sundays are handled if needed
-                    if dt in pl_holidays and weekday < 6:
-                        continue
-                    days.append(d - 1) 
-                return days
-            
-            if company_work_mode == "mon_fri":
-                days = []
-                for d in range(1, days_in_month + 1):
-                    dt = date(year, month, d)
-                    weekday = dt.weekday()
-                    if weekday < 5:
-                        if dt in pl_holidays:
-                            continue
-                        days.append(d - 1)
-                return days
-            
-            # mon_sat
-            days = []
-            for d in range(1, days_in_month + 1):
-                dt = date(year, month, d)
-                weekday = dt.weekday()
-                if weekday < 6:
-                    if dt in pl_holidays:
-                        continue
-                    days.append(d - 1)
-            return days
+        return working_calendar.days_list(year, month, company_work_mode, work_holidays)
 
     def calculate_poland_full_time_hours(self, year: int, month: int) -> int:
         """
         Calculates standard full-time working hours for a given month in Poland.
         Formula: (Working Days * 8) - (Holidays falling on Mon-Sat * 8) +/ corrections.
         """
-        days_in_month = calendar.monthrange(year, month)[1]
-        pl_holidays = holidays.Poland(years=year)
-        full_time_hours = 0
-        
-        for day in range(1, days_in_month + 1):
-            dt = date(year, month, day)
-            weekday = dt.weekday()
-            
-            # Add 8 hours for Mon-Fri
-            if weekday < 5:
-                full_time_hours += 8
-            
-            # Subtract 8 hours if a holiday falls on a workday (Mon-Sat logic adjustment)
-            if dt in pl_holidays and weekday < 6:
-                full_time_hours -= 8
-                
-        return full_time_hours
-
-    def generate_schedule(self, request, user: models.User):
+        return working_calendar.full_time_hours(year, month)
+
+    def load_roster(self, user: models.User) -> List[Employee]:
+        """
+        Returns a detached snapshot of the employer's employees.
+
+        The snapshot holds only plain values, so it can be handed to a solver
+        running outside of the request (e.g. in a worker process).
+        """
+        return self.load_employer_roster(user.employer_id)
+
+    def load_employer_roster(self, employer_id: int) -> List[Employee]:
+        employees = self.db.query(models.Employee).filter(models.Employee.employer_id == employer_id).all()
+        return [
+            Employee(
+                id=e.id,
+                first_name=e.first_name,
+                last_name=e.last_name,
+                employment_fraction=float(e.employment_fraction)
+            )
+            for e in employees
+        ]
+
+    def generate_schedule(self, request, user: models.User) -> Tuple[dict, dict]:
         """
         Generates a work schedule using Constraint Programming (OR-Tools).
 
@@ -137,243 +201,663 @@ class ScheduleService:
             user: Current user (Employer).
 
         Returns:
-            Dictionary containing:
+            Tuple of the response dictionary, containing:
             - schedule: List of days with assigned shifts.
             - summary: Statistics per employee.
-            - meta: Metadata about calculation.
+            - meta: Metadata about calculation (`store_error` when the
+              schedule could not be saved, see `store_result`).
+            and the compact month state (see `build_month_state`).
         """
-        employees = self.db.query(models.Employee).filter(models.Employee.employer_id == user.employer_id).all()
-        shifts = request.shifts
-        year = request.year
-        month = request.month
-        rules = request.rules
-        preferences = request.preferences
-        # preferences = getattr(request, "preferences", None) or []
-
-        # 1. Determine calendar days
-        days_in_month = calendar.monthrange(year, month)[1]
-        
-        # Get list of actual working days (e.g., removing weekends/holidays if applicable)
-        days_list = self.get_days_list(year, month, request.company_work_mode, request.holidays_mode)
-        scheduled_days_count = len(days_list)
+        timer = PhaseTimer()
+        with timer.phase("roster"):
+            employees = self.load_roster(user)
+        with timer.phase("previous_state"):
+            previous = self.load_previous_state(user.employer_id, request)
+
+        with timer.phase("cache_lookup"):
+            cache_key = schedule_cache_key(request, employees, previous)
+            cached = schedule_cache.get(cache_key)
+        if cached is not None:
+            result, state = cached
+            with timer.phase("store"):
+                # the hit is the month's schedule now: the next month starts from it and reads return it
+                schedule_cache.save_month_state(user.employer_id, request.year, request.month, state)
+                self.store_result(result, user.employer_id, request,
+                                  lambda: ScheduleStore(self.db).save_cached(user.employer_id, cache_key, result,
+                                                                             state, request))
+            result["meta"]["timings_ms"] = timer.as_meta()
+            logger.info(f"Schedule {request.year}-{request.month:02d} of employer {user.employer_id} "
+                        f"served from cache, ms: {timer.summary()}")
+            return result, state
+
+        result, state = self.solve_schedule(request, employees, previous, timer=timer)
+        with timer.phase("store"):
+            schedule_cache.set(cache_key, user.employer_id, request.year, request.month, result, state)
+            schedule_cache.save_month_state(user.employer_id, request.year, request.month, state)
+            schedule_cache.save_request_template(user.employer_id, request)
+            self.store_result(result, user.employer_id, request,
+                              lambda: ScheduleStore(self.db).save(user.employer_id, cache_key, result, state, request))
+        result["meta"]["timings_ms"] = timer.as_meta()
+        logger.info(f"Schedule {request.year}-{request.month:02d} of employer {user.employer_id} "
+                    f"generated ({len(employees)} employees, {result['meta']['status']}), ms: {timer.summary()}")
+        return result, state
+
+    def store_result(self, result: dict, employer_id: int, request, save: Callable[[], object]) -> None:
+        """
+        Runs `save`, the database write of a solved month. A failed write
+        doesn't throw the solve away: it is logged and reported in
+        `meta.store_error`, and the schedule is returned all the same.
+        """
+        try:
+            save()
+        except Exception as exc:
+            logger.exception(f"Storing schedule {request.year}-{request.month:02d} of employer {employer_id} failed")
+            result["meta"]["store_error"] = str(exc)
 
-        # 2. Calculate standard full-time hours for the month
-        full_time_hours = self.calculate_poland_full_time_hours(request.year, request.month)
+    def load_previous_state(self, employer_id: int, request) -> Optional[dict]:
+        """
+        Returns the stored state of the month preceding `request`, if warm start is enabled.
 
-        # 3. Initialize CP Model
-        model = cp_model.CpModel()
-        E = len(employees)
-        S = len(shifts)
-        D = scheduled_days_count  # Number of days actually being scheduled
+        Falls back to the schedule stored in the database when the cache
+        doesn't have it (e.g. disabled cache or another host).
+        """
+        if not request.warm_start:
+            return None
+        prev_year, prev_month = (request.year - 1, 12) if request.month == 1 else (request.year, request.month - 1)
+        state = schedule_cache.load_month_state(employer_id, prev_year, prev_month)
+        if state is None:
+            state = ScheduleStore(self.db).load_month_state(employer_id, prev_year, prev_month)
+        return state
+
+    def build_month_state(self, request, employees: List[Employee], days_list: List[int], assignment) -> dict:
+        """
+        Compact, id-based description of a solved month.
+
+        `assignment[e][di]` is the shift index worked by employee `e` on the
+        scheduled day `di`, or -1 for a day off.
+        """
+        return {
+            "year": request.year,
+            "month": request.month,
+            "employee_ids": [e.id for e in employees],
+            "days": [d + 1 for d in days_list],
+            "shifts": [
+                {"name": sh.name, "start_hour": sh.start_hour, "length": sh.length}
+                for sh in request.shifts
+            ],
+            "assignment": assignment,
+        }
+
+    def solve_schedule(self, request, employees: List[Employee], previous: Optional[dict] = None,
+                       day_range: Optional[Tuple[int, int]] = None, timer: Optional[PhaseTimer] = None,
+                       targets: Optional[List[int]] = None):
+        """
+        Solves the schedule for an already loaded roster.
 
-        # Map internal day index (0..D-1) to actual day of the month
-        day_idx_to_actual = {idx: days_list[idx] for idx in range(D)}
+        Does not touch the database, so it is safe to run in a separate process.
+        `previous` is the state of the preceding month (see `build_month_state`).
+        `day_range` limits the schedule to days `first..last` (1-based) of the month.
+        `timer` collects the phase timings (a new one when not given).
+        `targets` overrides the employees' hour targets for the month.
 
-        # Needed to map (employee_id, day) -> (e_idx, di)
-        actual_to_di = {actual_day: di for di, actual_day in day_idx_to_actual.items()}
-        emp_id_to_idx = {emp.id: idx for idx, emp in enumerate(employees)}
+        Returns a tuple of (response dict, compact month state).
+        """
+        timer = timer or PhaseTimer()
+        if request.decomposition:
+            return self.solve_decomposed(request, employees, previous, day_range=day_range, timer=timer,
+                                         targets=targets)
+
+        ctx = self.build_model(request, employees, previous, day_range=day_range, timer=timer, targets=targets)
+
+        with solve_slots.running(), timer.phase("solve"):
+            solver = self.create_solver(request.solver)
+            result = solver.Solve(ctx.model)
+        stats = self.solve_statistics(solver, ctx, result)
+        self.capture_model(ctx, solver, stats, timer)
         
-        # --- Variables ---
-        # x[employee, day_index, shift] -> boolean decision variable
-        x = {}
-        for e in range(E):
-            for di in range(D):
-                for s in range(S):
-                    x[(e, di, s)] = model.NewBoolVar(f"x_e{e}_d{di}_s{s}")
+        if result not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, 
+                detail="Can't generate schedule using these parameters"
+            )
 
-        # --- Constraints ---
+        ctx.meta["solver"] = self.solver_meta(solver)
+        ctx.meta["status"] = solver.StatusName(result)
+        ctx.meta["objective"] = solver.ObjectiveValue()
+        ctx.meta["solver_stats"] = [stats]
+        with timer.phase("format"):
+            result, state = self.format_solution(ctx, solver.ResponseProto().solution)
+        result["meta"]["timings_ms"] = timer.as_meta()
+        return result, state
+
+    def solve_decomposed(
+        self,
+        request,
+        employees: List[Employee],
+        previous: Optional[dict] = None,
+        on_window: Optional[Callable[[dict], None]] = None,
+        stop: Optional[threading.Event] = None,
+        day_range: Optional[Tuple[int, int]] = None,
+        timer: Optional[PhaseTimer] = None,
+        targets: Optional[List[int]] = None,
+    ) -> Tuple[dict, dict]:
+        """
+        Solves the month in rolling windows instead of one model.
+
+        Every window is a model of `window_days + overlap_days` scheduled days.
+        Only the first `window_days` are fixed; the overlap keeps a window from
+        leaving the next one without a feasible start and is solved again as
+        part of the next window. Between windows:
+            - the fixed days are carried over as boundary state, so the rest
+              and consecutive-days rules hold across windows (and across the
+              month boundary when `previous` is given),
+            - every employee's target is what is still missing from the
+              monthly target, spread evenly over the remaining days.
+
+        Each model only sees a week or so, so the solve time grows roughly
+        linearly with the number of days. The solver time limit is split
+        between windows in proportion to their length.
+
+        `on_window` is called with the stats of every fixed window, and the
+        solve is abandoned between windows once `stop` is set.
+
+        Returns a tuple of (response dict, compact month state).
+        """
+        timer = timer or PhaseTimer()
+        decomposition = request.decomposition
+        with timer.phase("calendar"):
+            days_list, full_time_hours = self.scheduled_days(request, day_range)
+        if not days_list:
+            # nothing to split
+            return self.solve_schedule(request.model_copy(update={"decomposition": None}), employees, previous,
+                                       day_range, timer, targets)
 
-        # 1. Coverage: Ensure required number of employees per shift per day
-        for di in range(D):
-            for s_idx, shift in enumerate(shifts):
-                model.Add(sum(x[(e, di, s_idx)] for e in range(E)) == shift.required)
-
-        # 2. Max one shift per day per employee
-        for e in range(E):
-            for di in range(D):
-                model.Add(sum(x[(e, di, s)] for s in range(S)) <= 1)
-
-        # 3. Minimum rest time between shifts (checking consecutive days in days_list)
-        for e in range(E):
-            for di in range(D - 1):
-                for s1_idx, sh1 in enumerate(shifts):
-                    for s2_idx, sh2 in enumerate(shifts):
-                        rest = self.compute_rest_hours(sh1.start_hour, sh1.length, sh2.start_hour)
-                        # If rest time is insufficient, forbid this sequence
-                        if rest < rules.min_rest_hours:
-                            model.Add(x[(e, di, s1_idx)] + x[(e, di + 1, s2_idx)] <= 1)
-
-        # 4. Maximum consecutive working days (Optional)
-        if rules.max_consecutive_days:
-            M = rules.max_consecutive_days
-            if M < D:
-                for e in range(E):
-                    # Sliding window constraint
-                    for start in range(0, D - (M + 1) + 1):
-                        window_terms = []
-                        for dd in range(start, start + M + 1):
-                            window_terms.append(sum(x[(e, dd, s)] for s in range(S)))
-                        # Sum of worked days in window of size M+1 must be <= M
-                        model.Add(sum(window_terms) <= M)
-
-        # --- Objective Function ---
-
-        # Determine theoretical upper bound for total hours to define variable domains
-        max_shift_len = max((int(sh.length) for sh in shifts), default=0)
-        max_hours_per_employee = D * max_shift_len
-
-        # Objective: Minimize deviation between actual hours and target hours 
-        deviations_hours = [] 
+        E = len(employees)
+        D = len(days_list)
+        lengths = [int(sh.length) for sh in request.shifts]
+        monthly_targets = targets or [int(round(emp.employment_fraction * full_time_hours)) for emp in employees]
+        worked_hours = [0] * E
+        assignment: List[List[int]] = [[] for _ in range(E)]
+
+        time_budget = self.create_solver(request.solver).parameters.max_time_in_seconds
+        started = time.perf_counter()
+
+        meta = None
+        windows = []
+        solver_stats = []
+        start = 0
+        while start < D:
+            if stop is not None and stop.is_set():
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Schedule generation was cancelled")
+
+            fixed_end = min(start + decomposition.window_days, D)
+            end = min(fixed_end + decomposition.overlap_days, D)
+            remaining_days = D - start
+            targets = [
+                max(0, int(round((monthly_targets[e] - worked_hours[e]) * (end - start) / remaining_days)))
+                for e in range(E)
+            ]
+            with timer.phase("build"):
+                boundary = self.window_boundary(request, employees, previous, assignment) if start else None
+                ctx = ScheduleModelBuilder(request, employees, days_list[start:end], full_time_hours, previous,
+                                           targets=targets, boundary=boundary).build()
+
+            with solve_slots.running(), timer.phase("solve"):
+                solver = self.create_solver(request.solver)
+                time_left = time_budget - (time.perf_counter() - started)
+                solver.parameters.max_time_in_seconds = max(1.0, time_left * (end - start) / remaining_days)
+                result = solver.Solve(ctx.model)
+            solver_stats.append(self.solve_statistics(solver, ctx, result))
+            self.capture_model(ctx, solver, solver_stats[-1], timer)
+
+            if result not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Can't generate schedule using these parameters"
+                )
+
+            with timer.phase("format"):
+                window_assignment = self.read_assignment(ctx, solver.ResponseProto().solution).tolist()
+            for e in range(E):
+                fixed = window_assignment[e][:fixed_end - start]
+                assignment[e].extend(fixed)
+                worked_hours[e] += sum(lengths[s] for s in fixed if s >= 0)
+
+            if meta is None:
+                meta = dict(ctx.meta)
+                meta["solver"] = dict(self.solver_meta(solver), time_limit_seconds=time_budget)
+            else:
+                # a preference is applied by the window that contains its day
+                for pos, info in enumerate(ctx.meta["preferences"]):
+                    if info["applied"]:
+                        meta["preferences"][pos] = info
+
+            window = {
+                "days": [days_list[start] + 1, days_list[fixed_end - 1] + 1],
+                "solved_days": [days_list[start] + 1, days_list[end - 1] + 1],
+                "status": solver.StatusName(result),
+                "objective": solver.ObjectiveValue(),
+                "elapsed_seconds": round(solver.WallTime(), 3),
+            }
+            windows.append(window)
+            if on_window is not None:
+                on_window(window)
+            start = fixed_end
+
+        meta.update({
+            "status": "OPTIMAL" if all(w["status"] == "OPTIMAL" for w in windows) else "FEASIBLE",
+            # windows are solved one after another, so their objectives add up
+            "objective": sum(w["objective"] for w in windows),
+            "scheduled_days_count": D,
+            "max_hours_per_employee": D * max(lengths, default=0),
+            "solver_stats": solver_stats,
+            "decomposition": {
+                "window_days": decomposition.window_days,
+                "overlap_days": decomposition.overlap_days,
+                "windows": windows,
+            },
+        })
+        with timer.phase("format"):
+            result, state = self.format_assignment(request, employees, days_list, full_time_hours, assignment, meta)
+        result["meta"]["timings_ms"] = timer.as_meta()
+        return result, state
+
+    def window_boundary(self, request, employees: List[Employee], previous: Optional[dict],
+                        assignment: List[List[int]]) -> dict:
+        """
+        Boundary state in front of the next window: the tail of the previous
+        month (if any) followed by the days already fixed in this month.
 
+        Shift indexes of both parts are kept apart by listing the previous
+        month's shifts first.
+        """
+        shifts = [
+            {"name": sh.name, "start_hour": sh.start_hour, "length": sh.length}
+            for sh in request.shifts
+        ]
+        offset = 0
+        prev_rows = {}
+        if previous:
+            shifts = previous["shifts"] + shifts
+            offset = len(previous["shifts"])
+            prev_rows = dict(zip(previous["employee_ids"], previous["assignment"]))
+
+        rows = []
         for e_idx, emp in enumerate(employees):
-            # Calculate total assigned hours for this employee
-            # Expression: sum(shift_length * is_assigned)
-            total_hours_expr = sum(int(sh.length) * x[(e_idx, di, s_idx)]
-                                for di in range(D)
-                                for s_idx, sh in enumerate(shifts))
-
-            # Calculate target hours: employment_fraction * full_time_hours
-            target_hours = int(round(emp.employment_fraction * full_time_hours))
+            fixed = [s + offset if s >= 0 else -1 for s in assignment[e_idx]]
+            rows.append(prev_rows.get(emp.id, []) + fixed)
+        return {"employee_ids": [e.id for e in employees], "shifts": shifts, "assignment": rows}
+
+    async def stream_schedule(
+        self,
+        request,
+        employees: List[Employee],
+        previous: Optional[dict],
+        employer_id: int,
+        include_schedule: bool = False,
+        stop_at_gap: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Solves the schedule and yields `(event, data)` pairs as the search goes.
+
+        Events:
+            - "solution": every improving solution (objective, best bound, gap,
+              elapsed time and optionally the schedule itself).
+            - "window": every fixed window of a decomposed request.
+            - "done": final status with the full response (`meta.store_error`
+              set when it could not be saved, see `store_result`).
+            - "error": the model has no solution.
+
+        The solver runs in its own thread. When the consumer stops iterating
+        (e.g. the client disconnects because the schedule is good enough) the
+        search is stopped as well.
+        """
+        cache_key = schedule_cache_key(request, employees, previous)
+        cached = await anyio.to_thread.run_sync(schedule_cache.get, cache_key)
+        if cached is not None:
+            result, state = cached
+            await anyio.to_thread.run_sync(schedule_cache.save_month_state, employer_id, request.year, request.month,
+                                           state)
+            await anyio.to_thread.run_sync(self.store_result, result, employer_id, request,
+                                           lambda: store_cached_schedule(employer_id, cache_key, result, state))
+            yield "done", {"status": "CACHED", "result": result}
+            return
+
+        if request.decomposition:
+            async for event in self.stream_decomposed(request, employees, previous, employer_id, cache_key):
+                yield event
+            return
+
+        timer = PhaseTimer()
+        ctx = await anyio.to_thread.run_sync(self.build_model, request, employees, previous, None, None, timer)
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        solve_slots.acquire()
+        solve_started = time.perf_counter()
+        solver = self.create_solver(request.solver)
+        callback = ScheduleSolutionStream(self, ctx, loop, events, include_schedule, stop_at_gap)
+
+        def run_solver():
+            try:
+                result = solver.Solve(ctx.model, callback)
+            except Exception as exc:
+                loop.call_soon_threadsafe(events.put_nowait, ("_failed", exc))
+                return
+            finally:
+                solve_slots.release()
+            loop.call_soon_threadsafe(events.put_nowait, ("_finished", result))
+
+        threading.Thread(target=run_solver, name="schedule-stream-solver", daemon=True).start()
+
+        finished = False
+        try:
+            while True:
+                event, data = await events.get()
+                if event == "solution":
+                    yield event, data
+                    continue
+                finished = True
+                break
+        finally:
+            if not finished:
+                solver.StopSearch()
+
+        if event == "_failed":
+            raise data
+        timer.phases["solve"] = (time.perf_counter() - solve_started) * 1000
+        stats = self.solve_statistics(solver, ctx, data)
+        await anyio.to_thread.run_sync(self.capture_model, ctx, solver, stats, timer)
+        if data not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            yield "error", {"status": solver.StatusName(data), "detail": "Can't generate schedule using these parameters"}
+            return
+
+        ctx.meta["solver"] = self.solver_meta(solver)
+        ctx.meta["status"] = solver.StatusName(data)
+        ctx.meta["objective"] = solver.ObjectiveValue()
+        ctx.meta["solver_stats"] = [stats]
+        with timer.phase("format"):
+            result, state = await anyio.to_thread.run_sync(self.format_solution, ctx, solver.ResponseProto().solution)
+        with timer.phase("store"):
+            await anyio.to_thread.run_sync(schedule_cache.set, cache_key, employer_id, request.year, request.month,
+                                           result, state)
+            await anyio.to_thread.run_sync(schedule_cache.save_month_state, employer_id, request.year, request.month,
+                                           state)
+            await anyio.to_thread.run_sync(schedule_cache.save_request_template, employer_id, request)
+            await anyio.to_thread.run_sync(self.store_result, result, employer_id, request,
+                                           lambda: store_schedule(employer_id, cache_key, result, state))
+        result["meta"]["timings_ms"] = timer.as_meta()
+        logger.info(f"Schedule {request.year}-{request.month:02d} of employer {employer_id} "
+                    f"streamed ({len(employees)} employees, {result['meta']['status']}), ms: {timer.summary()}")
+        yield "done", {
+            "status": solver.StatusName(data),
+            "objective": solver.ObjectiveValue(),
+            "best_bound": solver.BestObjectiveBound(),
+            "elapsed_seconds": round(solver.WallTime(), 3),
+            "result": result,
+        }
 
-            # Create an auxiliary variable for absolute deviation:
-            # dev_h >= | total_hours - target_hours |
-            dev_h = model.NewIntVar(0, max_hours_per_employee, f"dev_hours_e{e_idx}")
-            
-            # Linearize absolute value constraint
-            model.Add(total_hours_expr - target_hours <= dev_h)
-            model.Add(target_hours - total_hours_expr <= dev_h)
+    async def stream_decomposed(
+        self,
+        request,
+        employees: List[Employee],
+        previous: Optional[dict],
+        employer_id: int,
+        cache_key: str,
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        `stream_schedule` for decomposed requests: yields a "window" event for
+        every fixed window instead of "solution" events.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        started = time.perf_counter()
 
-            deviations_hours.append(dev_h)
+        def on_window(window: dict):
+            loop.call_soon_threadsafe(events.put_nowait, ("window", window))
 
-        # --- Soft penalties: day off requests (additional option) ---
-        penalties = []
-        day_off_meta = []
+        def run_solver():
+            try:
+                solved = self.solve_decomposed(request, employees, previous, on_window, stop)
+            except Exception as exc:
+                loop.call_soon_threadsafe(events.put_nowait, ("_failed", exc))
+                return
+            loop.call_soon_threadsafe(events.put_nowait, ("_finished", solved))
+
+        threading.Thread(target=run_solver, name="schedule-stream-solver", daemon=True).start()
+
+        finished = False
+        try:
+            while True:
+                event, data = await events.get()
+                if event == "window":
+                    yield event, data
+                    continue
+                finished = True
+                break
+        finally:
+            if not finished:
+                stop.set()
+
+        if event == "_failed":
+            if isinstance(data, HTTPException):
+                yield "error", {"status": "FAILED", "detail": data.detail}
+                return
+            raise data
+
+        result, state = data
+        await anyio.to_thread.run_sync(schedule_cache.set, cache_key, employer_id, request.year, request.month,
+                                       result, state)
+        await anyio.to_thread.run_sync(schedule_cache.save_month_state, employer_id, request.year, request.month, state)
+        await anyio.to_thread.run_sync(schedule_cache.save_request_template, employer_id, request)
+        await anyio.to_thread.run_sync(self.store_result, result, employer_id, request,
+                                       lambda: store_schedule(employer_id, cache_key, result, state))
+        yield "done", {
+            "status": result["meta"]["status"],
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+            "result": result,
+        }
 
-        print("DEBUG request:", request)
+    def create_solver(self, budget: Optional[SolverBudget] = None) -> cp_model.CpSolver:
+        """
+        Creates a solver configured from the request's budget and the server settings.
+
+        - time limit: the requested one, never above the server limit.
+        - workers: the requested count, or the free cores divided between the
+          solves running right now (call inside `solve_slots.running()`).
+          Never below `schedule_solver_min_workers`: a single CP-SAT worker
+          has no portfolio and is far slower even on one core, and never
+          above `schedule_solver_max_workers`.
+        - relative gap: stop once (objective - bound) / objective is small enough.
+        - first solution: stop as soon as any valid schedule is found.
+        """
+        budget = budget or SolverBudget()
+        max_workers = settings.schedule_solver_max_workers
 
+        time_limit = settings.schedule_solver_time_limit_seconds
+        if budget.time_limit_seconds is not None:
+            time_limit = min(time_limit, budget.time_limit_seconds)
 
-        DEFAULT_DAY_OFF_priority = 50
+        if budget.workers is not None:
+            workers = min(budget.workers, max_workers)
+        else:
+            workers = available_cores() // solve_slots.concurrent()
+            workers = max(settings.schedule_solver_min_workers, min(workers, max_workers))
 
-        for req in preferences:
-            # Support both Pydantic models and plain dicts
-            employee_id = getattr(req, "employee_id", None)
-            day_1based = getattr(req, "day", None)
+        relative_gap = settings.schedule_solver_relative_gap
+        if budget.relative_gap is not None:
+            relative_gap = budget.relative_gap
 
-            if isinstance(req, dict):
-                employee_id = employee_id or req.get("employee_id")
-                day_1based = day_1based or req.get("day")
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = time_limit
+        solver.parameters.num_workers = workers
+        solver.parameters.relative_gap_limit = relative_gap
+        solver.parameters.stop_after_first_solution = budget.first_solution
+        return solver
+
+    def solver_meta(self, solver: cp_model.CpSolver) -> dict:
+        params = solver.parameters
+        return {
+            "time_limit_seconds": params.max_time_in_seconds,
+            "workers": params.num_workers,
+            "relative_gap": params.relative_gap_limit,
+            "first_solution": params.stop_after_first_solution,
+        }
 
-            info = {
-                "employee_id": employee_id,
-                "day": day_1based,
-                "applied": False,
-                "reason": None
-            }
+    def solve_statistics(self, solver: cp_model.CpSolver, ctx: ScheduleModel, result) -> dict:
+        """
+        Statistics of a finished solve, recorded in `core.metrics` and kept
+        in `meta["solver_stats"]` (one entry per solve, i.e. per window of a
+        decomposed month).
 
-            # Validation
-            if not employee_id or not day_1based:
-                info["reason"] = "invalid_payload"
-                day_off_meta.append(info)
-                continue
-
-            e_idx = emp_id_to_idx.get(int(employee_id))
-            actual_day_0based = int(day_1based) - 1
-            di = actual_to_di.get(actual_day_0based)
-
-            if e_idx is None:
-                info["reason"] = "employee_not_found"
-                day_off_meta.append(info)
-                continue
-
-            if di is None:
-                # The day is not scheduled (e.g., it's a non-working day based on the selected work mode)
-                info["reason"] = "day_not_scheduled_by_mode"
-                day_off_meta.append(info)
-                continue
-
-            # 0/1: whether the employee works on that day
-            worked_that_day = sum(x[(e_idx, di, s)] for s in range(S))
-            req_priority = getattr(req, "priority", None)
-            if isinstance(req, dict):
-                req_priority = req_priority if req_priority is not None else req.get("priority")
-
-            # Default to 50 if not provided
+        `gap` is CP-SAT's relative gap, |objective - bound| / max(1, |objective|).
+        """
+        proto = ctx.model.Proto()
+        stats = {
+            "status": solver.StatusName(result),
+            "wall_seconds": round(solver.WallTime(), 3),
+            "objective": None,
+            "best_bound": None,
+            "gap": None,
+            "variables": len(proto.variables),
+            "constraints": len(proto.constraints),
+            "conflicts": solver.NumConflicts(),
+            "branches": solver.NumBranches(),
+        }
+        if result in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            objective, bound = solver.ObjectiveValue(), solver.BestObjectiveBound()
+            stats.update(objective=objective, best_bound=bound,
+                         gap=round(abs(objective - bound) / max(1.0, abs(objective)), 6))
+        metrics.observe_solve(stats)
+        return stats
+
+    def capture_model(self, ctx: ScheduleModel, solver: cp_model.CpSolver, stats: dict, timer: PhaseTimer) -> None:
+        """Writes the model to SCHEDULE_MODEL_DUMP_DIR when captures are on and the solve was slow enough."""
+        if not settings.schedule_model_dump_dir:
+            return
+        if stats["wall_seconds"] < settings.schedule_model_dump_min_seconds:
+            return
+        with timer.phase("capture"):
             try:
-                req_priority = int(req_priority) if req_priority is not None else 50
-            except Exception:
-                req_priority = 50
-
-            penalties.append(req_priority * worked_that_day)
-            # Fixed priority
-            # penalties.append(DEFAULT_DAY_OFF_priority * worked_that_day)
-
-            info["applied"] = True
-            info["reason"] = "soft_priority_added"
-            day_off_meta.append(info)
-
-            
-        # Minimize the sum of hourly deviations across all employees
-        W_HOURS = 2
-        model.Minimize(W_HOURS * sum(deviations_hours) + sum(penalties))
-        # sum_deviations_hours = int(sum(deviations_hours))
-        print(deviations_hours)
-        # --- Solve ---
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 300
-        solver.parameters.num_search_workers = 8
+                path = capture_schedule_model(settings.schedule_model_dump_dir, ctx, solver, stats, get_request_id())
+            except OSError:
+                logger.exception("Capturing the schedule model failed")
+                return
+        logger.info(f"Schedule model captured in {path} (solve took {stats['wall_seconds']}s)")
 
-        result = solver.Solve(model)
-        
-        if result not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, 
-                detail="Can't generate schedule using these parameters"
-            )
+    def scheduled_days(self, request, day_range: Optional[Tuple[int, int]] = None) -> Tuple[List[int], int]:
+        """
+        Returns the scheduled days (0-based) and the full-time hours of the
+        month, or of its days `first..last` (1-based) when `day_range` is given.
+        """
+        # Get list of actual working days (e.g., removing weekends/holidays if applicable)
+        days_list = self.get_days_list(request.year, request.month, request.company_work_mode, request.holidays_mode)
+        if day_range is None:
+            # Calculate standard full-time hours for the month
+            return days_list, self.calculate_poland_full_time_hours(request.year, request.month)
+
+        first_day, last_day = day_range
+        days_list = [d for d in days_list if first_day <= d + 1 <= last_day]
+        return days_list, working_calendar.full_time_hours(request.year, request.month, first_day, last_day)
+
+    def build_model(self, request, employees: List[Employee], previous: Optional[dict] = None,
+                    boundary: Optional[dict] = None, day_range: Optional[Tuple[int, int]] = None,
+                    timer: Optional[PhaseTimer] = None, targets: Optional[List[int]] = None) -> ScheduleModel:
+        """
+        Builds the CP-SAT model for one month (variables, constraints, objective).
+
+        `boundary` replaces `previous` as the assignment in front of the first
+        day (see `ScheduleModelBuilder`); `targets` replaces the hour targets
+        derived from the employment fractions.
+        """
+        timer = timer or PhaseTimer()
+        with timer.phase("calendar"):
+            days_list, full_time_hours = self.scheduled_days(request, day_range)
+        with timer.phase("build"):
+            return ScheduleModelBuilder(request, employees, days_list, full_time_hours, previous,
+                                        targets=targets, boundary=boundary).build()
+
+    def format_solution(self, ctx: ScheduleModel, solution: Sequence[int]) -> Tuple[dict, dict]:
+        """
+        Reads a solution back from the model.
+
+        Args:
+            ctx: Model built by `build_model`.
+            solution: Values of all model variables, e.g.
+                      `solver.ResponseProto().solution` or the
+                      `Response().solution` of a solution callback.
+
+        Returns a tuple of (response dict, compact month state).
+        """
+        assignment = self.read_assignment(ctx, solution)
+        return self.format_assignment(ctx.request, ctx.employees, ctx.days_list, ctx.full_time_hours,
+                                      assignment, ctx.meta)
+
+    def read_assignment(self, ctx: ScheduleModel, solution: Sequence[int]) -> np.ndarray:
+        """
+        Returns `assignment[e, di]`: the shift index worked by employee `e` on
+        the scheduled day `di` of the model, or -1 for a day off.
+
+        Reads all `x` values with one fancy-indexing gather from the solution
+        vector instead of a `solver.Value` call per variable.
+        """
+        values = np.asarray(solution, dtype=np.int64)[ctx.x_index]
+        # at most one shift per employee and day, so argmax finds it
+        return np.where(values.any(axis=2), values.argmax(axis=2), -1)
+
+    def format_assignment(self, request, employees: List[Employee], days_list: List[int], full_time_hours: int,
+                          assignment, meta: dict) -> Tuple[dict, dict]:
+        """
+        Builds the response (schedule + summary) from an assignment matrix
+        (`assignment[e][di]`, a nested list or an array).
+
+        Returns a tuple of (response dict, compact month state).
+        """
+        shifts = request.shifts
+        E = len(employees)
+        D = len(days_list)
+        S = len(shifts)
+        assignment = np.asarray(assignment, dtype=np.int64).reshape(E, D)
+
+        names = [f"{e.first_name} {e.last_name}" for e in employees]
+        lengths = np.array([int(sh.length) for sh in shifts] + [0], dtype=np.int64)  # [-1] -> day off
+        fractions = np.array([e.employment_fraction for e in employees], dtype=np.float64)
 
         # --- Format Output ---
-        
+
+        # Group the worked (employee, day, shift) cells by (day, shift); a stable
+        # sort keeps employees in roster order within every group
+        emp_idx, day_idx = np.nonzero(assignment >= 0)
+        group = day_idx * S + assignment[emp_idx, day_idx]
+        order = np.argsort(group, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(group, minlength=D * S)))).tolist()
+        ordered_names = [names[e] for e in emp_idx[order].tolist()]
+        shift_names = [shift.name for shift in shifts]
+
         # Construct the schedule list (mapping back to real calendar days)
         schedule = []
         for di in range(D):
-            actual_day = day_idx_to_actual[di]
-            day_shifts_with_employees: List[OneShift] = []
-            
-            for s_idx, shift in enumerate(shifts):
-                emps = [
-                    f"{employees[e].first_name} {employees[e].last_name}"
-                    for e in range(E)
-                    if solver.Value(x[(e, di, s_idx)]) == 1
-                ]
-                day_shifts_with_employees.append({
-                    "shift": shift.name,
-                    "employees": emps
-                })
-                
+            first = di * S
+            day_shifts_with_employees: List[OneShift] = [
+                {"shift": shift_names[s_idx], "employees": ordered_names[bounds[first + s_idx]:bounds[first + s_idx + 1]]}
+                for s_idx in range(S)
+            ]
             schedule.append({
-                "day": actual_day + 1, # Return as 1-based day number
+                "day": days_list[di] + 1, # Return as 1-based day number
                 "shifts": day_shifts_with_employees
             })
 
         # Generate summary stats
-        summary = {}
-        for i in range(E):
-            worked_shifts = int(sum(solver.Value(x[(i, di, s)]) for di in range(D) for s in range(S)))
-            worked_hours = int(sum(int(sh.length) * solver.Value(x[(i, di, s)])
-                                for di in range(D)
-                                for s, sh in enumerate(shifts)))
-            
-            summary[f"{employees[i].first_name} {employees[i].last_name}"] = {
-                "shifts": worked_shifts,
-                "hours": worked_hours,
-                "target": int(round(employees[i].employment_fraction * full_time_hours))
-            }
-
-        meta = {
-            "days_in_month": days_in_month,
-            "scheduled_days_count": scheduled_days_count,
-            "full_time_hours_used": full_time_hours,
-            "max_hours_per_employee": max_hours_per_employee,
-            "preferences": day_off_meta,
+        worked_shifts = (assignment >= 0).sum(axis=1).tolist()
+        worked_hours = lengths[assignment].sum(axis=1).tolist()
+        # np.rint rounds half to even, like round()
+        targets = np.rint(fractions * full_time_hours).astype(np.int64).tolist()
+        summary = {
+            names[i]: {"shifts": worked_shifts[i], "hours": worked_hours[i], "target": targets[i]}
+            for i in range(E)
         }
 
-        return {"schedule": schedule, "summary": summary, "meta": meta}
\ No newline at end of file
+        state = self.build_month_state(request, employees, days_list, assignment.tolist())
+        # the hour targets solved against, per employee of the state (see ScheduleFormatter.compact)
+        return {"schedule": schedule, "summary": summary, "meta": dict(meta, targets=targets)}, state
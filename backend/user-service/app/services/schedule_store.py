@@ -0,0 +1,309 @@
+import json
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+from core.logging_config import get_logger
+from db import SessionLocal
+from schemas.schedule import ScheduleRequest
+from services.schedule_cache import request_template
+
+logger = get_logger(__name__)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _dialect_insert(db: Session):
+    """INSERT construct with ON CONFLICT support of the session's database."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+class ScheduleStore:
+    """
+    Generated schedules kept in the main database.
+
+    A month is stored as one `Schedule` row plus one narrow
+    `ScheduleAssignment` row per worked shift, so reading a schedule (or the
+    shifts of one employee over any date range) is an indexed query instead
+    of a solve. Storing a month again replaces the previous schedule.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def save(self, employer_id: int, request_hash: str, result: dict, state: dict,
+             request: Optional[ScheduleRequest] = None, source: str = "owner") -> Optional[models.Schedule]:
+        """
+        Stores a solved month, `state` being its compact form (see
+        `ScheduleService.build_month_state`). With `request`, its template is
+        kept for batch generation (see `load_request_templates`).
+
+        A "batch" draft only replaces another batch draft, never a schedule
+        the owner generated; None is returned when the owner's one is kept.
+        """
+        year, month = state["year"], state["month"]
+        meta = result.get("meta", {})
+        values = {
+            "request_hash": request_hash,
+            "status": meta.get("status") or "FEASIBLE",
+            "objective": meta.get("objective"),
+            "shifts": _dumps(state["shifts"]),
+            "days": _dumps(state["days"]),
+            "employee_ids": _dumps(state["employee_ids"]),
+            "summary": _dumps(result["summary"]),
+            "meta": _dumps(meta),
+            "request": _dumps(request_template(request)) if request is not None else None,
+            "source": source,
+        }
+        # one statement against the unique (employer, year, month) index, so concurrent saves of a
+        # month (owner, job, batch) replace each other instead of failing on the index
+        upsert = _dialect_insert(self.db)(models.Schedule).values(
+            employer_id=employer_id, year=year, month=month, **values)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[models.Schedule.employer_id, models.Schedule.year, models.Schedule.month],
+            set_=dict(
+                values,
+                created_at=func.now(),
+                # a save without a request (plan, batch) keeps the template stored before
+                request=func.coalesce(upsert.excluded.request, models.Schedule.request),
+            ),
+            # checked in the same statement, so an owner's save racing the batch wins
+            where=(models.Schedule.source == "batch") if source == "batch" else None,
+        )
+        schedule_id = self.db.execute(upsert.returning(models.Schedule.id)).scalar_one_or_none()
+        if schedule_id is None:
+            self.db.rollback()
+            logger.info(f"Kept the owner's schedule {year}-{month:02d} of employer {employer_id}")
+            return None
+        self.db.execute(delete(models.ScheduleAssignment).where(models.ScheduleAssignment.schedule_id == schedule_id))
+
+        days = [date(year, month, d) for d in state["days"]]
+        rows = [
+            {"schedule_id": schedule_id, "employee_id": employee_id, "day": days[di], "shift": s}
+            for employee_id, row in zip(state["employee_ids"], state["assignment"])
+            for di, s in enumerate(row)
+            if s >= 0
+        ]
+        if rows:
+            # one executemany instead of an ORM object per shift
+            self.db.execute(insert(models.ScheduleAssignment), rows)
+        self.db.commit()
+        logger.info(f"Stored schedule {year}-{month:02d} of employer {employer_id} ({len(rows)} shifts)")
+        return self.db.get(models.Schedule, schedule_id)
+
+    def save_cached(self, employer_id: int, request_hash: str, result: dict, state: dict,
+                    request: Optional[ScheduleRequest] = None) -> bool:
+        """
+        Stores a month served from the schedule cache, unless the database
+        already holds that very solve (same `request_hash`). Returns whether
+        it was stored.
+        """
+        stored_hash = (
+            self.db.query(models.Schedule.request_hash)
+            .filter(models.Schedule.employer_id == employer_id,
+                    models.Schedule.year == state["year"],
+                    models.Schedule.month == state["month"])
+            .scalar()
+        )
+        if stored_hash == request_hash:
+            return False
+        # the flag and the timings describe this response, not the stored solve
+        meta = {key: value for key, value in result["meta"].items() if key not in ("cached", "timings_ms")}
+        return self.save(employer_id, request_hash, dict(result, meta=meta), state, request) is not None
+
+    def stored_source(self, employer_id: int, year: int, month: int) -> Optional[str]:
+        """Who stored the month's schedule ("owner" or "batch"), None when there is none."""
+        return (
+            self.db.query(models.Schedule.source)
+            .filter(models.Schedule.employer_id == employer_id,
+                    models.Schedule.year == year,
+                    models.Schedule.month == month)
+            .scalar()
+        )
+
+    def _find(self, employer_id: int, year: int, month: int) -> Optional[models.Schedule]:
+        return (
+            self.db.query(models.Schedule)
+            .filter(models.Schedule.employer_id == employer_id,
+                    models.Schedule.year == year,
+                    models.Schedule.month == month)
+            .first()
+        )
+
+    def _assignment(self, schedule: models.Schedule, employee_ids: List[int], days: List[int]) -> List[List[int]]:
+        rows = {employee_id: [-1] * len(days) for employee_id in employee_ids}
+        day_index = {d: di for di, d in enumerate(days)}
+        stored = self.db.query(
+            models.ScheduleAssignment.employee_id,
+            models.ScheduleAssignment.day,
+            models.ScheduleAssignment.shift,
+        ).filter(models.ScheduleAssignment.schedule_id == schedule.id)
+        for employee_id, day, s in stored:
+            row = rows.get(employee_id)
+            if row is not None:
+                row[day_index[day.day]] = s
+        return [rows[employee_id] for employee_id in employee_ids]
+
+    def load_month_state(self, employer_id: int, year: int, month: int) -> Optional[dict]:
+        """The stored month in the compact form used for warm start, or None."""
+        schedule = self._find(employer_id, year, month)
+        if schedule is None:
+            return None
+        employee_ids = json.loads(schedule.employee_ids)
+        days = json.loads(schedule.days)
+        return {
+            "year": year,
+            "month": month,
+            "employee_ids": employee_ids,
+            "days": days,
+            "shifts": json.loads(schedule.shifts),
+            "assignment": self._assignment(schedule, employee_ids, days),
+        }
+
+    def load_schedule(self, employer_id: int, year: int, month: int) -> Tuple[dict, dict]:
+        """
+        The stored month in the shape returned by `/schedule/generate` (plus
+        the id, status, objective and creation time of the schedule) and its
+        compact month state.
+        """
+        schedule = self._find(employer_id, year, month)
+        if schedule is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Schedule is not found for the given month")
+
+        shifts = json.loads(schedule.shifts)
+        days = json.loads(schedule.days)
+        employee_ids = json.loads(schedule.employee_ids)
+        assignment = self._assignment(schedule, employee_ids, days)
+
+        names: Dict[int, str] = {
+            e.id: f"{e.first_name} {e.last_name}"
+            for e in self.db.query(models.Employee.id, models.Employee.first_name, models.Employee.last_name)
+            .filter(models.Employee.employer_id == employer_id)
+        }
+        # employees deleted since then are left out
+        rows = [(names[employee_id], row) for employee_id, row in zip(employee_ids, assignment) if employee_id in names]
+
+        result = {
+            "id": schedule.id,
+            "year": schedule.year,
+            "month": schedule.month,
+            "status": schedule.status,
+            "objective": schedule.objective,
+            "created_at": schedule.created_at,
+            "schedule": [
+                {
+                    "day": day,
+                    "shifts": [
+                        {"shift": sh["name"], "employees": [name for name, row in rows if row[di] == s_idx]}
+                        for s_idx, sh in enumerate(shifts)
+                    ],
+                }
+                for di, day in enumerate(days)
+            ],
+            "summary": json.loads(schedule.summary),
+            "meta": json.loads(schedule.meta),
+        }
+        state = {
+            "year": year,
+            "month": month,
+            "employee_ids": employee_ids,
+            "days": days,
+            "shifts": shifts,
+            "assignment": assignment,
+        }
+        return result, state
+
+    def load_request_templates(self) -> Dict[int, dict]:
+        """Request template of every employer's latest schedule that has one."""
+        latest = (
+            self.db.query(models.Schedule.employer_id,
+                          func.max(models.Schedule.year * 12 + models.Schedule.month).label("month_index"))
+            .filter(models.Schedule.request.isnot(None))
+            .group_by(models.Schedule.employer_id)
+            .subquery()
+        )
+        rows = (
+            self.db.query(models.Schedule.employer_id, models.Schedule.request)
+            .join(latest, (models.Schedule.employer_id == latest.c.employer_id)
+                  & (models.Schedule.year * 12 + models.Schedule.month == latest.c.month_index))
+        )
+        return {employer_id: json.loads(request) for employer_id, request in rows}
+
+    def list_schedules(self, employer_id: int) -> List[dict]:
+        schedules = (
+            self.db.query(models.Schedule.id, models.Schedule.year, models.Schedule.month,
+                          models.Schedule.status, models.Schedule.objective, models.Schedule.created_at)
+            .filter(models.Schedule.employer_id == employer_id)
+            .order_by(models.Schedule.year, models.Schedule.month)
+        )
+        return [
+            {"id": s.id, "year": s.year, "month": s.month, "status": s.status,
+             "objective": s.objective, "created_at": s.created_at}
+            for s in schedules
+        ]
+
+    def employee_shifts(self, employer_id: int, employee_id: int, date_from: date, date_to: date) -> List[dict]:
+        """Shifts worked by one employee between `date_from` and `date_to` (inclusive), across stored months."""
+        if date_from > date_to:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="date_from must not be after date_to")
+        employee = self.db.query(models.Employee).filter(models.Employee.id == employee_id).first()
+        if not employee or employee.employer_id != employer_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee is not found by the given id")
+
+        rows = (
+            self.db.query(models.ScheduleAssignment.day, models.ScheduleAssignment.shift, models.Schedule.shifts)
+            .join(models.Schedule, models.Schedule.id == models.ScheduleAssignment.schedule_id)
+            .filter(models.ScheduleAssignment.employee_id == employee_id,
+                    models.ScheduleAssignment.day >= date_from,
+                    models.ScheduleAssignment.day <= date_to,
+                    models.Schedule.employer_id == employer_id)
+            .order_by(models.ScheduleAssignment.day)
+        )
+        parsed: Dict[str, list] = {}
+        shifts = []
+        for day, s, schedule_shifts in rows:
+            # the same JSON comes back for every day of a month
+            if schedule_shifts not in parsed:
+                parsed[schedule_shifts] = json.loads(schedule_shifts)
+            sh = parsed[schedule_shifts][s]
+            shifts.append({"date": day, "shift": sh["name"], "start_hour": sh["start_hour"], "length": sh["length"]})
+        return shifts
+
+
+def store_schedule(employer_id: int, request_hash: str, result: dict, state: dict,
+                   request: Optional[ScheduleRequest] = None, source: str = "owner") -> bool:
+    """
+    `ScheduleStore.save` with its own session, for code running outside of a
+    request. Failures are raised to the caller, which records them. Returns
+    False when a batch draft was not stored over the owner's schedule.
+    """
+    db = SessionLocal()
+    try:
+        return ScheduleStore(db).save(employer_id, request_hash, result, state, request, source) is not None
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def store_cached_schedule(employer_id: int, request_hash: str, result: dict, state: dict,
+                          request: Optional[ScheduleRequest] = None) -> bool:
+    """`ScheduleStore.save_cached` with its own session, see `store_schedule`."""
+    db = SessionLocal()
+    try:
+        return ScheduleStore(db).save_cached(employer_id, request_hash, result, state, request)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -1,29 +1,42 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from models.User import User
 from schemas.auth import UserUpdate
+from core.security import create_access_token, revoke_tokens, invalidate_user
 
 class UserService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def get_user(self, user_id: int):
-        user = self.db.query(User).filter(User.id == user_id).first()
+    async def _get(self, user_id: int):
+        result = await self.db.execute(select(User).where(User.id == user_id))
+        return result.scalars().first()
+
+    async def get_user(self, user_id: int):
+        user = await self._get(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         return user
 
-    def update_user(self, user_id: int, data: UserUpdate):
-        user = self.db.query(User).filter(User.id == user_id).first()
+    async def update_user(self, user_id: int, data: UserUpdate):
+        user = await self._get(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         # Check if email is used by another user
-        email_user = self.db.query(User).filter(User.email == data.email, User.id != user_id).first()
+        result = await self.db.execute(select(User).where(User.email == data.email, User.id != user_id))
+        email_user = result.scalars().first()
         if email_user:
             raise HTTPException(status_code=400, detail="Email is already in use by another user")
+        email_changed = user.email != data.email
         user.first_name = data.first_name
         user.last_name = data.last_name
         user.email = data.email
-        self.db.commit()
-        self.db.refresh(user)
-        return user
+        # tokens carry the email, so a new one revokes the old tokens; a name-only edit keeps them
+        if email_changed:
+            revoke_tokens(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+        if email_changed:
+            invalidate_user(user.id)
+        return user, create_access_token(user)
@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import holidays
+import numpy as np
+
+# Years kept in memory per process (least recently used are dropped first)
+CALENDAR_CACHE_YEARS = 32
+FULL_TIME_HOURS_PER_DAY = 8
+
+# numpy weekmask (Mon..Sun) of every company work mode
+WEEKMASKS = {
+    "every_day": [1, 1, 1, 1, 1, 1, 1],
+    "mon_fri": [1, 1, 1, 1, 1, 0, 0],
+    "mon_sat": [1, 1, 1, 1, 1, 1, 0],
+}
+
+
+class YearCalendar:
+    """
+    Working-day masks and full-time hours of one calendar year.
+
+    `masks[(mode, work_holidays)]` and `daily_hours` are arrays over the days
+    of the year; `month_starts[m - 1]:month_starts[m]` is the slice of month `m`.
+    """
+
+    def __init__(self, year: int, masks: Dict[Tuple[str, bool], np.ndarray], month_starts: np.ndarray,
+                 daily_hours: np.ndarray, full_time_hours: np.ndarray):
+        self.year = year
+        self.masks = masks
+        self.month_starts = month_starts
+        self.daily_hours = daily_hours
+        self.full_time_hours = full_time_hours
+
+    def month_mask(self, month: int, company_work_mode: str, work_holidays: bool) -> np.ndarray:
+        # unknown modes fall back to mon_sat, as ScheduleService always did
+        mode = company_work_mode if company_work_mode in WEEKMASKS else "mon_sat"
+        return self.masks[(mode, work_holidays)][self.month_starts[month - 1]:self.month_starts[month]]
+
+
+def build_years(first_year: int, last_year: int) -> List[YearCalendar]:
+    """
+    Computes the calendars of `first_year..last_year` in one vectorized pass.
+
+    Semantics (kept from the original day-by-day loops):
+    - With work on holidays, a day is working when its weekday is in the mode.
+    - Without it, holidays falling Mon-Sat are days off as well. A Sunday
+      holiday stays a working day in "every_day" mode.
+    - Full-time hours: 8 h for every Mon-Fri day, minus 8 h for every
+      holiday falling Mon-Sat.
+    """
+    start = np.datetime64(f"{first_year:04d}-01-01")
+    end = np.datetime64(f"{last_year + 1:04d}-01-01")
+    dates = np.arange(start, end, dtype="datetime64[D]")
+
+    # 0 = Monday, 1970-01-01 was a Thursday
+    weekday = (dates.astype(np.int64) + 3) % 7
+    pl_holidays = holidays.Poland(years=range(first_year, last_year + 1))
+    holiday_dates = np.array(sorted(pl_holidays.keys()), dtype="datetime64[D]")
+    holiday_mask = np.isin(dates, holiday_dates)
+    # only holidays falling Mon-Sat affect working days and hours
+    day_off_holidays = holiday_dates[(holiday_dates.astype(np.int64) + 3) % 7 < 6]
+
+    masks = {}
+    for mode, weekmask in WEEKMASKS.items():
+        masks[(mode, True)] = np.is_busday(dates, weekmask=weekmask)
+        masks[(mode, False)] = np.is_busday(dates, weekmask=weekmask, holidays=day_off_holidays)
+
+    daily_hours = FULL_TIME_HOURS_PER_DAY * ((weekday < 5).astype(np.int64) - (holiday_mask & (weekday < 6)))
+
+    # first day of every month of the range, plus the end
+    month_bounds = np.arange(f"{first_year:04d}-01", f"{last_year + 1:04d}-02", dtype="datetime64[M]")
+    month_offsets = (month_bounds.astype("datetime64[D]") - start).astype(np.int64)
+    monthly_hours = np.add.reduceat(daily_hours, month_offsets[:-1])
+
+    calendars = []
+    for i, year in enumerate(range(first_year, last_year + 1)):
+        bounds = month_offsets[12 * i:12 * i + 13]
+        year_slice = slice(bounds[0], bounds[-1])
+        year_masks = {key: mask[year_slice] for key, mask in masks.items()}
+        for mask in year_masks.values():
+            mask.flags.writeable = False
+        month_starts = bounds - bounds[0]
+        year_daily_hours = daily_hours[year_slice]
+        year_hours = monthly_hours[12 * i:12 * i + 12]
+        year_daily_hours.flags.writeable = False
+        year_hours.flags.writeable = False
+        calendars.append(YearCalendar(year, year_masks, month_starts, year_daily_hours, year_hours))
+    return calendars
+
+
+class WorkingCalendar:
+    """
+    Per-process, bounded LRU cache of `YearCalendar`s.
+
+    Building a year is cheap but not free (holiday rules, numpy calendars),
+    and every schedule request used to rebuild it day by day. Batch and
+    multi-month generation can warm the cache for a whole range of years
+    in one call with `precompute`.
+    """
+
+    def __init__(self, max_years: int = CALENDAR_CACHE_YEARS):
+        self.max_years = max_years
+        self._years: "OrderedDict[int, YearCalendar]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, calendars: List[YearCalendar]) -> None:
+        with self._lock:
+            for cal in calendars:
+                self._years[cal.year] = cal
+                self._years.move_to_end(cal.year)
+            while len(self._years) > self.max_years:
+                self._years.popitem(last=False)
+
+    def year(self, year: int) -> YearCalendar:
+        with self._lock:
+            cal = self._years.get(year)
+            if cal is not None:
+                self._years.move_to_end(year)
+                return cal
+        cal = build_years(year, year)[0]
+        self._store([cal])
+        return cal
+
+    def precompute(self, first_year: int, last_year: int) -> None:
+        """Builds and caches all years of `first_year..last_year` (e.g. a decade) at once."""
+        self._store(build_years(first_year, last_year)[-self.max_years:])
+
+    def working_day_mask(self, year: int, month: int, company_work_mode: str, work_holidays: bool) -> np.ndarray:
+        """Read-only boolean array over the days of the month (index 0 = day 1)."""
+        return self.year(year).month_mask(month, company_work_mode, work_holidays)
+
+    def days_list(self, year: int, month: int, company_work_mode: str, work_holidays: bool) -> List[int]:
+        """0-based indexes of the working days of the month."""
+        return np.flatnonzero(self.working_day_mask(year, month, company_work_mode, work_holidays)).tolist()
+
+    def full_time_hours(self, year: int, month: int, first_day: Optional[int] = None,
+                        last_day: Optional[int] = None) -> int:
+        """Full-time hours of the month, or of its days `first_day..last_day` (1-based, inclusive)."""
+        cal = self.year(year)
+        if first_day is None and last_day is None:
+            return int(cal.full_time_hours[month - 1])
+        start = cal.month_starts[month - 1]
+        end = cal.month_starts[month]
+        first = start + (first_day or 1) - 1
+        last = end if last_day is None else min(end, start + last_day)
+        return int(cal.daily_hours[first:last].sum())
+
+
+working_calendar = WorkingCalendar()
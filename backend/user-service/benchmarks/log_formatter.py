@@ -0,0 +1,97 @@
+"""
+Benchmark of the JSON log formatter.
+
+Formats the records the request middleware emits (message plus request
+id, method, endpoint, status and duration) with the original
+JSONFormatter and with `core.logging_config.JSONFormatter`, which uses
+orjson when it is installed.
+
+Usage (from backend/user-service):
+    python benchmarks/log_formatter.py
+    python benchmarks/log_formatter.py --records 500000
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from core import logging_config  # noqa: E402
+
+
+class LegacyJSONFormatter(logging.Formatter):
+    """The original JSONFormatter, kept here for comparison."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_data: Dict[str, Any] = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        if hasattr(record, "request_id"):
+            log_data["request_id"] = record.request_id
+        if hasattr(record, "user_id"):
+            log_data["user_id"] = record.user_id
+        if hasattr(record, "endpoint"):
+            log_data["endpoint"] = record.endpoint
+        if hasattr(record, "method"):
+            log_data["method"] = record.method
+        if hasattr(record, "status_code"):
+            log_data["status_code"] = record.status_code
+        if hasattr(record, "duration"):
+            log_data["duration_ms"] = record.duration
+        if record.exc_info:
+            log_data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(log_data, ensure_ascii=False)
+
+
+def make_record(i: int) -> logging.LogRecord:
+    record = logging.LogRecord("user_service.middleware", logging.INFO, __file__, 100,
+                               "Request completed: GET /employee - Status: 200", None, None, func="__call__")
+    record.request_id = "0d5c8a52-7f1e-4d0c-9a55-3b2a9f6c1e{:02d}".format(i % 100)
+    record.method = "GET"
+    record.endpoint = "/employee"
+    record.status_code = 200
+    record.duration = 3.21
+    return record
+
+
+def measure(formatter: logging.Formatter, records: int) -> float:
+    batch = [make_record(i) for i in range(1000)]
+    started = time.perf_counter()
+    for _ in range(records // len(batch)):
+        for record in batch:
+            formatter.format(record)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per formatter, the fastest is reported")
+    args = parser.parse_args()
+
+    formatters = {
+        "legacy": LegacyJSONFormatter(),
+        "current": logging_config.JSONFormatter(),
+    }
+    print(f"orjson: {'yes' if logging_config.orjson is not None else 'no'}")
+    header = f"{'formatter':<10} {'us/record':>10} {'records/s':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, formatter in formatters.items():
+        seconds = min(measure(formatter, args.records) for _ in range(args.repeat))
+        print(f"{name:<10} {seconds / args.records * 1e6:>10.2f} {args.records / seconds:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Micro-benchmark of the per-request overhead of the HTTP middleware.
+
+Compares a bare FastAPI app with the two `BaseHTTPMiddleware` classes the
+service used originally and with the pure ASGI `LoggingMiddleware`. The
+app is called directly through ASGI (no server, no sockets), so the
+numbers are the cost of the middleware stack plus one trivial endpoint.
+Request logs are dropped unless --log is given, in which case they are
+formatted as JSON (see `JSONFormatter`) and written to os.devnull;
+--sample-rate then sets the share of requests that are logged.
+
+Usage (from backend/user-service):
+    python benchmarks/middleware.py
+    python benchmarks/middleware.py --requests 50000 --repeat 5 --log
+    python benchmarks/middleware.py --log --sample-rate 0.01
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from fastapi import FastAPI, Request, Response  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from core.logging_config import JSONFormatter  # noqa: E402
+from core.middleware import LoggingMiddleware, RequestIdFilter  # noqa: E402
+
+logger = logging.getLogger("user_service.middleware")
+
+
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    """The original LoggingMiddleware, kept here for comparison."""
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        request_id = str(uuid.uuid4())
+        request.state.request_id = request_id
+        method = request.method
+        url = str(request.url)
+        client_host = request.client.host if request.client else "unknown"
+        start_time = time.time()
+        logger.info(f"Request started: {method} {url}",
+                    extra={"request_id": request_id, "method": method, "endpoint": url, "client_ip": client_host})
+        response = await call_next(request)
+        duration = (time.time() - start_time) * 1000
+        logger.info(f"Request completed: {method} {url} - Status: {response.status_code}",
+                    extra={"request_id": request_id, "method": method, "endpoint": url,
+                           "status_code": response.status_code, "duration": round(duration, 2)})
+        response.headers["X-Request-ID"] = request_id
+        return response
+
+
+class LegacyRequestContextMiddleware(BaseHTTPMiddleware):
+    """The original (no-op) RequestContextMiddleware."""
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        return await call_next(request)
+
+
+def make_app(stack: str, sample_rate: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if stack == "legacy":
+        app.add_middleware(LegacyLoggingMiddleware)
+        app.add_middleware(LegacyRequestContextMiddleware)
+    elif stack == "asgi":
+        app.add_middleware(LoggingMiddleware, sample_rate=sample_rate)
+    return app
+
+
+STACKS = ["none", "legacy", "asgi"]
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    """Seconds for `requests` sequential GET /ping calls."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/ping", "raw_path": b"/ping", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"accept", b"*/*")], "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        # the middleware writes into scope["state"]
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="requests per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stack, the fastest is reported")
+    parser.add_argument("--log", action="store_true", help="format and write the request logs")
+    parser.add_argument("--sample-rate", type=float, default=1.0, help="share of requests logged by the asgi stack")
+    args = parser.parse_args()
+
+    service_logger = logging.getLogger("user_service")
+    service_logger.propagate = False
+    if args.log:
+        service_logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler(open(os.devnull, "w"))
+        handler.setFormatter(JSONFormatter())
+        handler.addFilter(RequestIdFilter())
+        service_logger.addHandler(handler)
+    else:
+        service_logger.setLevel(logging.WARNING)
+
+    apps = {stack: make_app(stack, args.sample_rate) for stack in STACKS}
+    for app in apps.values():
+        asyncio.run(run(app, 200))  # warm-up: builds the middleware stack
+
+    timings = {stack: min(asyncio.run(run(apps[stack], args.requests)) for _ in range(args.repeat))
+               for stack in STACKS}
+    base = timings["none"] / args.requests * 1e6
+
+    header = f"{'stack':<8} {'us/request':>11} {'overhead us':>12} {'requests/s':>11}"
+    print(header)
+    print("-" * len(header))
+    for stack in STACKS:
+        per_request = timings[stack] / args.requests * 1e6
+        print(f"{stack:<8} {per_request:>11.1f} {per_request - base:>12.1f} {args.requests / timings[stack]:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Benchmark of CP-SAT model construction for ScheduleService.
+
+Compares the dict + Python `sum()` builder that `generate_schedule` used
+originally with `ScheduleModelBuilder` (dense arrays + LinearExpr), and with
+the builder's earlier sliding-window encoding of `max_consecutive_days`.
+Every measurement runs in a fresh process so that peak RSS is not shared
+between runs. With --presolve the size of the presolved model is reported too.
+
+Usage (from backend/user-service):
+    python benchmarks/model_build.py
+    python benchmarks/model_build.py --employees 50 300 --shifts 4 --repeat 3
+    python benchmarks/model_build.py --employees 300 --presolve
+"""
+import argparse
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from ortools.sat.python import cp_model  # noqa: E402
+
+from schemas.schedule import Employee, Rules, ScheduleRequest, ShiftDefinition  # noqa: E402
+from services.schedule_model import ScheduleModelBuilder, compute_rest_hours  # noqa: E402
+
+SHIFT_STARTS = [6, 14, 22, 10, 18, 2]
+
+
+def make_case(n_employees: int, n_shifts: int, n_days: int):
+    shifts = [
+        ShiftDefinition(name=f"S{s}", start_hour=SHIFT_STARTS[s % len(SHIFT_STARTS)], length=8,
+                        required=max(1, n_employees // (2 * n_shifts)))
+        for s in range(n_shifts)
+    ]
+    request = ScheduleRequest(
+        year=2025, month=3, shifts=shifts, rules=Rules(min_rest_hours=11, max_consecutive_days=5),
+        holidays_mode=True, company_work_mode="every_day", preferences=[],
+    )
+    fractions = [1.0, 0.75, 0.5]
+    employees = [
+        Employee(id=i + 1, first_name="E", last_name=str(i), employment_fraction=fractions[i % len(fractions)])
+        for i in range(n_employees)
+    ]
+    return request, employees, list(range(n_days))
+
+
+def legacy_build(request, employees, days_list, full_time_hours):
+    """The original dict-of-tuples builder from ScheduleService.generate_schedule."""
+    shifts = request.shifts
+    rules = request.rules
+    model = cp_model.CpModel()
+    E, S, D = len(employees), len(shifts), len(days_list)
+
+    x = {}
+    for e in range(E):
+        for di in range(D):
+            for s in range(S):
+                x[(e, di, s)] = model.NewBoolVar(f"x_e{e}_d{di}_s{s}")
+
+    for di in range(D):
+        for s_idx, shift in enumerate(shifts):
+            model.Add(sum(x[(e, di, s_idx)] for e in range(E)) == shift.required)
+
+    for e in range(E):
+        for di in range(D):
+            model.Add(sum(x[(e, di, s)] for s in range(S)) <= 1)
+
+    for e in range(E):
+        for di in range(D - 1):
+            for s1_idx, sh1 in enumerate(shifts):
+                for s2_idx, sh2 in enumerate(shifts):
+                    rest = compute_rest_hours(sh1.start_hour, sh1.length, sh2.start_hour)
+                    if rest < rules.min_rest_hours:
+                        model.Add(x[(e, di, s1_idx)] + x[(e, di + 1, s2_idx)] <= 1)
+
+    if rules.max_consecutive_days:
+        M = rules.max_consecutive_days
+        if M < D:
+            for e in range(E):
+                for start in range(0, D - (M + 1) + 1):
+                    window_terms = []
+                    for dd in range(start, start + M + 1):
+                        window_terms.append(sum(x[(e, dd, s)] for s in range(S)))
+                    model.Add(sum(window_terms) <= M)
+
+    max_hours_per_employee = D * max((int(sh.length) for sh in shifts), default=0)
+    deviations_hours = []
+    for e_idx, emp in enumerate(employees):
+        total_hours_expr = sum(int(sh.length) * x[(e_idx, di, s_idx)]
+                               for di in range(D)
+                               for s_idx, sh in enumerate(shifts))
+        target_hours = int(round(emp.employment_fraction * full_time_hours))
+        dev_h = model.NewIntVar(0, max_hours_per_employee, f"dev_hours_e{e_idx}")
+        model.Add(total_hours_expr - target_hours <= dev_h)
+        model.Add(target_hours - total_hours_expr <= dev_h)
+        deviations_hours.append(dev_h)
+
+    model.Minimize(2 * sum(deviations_hours))
+    return model
+
+
+def array_build(request, employees, days_list, full_time_hours):
+    return ScheduleModelBuilder(request, employees, days_list, full_time_hours).build().model
+
+
+class WindowModelBuilder(ScheduleModelBuilder):
+    """`ScheduleModelBuilder` with the sliding-window encoding of `max_consecutive_days` it used before."""
+
+    def add_max_consecutive_days(self) -> None:
+        M = self.rules.max_consecutive_days
+        if not M or M >= self.D:
+            return
+        for e in range(self.E):
+            for start in range(0, self.D - (M + 1) + 1):
+                window = self.worked[e, start:start + M + 1].tolist()
+                self.model.Add(cp_model.LinearExpr.Sum(window) <= M)
+
+
+def window_build(request, employees, days_list, full_time_hours):
+    return WindowModelBuilder(request, employees, days_list, full_time_hours).build().model
+
+
+BUILDERS = {"legacy": legacy_build, "windows": window_build, "array": array_build}
+
+
+def measure(builder: str, n_employees: int, n_shifts: int, n_days: int, presolve: bool = False) -> dict:
+    request, employees, days_list = make_case(n_employees, n_shifts, n_days)
+    # ru_maxrss is in KiB on Linux
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    model = BUILDERS[builder](request, employees, days_list, 168)
+    build_seconds = time.perf_counter() - started
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    proto = model.Proto()
+
+    presolve_seconds = None
+    presolved = {}
+    if presolve:
+        solver = cp_model.CpSolver()
+        solver.parameters.stop_after_presolve = True
+        solver.parameters.num_workers = 1
+        # the presolved model's size is only reported in the search log
+        solver.parameters.log_search_progress = True
+        solver.parameters.log_to_stdout = False
+        log = []
+        solver.log_callback = log.append
+        started = time.perf_counter()
+        solver.Solve(model)
+        presolve_seconds = time.perf_counter() - started
+        for name, value in re.findall(r"PresolvedNum(Variables|Constraints|Terms): (\d+)", "\n".join(log)):
+            presolved[name.lower()] = int(value)
+
+    return {
+        "builder": builder,
+        "employees": n_employees,
+        "shifts": n_shifts,
+        "days": n_days,
+        "build_seconds": build_seconds,
+        "peak_rss_mb": rss_peak / 1024,
+        "build_rss_mb": (rss_peak - rss_before) / 1024,
+        "variables": len(proto.variables),
+        "constraints": len(proto.constraints),
+        "terms": sum(len(c.linear.vars) + len(c.at_most_one.literals) + len(c.exactly_one.literals)
+                     + len(c.bool_or.literals) for c in proto.constraints),
+        "presolve_seconds": presolve_seconds,
+        "presolved_variables": presolved.get("variables"),
+        "presolved_constraints": presolved.get("constraints"),
+        "presolved_terms": presolved.get("terms"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, nargs="+", default=[50, 100, 300])
+    parser.add_argument("--shifts", type=int, nargs="+", default=[4])
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is reported")
+    parser.add_argument("--presolve", action="store_true", help="also time CP-SAT presolve of the built model")
+    args = parser.parse_args()
+
+    header = (f"{'builder':<8} {'E':>5} {'S':>3} {'D':>3} {'build s':>9} {'+RSS MB':>8} {'RSS MB':>8} {'vars':>8} "
+              f"{'cons':>8} {'terms':>9} {'presolve s':>10} {'pre vars':>9} {'pre cons':>9} {'pre terms':>10}")
+    print(header)
+    print("-" * len(header))
+    for n_shifts in args.shifts:
+        for n_employees in args.employees:
+            for builder in BUILDERS:
+                runs = []
+                for _ in range(args.repeat):
+                    with ProcessPoolExecutor(max_workers=1) as pool:
+                        runs.append(pool.submit(measure, builder, n_employees, n_shifts, args.days, args.presolve).result())
+                r = min(runs, key=lambda run: run["build_seconds"])
+                print(
+                    f"{r['builder']:<8} {r['employees']:>5} {r['shifts']:>3} {r['days']:>3} "
+                    f"{r['build_seconds']:>9.3f} {r['build_rss_mb']:>8.1f} {r['peak_rss_mb']:>8.1f} "
+                    f"{r['variables']:>8} {r['constraints']:>8} {r['terms']:>9} "
+                    f"{r['presolve_seconds'] if r['presolve_seconds'] is not None else float('nan'):>10.2f} "
+                    f"{r['presolved_variables'] or '-':>9} {r['presolved_constraints'] or '-':>9} "
+                    f"{r['presolved_terms'] or '-':>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark of multi-month plans (SchedulePlanService.generate_plan).
+
+Seeds one synthetic employer into a local SQLite database, solves every
+month of the plan on its own (one after another, the baseline), then the
+whole plan through the schedule job pool, with the schedule cache
+disabled. A plan should take about as long as its slowest month plus the
+reconciliation, as long as the pool has a worker (and a core) per month.
+
+Usage (from backend/user-service):
+    python benchmarks/schedule_plan.py
+    python benchmarks/schedule_plan.py --months 12 --employees 50 --shifts 3 --time-limit 20 --workers 12
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from schedule_suite import APP_DIR, environment, make_request, seed_employer  # noqa: F401  (APP_DIR on sys.path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--employees", type=int, default=30)
+    parser.add_argument("--shifts", type=int, default=2)
+    parser.add_argument("--mode", choices=["every_day", "mon_fri", "mon_sat"], default="every_day")
+    parser.add_argument("--year", type=int, default=2025)
+    parser.add_argument("--time-limit", type=float, default=10.0, help="solver time limit per month")
+    parser.add_argument("--workers", type=int, help="job pool processes, defaults to one per month")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="results file (JSON), defaults to benchmarks/results/<time>.json")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory(prefix="schedule-plan-")
+    # read by core.settings in this process and the job pool's processes
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir.name}/plan.sqlite3"
+    os.environ.setdefault("CORS_ORIGIN", "http://localhost")
+    os.environ["SCHEDULE_CACHE_ENABLED"] = "false"
+    os.environ["SCHEDULE_JOB_WORKERS"] = str(args.workers or args.months)
+    os.environ["SCHEDULE_JOB_MAX_PENDING"] = str(2 * args.months)
+
+    import models
+    from db import Base, SessionLocal, engine
+    from schemas.schedule import SchedulePlanRequest
+    from services.schedule_jobs import schedule_jobs
+    from services.schedule_plan import SchedulePlanService, plan_segments, segment_request
+    from services.schedule_service import ScheduleService
+
+    Base.metadata.create_all(bind=engine)
+    case = {"employees": args.employees, "shifts": args.shifts, "mode": args.mode, "preferences": 0.0}
+    owner_id = seed_employer(case, args.seed)
+
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.id == owner_id).one()
+        service = ScheduleService(db)
+        employees = service.load_roster(user)
+        month = make_request(case, args.year, 1, [e.id for e in employees], args.seed)
+        plan = SchedulePlanRequest(
+            start_year=args.year,
+            start_month=1,
+            months=args.months,
+            shifts=month["shifts"],
+            rules=month["rules"],
+            holidays_mode=month["holidays_mode"],
+            company_work_mode=month["company_work_mode"],
+            warm_start=False,
+            solver={"time_limit_seconds": args.time_limit},
+        )
+
+        print(f"{'month':<8} {'alone s':>8}")
+        months = []
+        for segment in plan_segments(plan):
+            started = time.perf_counter()
+            service.solve_schedule(segment_request(plan, segment), employees, None, segment.day_range)
+            months.append({"month": segment.label, "seconds": time.perf_counter() - started})
+            print(f"{segment.label:<8} {months[-1]['seconds']:>8.2f}")
+
+        started = time.perf_counter()
+        response = SchedulePlanService(service).generate_plan(plan, user)
+        plan_seconds = time.perf_counter() - started
+    finally:
+        db.close()
+        schedule_jobs.shutdown()
+    engine.dispose()
+    tmp_dir.cleanup()
+
+    meta = response["meta"]
+    slowest = max(m["seconds"] for m in months)
+    total = sum(m["seconds"] for m in months)
+    result = {
+        "months": months,
+        "slowest_month_seconds": slowest,
+        "sequential_seconds": total,
+        "plan_seconds": plan_seconds,
+        "plan_to_slowest": plan_seconds / slowest,
+        "reconcile_seconds": meta["reconcile_seconds"],
+        "repairs": meta["repairs"],
+        "processes": meta["processes"],
+    }
+    print(f"\nslowest month {slowest:.2f}s, months one after another {total:.2f}s")
+    print(f"plan {plan_seconds:.2f}s ({result['plan_to_slowest']:.2f}x the slowest month) "
+          f"on {meta['processes']} processes / {os.cpu_count()} cores, "
+          f"reconciled in {meta['reconcile_seconds']:.2f}s ({len(meta['repairs'])} months)")
+
+    output = args.output or Path(__file__).parent / "results" / f"plan-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "environment": environment(),
+        "settings": {**case, "months": args.months, "year": args.year,
+                     "time_limit_seconds": args.time_limit, "seed": args.seed},
+        "results": result,
+    }, indent=2))
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
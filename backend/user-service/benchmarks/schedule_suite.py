@@ -0,0 +1,321 @@
+"""
+Synthetic benchmark suite for ScheduleService.generate_schedule.
+
+Seeds synthetic employers into a local SQLite database and runs the same
+steps as `generate_schedule` (roster load, model build, solve, formatting),
+with the schedule cache disabled. Every case runs in a fresh process, so
+peak RSS is per case.
+
+Recorded per case: load / build / solve / format time, time to the first
+solution, status, objective, best bound, relative gap and peak RSS.
+Results are written as JSON (see --output). They can be compared with an
+earlier run; the exit code is 1 when a case got slower than --threshold
+allows or lost its solution.
+
+Usage (from backend/user-service):
+    python benchmarks/schedule_suite.py --suite quick
+    python benchmarks/schedule_suite.py --suite full --time-limit 120 --output results/v2.json
+    python benchmarks/schedule_suite.py --employees 300 --shifts 3 --modes every_day --compare results/v1.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import product
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+sys.path.insert(0, str(APP_DIR))
+
+SHIFT_STARTS = [6, 14, 22, 10, 18, 2]
+FRACTIONS = [1.0, 1.0, 0.75, 0.5, 0.25]
+WORK_MODES = ["every_day", "mon_fri", "mon_sat"]
+
+SUITES = {
+    "quick": {"employees": [10, 50], "shifts": [1, 3], "modes": WORK_MODES, "preferences": [0.0, 0.05]},
+    "standard": {"employees": [10, 100, 500], "shifts": [1, 3, 6], "modes": WORK_MODES, "preferences": [0.0, 0.05]},
+    "full": {"employees": [10, 50, 200, 500, 1000, 2000], "shifts": [1, 2, 3, 6], "modes": WORK_MODES,
+             "preferences": [0.0, 0.02, 0.1]},
+}
+
+# compared between runs, lower is better
+COMPARED_TIMES = ["build_seconds", "solve_seconds", "first_solution_seconds"]
+
+
+def case_id(case: dict) -> str:
+    return f"{case['employees']}e-{case['shifts']}s-{case['mode']}-p{case['preferences']}"
+
+
+def make_request(case: dict, year: int, month: int, employee_ids: list, seed: int) -> dict:
+    """Synthetic request; coverage is set so that the roster can meet it."""
+    rng = random.Random(seed)
+    n_employees, n_shifts = case["employees"], case["shifts"]
+    shifts = [
+        {"name": f"S{s}", "start_hour": SHIFT_STARTS[s % len(SHIFT_STARTS)], "length": 8,
+         "required": max(1, n_employees // (2 * n_shifts))}
+        for s in range(n_shifts)
+    ]
+    preferences = []
+    if case["preferences"]:
+        for employee_id in employee_ids:
+            for day in range(1, 29):
+                if rng.random() < case["preferences"]:
+                    preferences.append({"employee_id": employee_id, "day": day, "priority": rng.randint(10, 100)})
+    return {
+        "year": year,
+        "month": month,
+        "shifts": shifts,
+        "rules": {"min_rest_hours": 11, "max_consecutive_days": 5},
+        "holidays_mode": False,
+        "company_work_mode": case["mode"],
+        "preferences": preferences,
+        "warm_start": False,
+    }
+
+
+def seed_employer(case: dict, seed: int) -> int:
+    """Creates an owner, an employer and its employees. Returns the owner's id."""
+    import models
+    from db import SessionLocal
+
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        key = f"{case_id(case)}-{seed}"
+        owner = models.User(email=f"owner-{key}@bench.local", first_name="Bench", last_name="Owner",
+                            password="-", role="owner")
+        db.add(owner)
+        db.flush()
+        employer = models.Employer(name=f"Bench {key}", owner_id=owner.id)
+        db.add(employer)
+        db.flush()
+        owner.employer_id = employer.id
+        db.add_all([
+            models.Employee(first_name="Employee", last_name=f"No{i}", employer_id=employer.id,
+                            employment_fraction=rng.choice(FRACTIONS))
+            for i in range(case["employees"])
+        ])
+        db.commit()
+        return owner.id
+    finally:
+        db.close()
+
+
+def run_case(case: dict, owner_id: int, year: int, month: int, time_limit: float, seed: int) -> dict:
+    """Runs in a fresh process."""
+    import models
+    from db import SessionLocal
+    from ortools.sat.python import cp_model
+    from schemas.schedule import ScheduleRequest
+    from services.schedule_service import ScheduleService, solve_slots
+
+    class FirstSolution(cp_model.CpSolverSolutionCallback):
+        def __init__(self, started: float):
+            super().__init__()
+            self.started = started
+            self.seconds = None
+            self.solutions = 0
+
+        def on_solution_callback(self):
+            self.solutions += 1
+            if self.seconds is None:
+                self.seconds = time.perf_counter() - self.started
+
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.id == owner_id).one()
+        service = ScheduleService(db)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        started = time.perf_counter()
+        employees = service.load_roster(user)
+        load_seconds = time.perf_counter() - started
+
+        request = ScheduleRequest.model_validate(
+            make_request(case, year, month, [e.id for e in employees], seed)
+            | {"solver": {"time_limit_seconds": time_limit}}
+        )
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctx = service.build_model(request, employees)
+        build_seconds = time.perf_counter() - started
+
+        with solve_slots.running():
+            solver = service.create_solver(request.solver)
+            started = time.perf_counter()
+            callback = FirstSolution(started)
+            result = solver.Solve(ctx.model, callback)
+            solve_seconds = time.perf_counter() - started
+
+        solved = result in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+        format_seconds = None
+        objective = best_bound = gap = None
+        if solved:
+            started = time.perf_counter()
+            service.format_solution(ctx, solver.ResponseProto().solution)
+            format_seconds = time.perf_counter() - started
+            objective = solver.ObjectiveValue()
+            best_bound = solver.BestObjectiveBound()
+            gap = abs(objective - best_bound) / max(1.0, abs(objective))
+
+        # ru_maxrss is in KiB on Linux
+        rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        proto = ctx.model.Proto()
+        return {
+            "case": case_id(case),
+            **case,
+            "variables": len(proto.variables),
+            "constraints": len(proto.constraints),
+            "preference_count": len(request.preferences),
+            "workers": solver.parameters.num_workers,
+            "time_limit_seconds": solver.parameters.max_time_in_seconds,
+            "status": solver.StatusName(result),
+            "load_seconds": load_seconds,
+            "build_seconds": build_seconds,
+            "solve_seconds": solve_seconds,
+            "first_solution_seconds": callback.seconds,
+            "format_seconds": format_seconds,
+            "solutions": callback.solutions,
+            "objective": objective,
+            "best_bound": best_bound,
+            "gap": gap,
+            "peak_rss_mb": rss_peak / 1024,
+            "run_rss_mb": (rss_peak - rss_before) / 1024,
+        }
+    finally:
+        db.close()
+
+
+def environment() -> dict:
+    from ortools import __version__ as ortools_version
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=APP_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "ortools": ortools_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results: list, baseline_path: Path, threshold: float) -> list:
+    """Returns human readable regressions against an earlier results file."""
+    baseline = {r["case"]: r for r in json.loads(baseline_path.read_text())["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get(r["case"])
+        if old is None:
+            continue
+        if old["objective"] is not None and r["objective"] is None:
+            regressions.append(f"{r['case']}: no solution ({r['status']}), was {old['status']}")
+            continue
+        for field in COMPARED_TIMES:
+            if old[field] is None or r[field] is None:
+                continue
+            # ignore noise on cases that take a few milliseconds
+            if r[field] > max(old[field] * (1 + threshold), old[field] + 0.05):
+                regressions.append(f"{r['case']}: {field} {old[field]:.3f}s -> {r[field]:.3f}s")
+        if old["gap"] is not None and r["gap"] is not None and r["gap"] > old["gap"] + 0.01:
+            regressions.append(f"{r['case']}: gap {old['gap']:.4f} -> {r['gap']:.4f}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--employees", type=int, nargs="+", help="overrides the suite")
+    parser.add_argument("--shifts", type=int, nargs="+", help="overrides the suite")
+    parser.add_argument("--modes", choices=WORK_MODES, nargs="+", help="overrides the suite")
+    parser.add_argument("--preferences", type=float, nargs="+",
+                        help="share of employee-days with a day-off request, overrides the suite")
+    parser.add_argument("--year", type=int, default=2025)
+    parser.add_argument("--month", type=int, default=3)
+    parser.add_argument("--time-limit", type=float, default=60.0, help="solver time limit per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", help="SQLAlchemy URL, defaults to a temporary SQLite file")
+    parser.add_argument("--output", type=Path, help="results file (JSON), defaults to benchmarks/results/<time>.json")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before a case is reported")
+    args = parser.parse_args()
+
+    suite = SUITES[args.suite]
+    cases = [
+        {"employees": e, "shifts": s, "mode": m, "preferences": p}
+        for e, s, m, p in product(
+            args.employees or suite["employees"],
+            args.shifts or suite["shifts"],
+            args.modes or suite["modes"],
+            args.preferences if args.preferences is not None else suite["preferences"],
+        )
+    ]
+
+    tmp_dir = tempfile.TemporaryDirectory(prefix="schedule-suite-")
+    # read by core.settings in this process and the spawned case processes
+    os.environ["DATABASE_URL"] = args.database or f"sqlite:///{tmp_dir.name}/suite.sqlite3"
+    os.environ.setdefault("CORS_ORIGIN", "http://localhost")
+    os.environ["SCHEDULE_CACHE_ENABLED"] = "false"
+
+    from db import Base, engine
+    import models  # noqa: F401  (registers the tables)
+
+    Base.metadata.create_all(bind=engine)
+    owners = [seed_employer(case, args.seed) for case in cases]
+    engine.dispose()
+
+    header = f"{'case':<28} {'vars':>8} {'status':<9} {'build s':>8} {'first s':>8} {'solve s':>8} {'objective':>10} {'gap':>7} {'RSS MB':>7}"
+    print(header)
+    print("-" * len(header))
+    results = []
+    for case, owner_id in zip(cases, owners):
+        # spawn: every case starts from an empty process (peak RSS, no inherited DB connections)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            r = pool.submit(run_case, case, owner_id, args.year, args.month, args.time_limit, args.seed).result()
+        results.append(r)
+        print(
+            f"{r['case']:<28} {r['variables']:>8} {r['status']:<9} {r['build_seconds']:>8.2f} "
+            f"{r['first_solution_seconds'] if r['first_solution_seconds'] is not None else float('nan'):>8.2f} "
+            f"{r['solve_seconds']:>8.2f} {r['objective'] if r['objective'] is not None else float('nan'):>10.0f} "
+            f"{r['gap'] if r['gap'] is not None else float('nan'):>7.4f} {r['peak_rss_mb']:>7.0f}"
+        )
+    tmp_dir.cleanup()
+
+    output = args.output or Path(__file__).parent / "results" / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "environment": environment(),
+        "settings": {"suite": args.suite, "year": args.year, "month": args.month,
+                     "time_limit_seconds": args.time_limit, "seed": args.seed},
+        "results": results,
+    }, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -106,6 +106,10 @@ export default function ProfilePage() {
       }
 
       const data = await response.json();
+      // Zmiana emaila unieważnia poprzedni token
+      if (data.access_token) {
+        localStorage.setItem('token', data.access_token);
+      }
       setSuccess('Profile updated successfully!');
       setUserData(data);
       setIsEditing(false);